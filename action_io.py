@@ -0,0 +1,197 @@
+"""Streaming export and bulk import of the user_actions log.
+
+Exports read through a streaming cursor (server-side on Postgres) in
+fixed-size partitions and are emitted as NDJSON or CSV text chunks, so
+memory stays flat however many rows are exported. Imports parse the same
+formats lazily and load them with COPY on Postgres or batched executemany
+elsewhere; replay_water_levels() then recomputes each affected user's
+clamped level from the full log. level_drift() runs the same replay for
+every user and reports where users.water_level disagrees with it.
+
+Everything here works on Core tables and connections so it can run from
+the Flask CLI, a request, or a standalone script.
+"""
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+
+FIELDS = ("id", "user_id", "action_type", "action_name", "water_amount", "percentage_change", "timestamp")
+IMPORT_FIELDS = FIELDS[1:]  # ids are assigned by the target database
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+START_LEVEL = 50  # users.water_level default
+BATCH_SIZE = 5000
+
+
+def _iso(timestamp):
+    # SQLite hands back naive datetimes; everything is stored in UTC
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.isoformat()
+
+
+def iter_actions(conn, table, user_id=None, batch_size=BATCH_SIZE):
+    """Yield lists of action rows as tuples in FIELDS order, batch_size at a time"""
+    stmt = select(*(table.c[name] for name in FIELDS))
+    if user_id is not None:
+        stmt = stmt.where(table.c.user_id == user_id).order_by(table.c.timestamp, table.c.id)
+    else:
+        stmt = stmt.order_by(table.c.id)
+    result = conn.execution_options(stream_results=True, max_row_buffer=batch_size).execute(stmt)
+    for rows in result.partitions(batch_size):
+        yield rows
+
+
+def export_chunks(batches, fmt):
+    """Encode row batches from iter_actions() as NDJSON or CSV text, one chunk per batch"""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(FIELDS)
+        for rows in batches:
+            writer.writerows(row[:-1] + (_iso(row[-1]),) for row in rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    elif fmt == "ndjson":
+        dumps = json.JSONEncoder(separators=(",", ":")).encode
+        for rows in batches:
+            yield "".join(dumps(dict(zip(FIELDS, row[:-1] + (_iso(row[-1]),)))) + "\n" for row in rows)
+    else:
+        raise ValueError(f"unknown export format {fmt!r}")
+
+
+def read_actions(stream, fmt):
+    """Parse an NDJSON or CSV export (text stream) into import dicts, lazily"""
+    if fmt == "csv":
+        records = csv.DictReader(stream)
+    elif fmt == "ndjson":
+        records = (json.loads(line) for line in stream if line.strip())
+    else:
+        raise ValueError(f"unknown import format {fmt!r}")
+    for n, record in enumerate(records, 1):
+        try:
+            timestamp = datetime.fromisoformat(record["timestamp"])
+            if timestamp.tzinfo is not None:
+                timestamp = timestamp.astimezone(timezone.utc)
+            yield {
+                "user_id": int(record["user_id"]),
+                "action_type": record["action_type"],
+                "action_name": record["action_name"],
+                "water_amount": float(record["water_amount"]),
+                "percentage_change": int(record["percentage_change"]),
+                "timestamp": timestamp,
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"record {n}: {e!r}") from e
+
+
+def bulk_insert(conn, table, actions, batch_size=BATCH_SIZE):
+    """Insert action dicts inside the caller's transaction; returns the row count"""
+    if conn.dialect.name == "postgresql":
+        return _copy_insert(conn, table, actions)
+    count = 0
+    batch = []
+    insert = table.insert()
+    for action in actions:
+        batch.append(action)
+        if len(batch) >= batch_size:
+            conn.execute(insert, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        conn.execute(insert, batch)
+        count += len(batch)
+    return count
+
+
+def _copy_insert(conn, table, actions):
+    columns = ", ".join(IMPORT_FIELDS)
+    count = 0
+    cursor = conn.connection.driver_connection.cursor()
+    try:
+        with cursor.copy(f"COPY {table.name} ({columns}) FROM STDIN") as copy:
+            for action in actions:
+                copy.write_row(tuple(action[name] for name in IMPORT_FIELDS))
+                count += 1
+    finally:
+        cursor.close()
+    return count
+
+
+def replay_water_levels(conn, table, user_ids=None, start=START_LEVEL, batch_size=BATCH_SIZE,
+                        checkpoints=None):
+    """Yield (user_id, level) by replaying each user's log with the app's 0-100 clamping.
+
+    Streams the log in (user_id, timestamp, id) order, so only one user's
+    running level is held at a time. user_ids limits the scan to those
+    users (queried in sorted chunks of batch_size ids) instead of reading
+    the whole table. With a checkpoints table (see compaction.py), a
+    user's replay starts from their checkpoint level instead of
+    ``start``, since the rows before it have been compacted away.
+    """
+    columns = [table.c.user_id, table.c.percentage_change]
+    stmt = select(*columns)
+    if checkpoints is not None:
+        stmt = select(*columns, checkpoints.c.level).outerjoin(
+            checkpoints, checkpoints.c.user_id == table.c.user_id)
+    stmt = stmt.order_by(table.c.user_id, table.c.timestamp, table.c.id)
+    if user_ids is None:
+        yield from _replay(conn, stmt, start, batch_size, checkpoints is not None)
+        return
+    ids = sorted(user_ids)
+    for i in range(0, len(ids), batch_size):
+        chunk = stmt.where(table.c.user_id.in_(ids[i:i + batch_size]))
+        yield from _replay(conn, chunk, start, batch_size, checkpoints is not None)
+
+
+def _replay(conn, stmt, start, batch_size, has_checkpoints):
+    result = conn.execution_options(stream_results=True, max_row_buffer=batch_size).execute(stmt)
+    current, level = None, start
+    for rows in result.partitions(batch_size):
+        for row in rows:
+            user_id, change = row[0], row[1]
+            if user_id != current:
+                if current is not None:
+                    yield current, level
+                current = user_id
+                level = row[2] if has_checkpoints and row[2] is not None else start
+            level = max(0, min(100, level + change))
+    if current is not None:
+        yield current, level
+
+
+def level_drift(conn, users, table, checkpoints=None, start=START_LEVEL, batch_size=BATCH_SIZE):
+    """Yield (user_id, stored level, replayed level) for each user whose stored level is off.
+
+    One streamed pass over users left-joined to their actions (and
+    checkpoints) in (user id, timestamp, id) order, so users with no raw
+    rows, or only a checkpoint, are checked too; memory holds one user's
+    running level. Levels are clamped to 0-100 after every action, as in
+    replay_water_levels().
+    """
+    columns = [users.c.id, users.c.water_level, table.c.percentage_change]
+    source = users.outerjoin(table, table.c.user_id == users.c.id)
+    if checkpoints is not None:
+        columns.append(checkpoints.c.level)
+        source = source.outerjoin(checkpoints, checkpoints.c.user_id == users.c.id)
+    stmt = select(*columns).select_from(source).order_by(users.c.id, table.c.timestamp, table.c.id)
+    result = conn.execution_options(stream_results=True, max_row_buffer=batch_size).execute(stmt)
+    current = stored = level = None
+    for rows in result.partitions(batch_size):
+        for row in rows:
+            user_id, change = row[0], row[2]
+            if user_id != current:
+                if current is not None and stored != level:
+                    yield current, stored, level
+                current = user_id
+                stored = row[1] if row[1] is not None else start
+                level = row[3] if checkpoints is not None and row[3] is not None else start
+            if change is not None:
+                level = max(0, min(100, level + change))
+    if current is not None and stored != level:
+        yield current, stored, level
@@ -1,37 +1,80 @@
 import os
-from datetime import datetime, timezone
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify  # type: ignore
+import itertools
+import json
+import queue
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from functools import partial
+import click  # type: ignore
+from flask import Blueprint, Flask, Response, current_app, render_template, request, redirect, url_for, flash, session, jsonify, stream_with_context  # type: ignore
 from flask_sqlalchemy import SQLAlchemy  # type: ignore
+from jinja2 import FileSystemBytecodeCache  # type: ignore
+from sqlalchemy import event  # type: ignore
+from sqlalchemy.orm.attributes import set_committed_value  # type: ignore
 from werkzeug.security import generate_password_hash, check_password_hash  # type: ignore
 
 # ⬇️ NEW: OpenAI client import + init
-from openai import OpenAI
+from chat_cache import ChatCache
+from chat_gateway import ChatGateway, GatewayBusy, make_openai_client
+from chat_stream import SSE_HEADERS, sse_event, stream_chat_events, usage_dict
+from conversation_store import ConversationStore
+from model_router import ModelRouter
+from level_events import LevelBus, StreamLimitReached
+from depletion_buffer import WriteBehindBuffer
+from user_cache import UserSnapshot, UserSnapshotCache
+from page_cache import PageCache
+from metrics import EventLogger, Metrics
+import db_engine
+from db_engine import replica_reads
+import action_io
+import assets
+import compaction
+import fast_json
+from leaderboard import RANKINGS, Leaderboard
+from knowledge_index import KnowledgeIndex
+import migrations
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-oai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+# Request threads per gunicorn worker (gunicorn.conf.py); chats and level streams are sized from it
+WORKER_THREADS = int(os.environ.get('GUNICORN_THREADS', 16))
+chat_gateway = ChatGateway.from_env(WORKER_THREADS)
+chat_cache = ChatCache.from_env()
+conversations = ConversationStore.from_env()
+knowledge = KnowledgeIndex.from_env(os.path.abspath(os.path.dirname(__file__)))
+SYSTEM_PROMPT = "You are a friendly, concise website assistant."
 MODEL_PRIMARY = "gpt-4o-mini"
 MODEL_FALLBACK = "gpt-4o"
-# ⬆️ END NEW
+model_router = ModelRouter.from_env([MODEL_PRIMARY, MODEL_FALLBACK], passthrough=(GatewayBusy,))
+metrics = Metrics()
+events = EventLogger.from_env('drain')
+
+_oai_client = None
+_oai_client_lock = threading.Lock()
 
-app = Flask(__name__)
-app.secret_key = os.environ.get("SECRET_KEY", "dev")
+def get_oai_client():
+    """OpenAI client, built on first use (None without OPENAI_API_KEY)"""
+    global _oai_client
+    if _oai_client is None and OPENAI_API_KEY:
+        with _oai_client_lock:
+            if _oai_client is None:
+                _oai_client = make_openai_client(OPENAI_API_KEY, chat_gateway)
+    return _oai_client
+# ⬆️ END NEW
 
 # Database configuration
 basedir = os.path.abspath(os.path.dirname(__file__))
-db_url = os.environ.get("DATABASE_URL")
-if db_url:
-    # Make sure we use the psycopg v3 driver
-    if db_url.startswith("postgres://"):
-        db_url = db_url.replace("postgres://", "postgresql+psycopg://", 1)
-    elif db_url.startswith("postgresql://"):
-        db_url = db_url.replace("postgresql://", "postgresql+psycopg://", 1)
-    app.config["SQLALCHEMY_DATABASE_URI"] = db_url
-else:
-    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(basedir, 'users.db')}"
-
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-
-# Initialize database
-db = SQLAlchemy(app)
+
+def database_url():
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        return f"sqlite:///{os.path.join(basedir, 'users.db')}"
+    return db_engine.normalize_url(db_url)
+
+# Database and routes are bound to an app in create_app()
+# (the routing session sends @replica_reads views to DATABASE_REPLICA_URL)
+db = SQLAlchemy(session_options={'class_': db_engine.RoutingSession})
+main = Blueprint('main', __name__, cli_group=None)
 
 # User model
 class User(db.Model):
@@ -55,69 +98,797 @@ class User(db.Model):
         return check_password_hash(self.password_hash, password)
     
     def add_water(self, amount):
-        """Add water to user's level (max 100%)"""
-        self.water_level = min(100, self.water_level + amount)
-        db.session.commit()
+        """Add water to user's level (max 100%); caller commits"""
+        return self._change_water(amount)
     
     def use_water(self, amount):
-        """Remove water from user's level (min 0%)"""
-        self.water_level = max(0, self.water_level - amount)
-        db.session.commit()
+        """Remove water from user's level (min 0%); caller commits"""
+        return self._change_water(-amount)
+    
+    def _change_water(self, delta):
+        level = change_water_level(self.id, delta)
+        set_committed_value(self, 'water_level', level)
+        return level
     
     def __repr__(self):
         return f'<User {self.username}>'
 
+def change_water_level(user_id, delta):
+    """Clamp and apply delta in a single UPDATE ... RETURNING (caller commits).
+
+    The database does the read-modify-write, so concurrent requests for
+    the same user can't overwrite each other's changes. Returns the new
+    level, or None if the user doesn't exist.
+    """
+    new_level = db.func.coalesce(User.water_level, 50) + delta
+    stmt = (
+        db.update(User)
+        .where(User.id == user_id)
+        .values(water_level=db.case((new_level > 100, 100), (new_level < 0, 0), else_=new_level))
+        .returning(User.water_level)
+        .execution_options(synchronize_session=False)
+    )
+    level = db.session.execute(stmt).scalar()
+    # Cached snapshots of this user are dropped once the transaction commits
+    db.session.info.setdefault('changed_users', set()).add(user_id)
+    user_snapshots.forget(user_id)
+    return level
+
 class UserAction(db.Model):
     __tablename__ = "user_actions"
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)  # <-- match users.id
-    action_type = db.Column(db.String(50), nullable=False)  # 'eco', 'donation', 'learning', 'deplete'
+    action_type = db.Column(db.String(50), nullable=False)  # 'eco', 'donation', 'learning', 'deplete', 'adjustment'
     action_name = db.Column(db.String(100), nullable=False)  # specific action like 'short-shower'
     water_amount = db.Column(db.Float, nullable=False)  # liters saved/used
     percentage_change = db.Column(db.Integer, nullable=False)  # percentage change in water level
     timestamp = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+    # Per-user history scans (progress charts) walk this index in timestamp order
+    __table_args__ = (db.Index('ix_user_actions_user_id_timestamp', 'user_id', 'timestamp'),)
     
     def __repr__(self):
         return f'<UserAction {self.action_name}: {self.water_amount}L>'
 
-# --- Ensure tables exist on Render (gunicorn import) ---
-with app.app_context():
-    db.create_all()
+class UserActionRollup(db.Model):
+    """Running per-user totals for each action_name, kept in step with user_actions"""
+    __tablename__ = "user_action_rollups"
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    action_name = db.Column(db.String(100), primary_key=True)
+    total_water = db.Column(db.Float, nullable=False, default=0)
+    total_percentage = db.Column(db.Integer, nullable=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<UserActionRollup {self.user_id}/{self.action_name}: {self.count}>'
+
+class UserDailyTotal(db.Model):
+    """Per-user, per-UTC-day liters saved and consumed, feeding the leaderboard"""
+    __tablename__ = "user_daily_totals"
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    liters_saved = db.Column(db.Float, nullable=False, default=0)
+    liters_consumed = db.Column(db.Float, nullable=False, default=0)  # by chatbot use
+    actions = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<UserDailyTotal {self.user_id}/{self.day}: +{self.liters_saved}L -{self.liters_consumed}L>'
+
+class UserActionSummary(db.Model):
+    """Compacted user_actions: one row per user, UTC day and action_name (see compaction.py)"""
+    __tablename__ = "user_action_summaries"
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    action_name = db.Column(db.String(100), primary_key=True)
+    action_type = db.Column(db.String(50), nullable=False)
+    water_amount = db.Column(db.Float, nullable=False, default=0)
+    percentage_change = db.Column(db.Integer, nullable=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    first_timestamp = db.Column(db.DateTime, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<UserActionSummary {self.user_id}/{self.day}/{self.action_name}: {self.count}>'
+
+class UserLevelCheckpoint(db.Model):
+    """A user's clamped water level right after their last compacted action"""
+    __tablename__ = "user_level_checkpoints"
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    level = db.Column(db.Integer, nullable=False)
+    as_of = db.Column(db.DateTime, nullable=False)
+    last_action_id = db.Column(db.Integer, nullable=False)
+
+def dialect_insert():
+    """The INSERT construct with ON CONFLICT support for the bound database"""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+def bump_action_rollups(actions):
+    """Add a batch of new user_actions rows (as dicts) to their rollups (caller commits).
+
+    Uses INSERT ... ON CONFLICT so two workers bumping the same row don't race.
+    """
+    totals = {}
+    for action in actions:
+        key = (action['user_id'], action['action_name'])
+        water, percentage, count = totals.get(key, (0, 0, 0))
+        totals[key] = (water + action['water_amount'], percentage + action['percentage_change'], count + 1)
+    if not totals:
+        return
+
+    insert = dialect_insert()
+    table = UserActionRollup.__table__
+    for (user_id, action_name), (water, percentage, count) in totals.items():
+        stmt = insert(table).values(
+            user_id=user_id,
+            action_name=action_name,
+            total_water=water,
+            total_percentage=percentage,
+            count=count
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.action_name],
+            set_={
+                'total_water': table.c.total_water + stmt.excluded.total_water,
+                'total_percentage': table.c.total_percentage + stmt.excluded.total_percentage,
+                'count': table.c.count + stmt.excluded.count,
+            }
+        )
+        db.session.execute(stmt)
+
+def bump_daily_totals(actions):
+    """Add a batch of new user_actions rows to their per-day totals (caller commits).
+
+    The same deltas are queued on the session and reach the in-memory
+    leaderboard only once the transaction commits.
+    """
+    today = datetime.now(timezone.utc).date()
+    totals = {}
+    for action in actions:
+        timestamp = action.get('timestamp')
+        if timestamp is None:
+            day = today
+        else:
+            day = (timestamp.astimezone(timezone.utc) if timestamp.tzinfo else timestamp).date()
+        water = action['water_amount']
+        saved, consumed, count = totals.get((action['user_id'], day), (0, 0, 0))
+        totals[(action['user_id'], day)] = (saved + max(water, 0), consumed + max(-water, 0), count + 1)
+    if not totals:
+        return
+
+    insert = dialect_insert()
+    table = UserDailyTotal.__table__
+    for (user_id, day), (saved, consumed, count) in totals.items():
+        stmt = insert(table).values(
+            user_id=user_id, day=day, liters_saved=saved, liters_consumed=consumed, actions=count
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.day],
+            set_={
+                'liters_saved': table.c.liters_saved + stmt.excluded.liters_saved,
+                'liters_consumed': table.c.liters_consumed + stmt.excluded.liters_consumed,
+                'actions': table.c.actions + stmt.excluded.actions,
+            }
+        )
+        db.session.execute(stmt)
+    db.session.info.setdefault('leaderboard_deltas', []).extend(
+        (user_id, day) + values for (user_id, day), values in totals.items()
+    )
+
+def record_actions(actions):
+    """Insert user_actions rows (as dicts) in one executemany and bump their rollups.
+
+    The caller commits, so the rows land in the same transaction as the
+    water level change they explain.
+    """
+    if not actions:
+        return
+    db.session.execute(db.insert(UserAction), actions)
+    bump_action_rollups(actions)
+    bump_daily_totals(actions)
+
+def _action_log(*columns, user_ids=None):
+    """user_actions UNION ALL user_action_summaries as one subquery.
+
+    Each column is a (raw expression, summary expression, label) triple;
+    a 'n' column counts the actions each row stands for.
+    """
+    raw = db.select(*(expr.label(label) for expr, _, label in columns), db.literal(1).label('n'))
+    compacted = db.select(*(expr.label(label) for _, expr, label in columns),
+                          UserActionSummary.count.label('n'))
+    if user_ids is not None:
+        raw = raw.where(UserAction.user_id.in_(user_ids))
+        compacted = compacted.where(UserActionSummary.user_id.in_(user_ids))
+    return db.union_all(raw, compacted).subquery()
+
+def _rebuild(table, columns, source, user_ids=None, conn=None):
+    """Replace table's rows with source(user ids) for everyone, or only user_ids.
+
+    User ids go in sorted chunks so IN lists stay small. With conn the
+    statements join that connection's transaction; otherwise the session
+    is committed.
+    """
+    execute = (conn or db.session).execute
+    chunks = [None]
+    if user_ids is not None:
+        ids = sorted(user_ids)
+        chunks = [ids[i:i + 500] for i in range(0, len(ids), 500)]
+    for chunk in chunks:
+        delete = table.delete()
+        if chunk is not None:
+            delete = delete.where(table.c.user_id.in_(chunk))
+        execute(delete)
+        execute(table.insert().from_select(columns, source(chunk)))
+    if conn is None:
+        db.session.commit()
+
+def rebuild_action_rollups(user_ids=None, conn=None):
+    """Recompute rollups from the action log, compacted days included (all users, or just user_ids)"""
+    def source(user_ids):
+        log = _action_log(
+            (UserAction.user_id, UserActionSummary.user_id, 'user_id'),
+            (UserAction.action_name, UserActionSummary.action_name, 'action_name'),
+            (UserAction.water_amount, UserActionSummary.water_amount, 'water'),
+            (UserAction.percentage_change, UserActionSummary.percentage_change, 'percentage'),
+            user_ids=user_ids,
+        )
+        return db.select(
+            log.c.user_id,
+            log.c.action_name,
+            db.func.sum(log.c.water),
+            db.func.sum(log.c.percentage),
+            db.func.sum(log.c.n)
+        ).group_by(log.c.user_id, log.c.action_name)
+
+    _rebuild(UserActionRollup.__table__, ['user_id', 'action_name', 'total_water', 'total_percentage', 'count'],
+             source, user_ids, conn)
+
+def rebuild_daily_totals(user_ids=None, conn=None):
+    """Recompute per-day totals from the action log, compacted days included (all users, or just user_ids)"""
+    def source(user_ids):
+        log = _action_log(
+            (UserAction.user_id, UserActionSummary.user_id, 'user_id'),
+            (db.func.date(UserAction.timestamp), UserActionSummary.day, 'day'),
+            (UserAction.water_amount, UserActionSummary.water_amount, 'water'),
+            user_ids=user_ids,
+        )
+        return db.select(
+            log.c.user_id,
+            log.c.day,
+            db.func.sum(db.case((log.c.water > 0, log.c.water), else_=0)),
+            db.func.sum(db.case((log.c.water < 0, -log.c.water), else_=0)),
+            db.func.sum(log.c.n)
+        ).group_by(log.c.user_id, log.c.day)
+
+    _rebuild(UserDailyTotal.__table__, ['user_id', 'day', 'liters_saved', 'liters_consumed', 'actions'],
+             source, user_ids, conn)
+    leaderboard.invalidate()
+
+# Cached read-only view of the user fields page routes need
+def load_user_snapshot(user_id):
+    row = db.session.query(
+        User.id, User.username, User.fullname, User.email, User.water_level
+    ).filter_by(id=user_id).first()
+    return UserSnapshot(*row) if row else None
+
+# Replica reads may predate the user's last write, so they never reach the process cache
+user_snapshots = UserSnapshotCache.from_env(load_user_snapshot, cacheable=lambda: not db_engine.using_replica())
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_user_snapshots(session):
+    changed = session.info.pop('changed_users', None)
+    if changed:
+        user_snapshots.invalidate(changed)
+    leaderboard.apply(session.info.pop('leaderboard_deltas', None))
+    db_engine.note_write()
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_user_changes(session):
+    session.info.pop('changed_users', None)
+    session.info.pop('leaderboard_deltas', None)
+
+def day_number(day):
+    """Whole days since a fixed epoch, so consecutive dates differ by exactly 1"""
+    if db.engine.dialect.name == 'postgresql':
+        return db.cast(db.func.extract('epoch', day) / 86400, db.Integer)
+    return db.cast(db.func.julianday(day), db.Integer)
+
+def load_leaderboard(since):
+    """Everything the leaderboard needs, from the per-day table only.
+
+    Current streaks are computed in SQL (gaps and islands): for users with
+    a saving day on or after `since`, day number + row number (newest day
+    first) is the same on every day of an unbroken run, so the newest
+    run is the rows sharing the newest day's key. One row per streak
+    comes back, instead of every saving day ever recorded.
+    """
+    saved = db.session.execute(
+        db.select(UserDailyTotal.user_id, db.func.sum(UserDailyTotal.liters_saved))
+        .group_by(UserDailyTotal.user_id)
+    ).all()
+    recent = db.select(UserDailyTotal.user_id).where(UserDailyTotal.day >= since, UserDailyTotal.liters_saved > 0)
+    days = db.select(
+        UserDailyTotal.user_id,
+        UserDailyTotal.day,
+        (day_number(UserDailyTotal.day) + db.func.row_number().over(
+            partition_by=UserDailyTotal.user_id, order_by=UserDailyTotal.day.desc())).label('run'),
+        (db.func.max(day_number(UserDailyTotal.day)).over(partition_by=UserDailyTotal.user_id) + 1).label('newest_run'),
+    ).where(UserDailyTotal.liters_saved > 0, UserDailyTotal.user_id.in_(recent)).subquery()
+    streaks = db.session.execute(
+        db.select(days.c.user_id, db.func.count(), db.func.max(days.c.day))
+        .where(days.c.run == days.c.newest_run)
+        .group_by(days.c.user_id)
+    ).all()
+    totals = db.session.execute(db.select(
+        db.func.sum(UserDailyTotal.liters_saved).label('liters_saved'),
+        db.func.sum(UserDailyTotal.liters_consumed).label('liters_consumed'),
+        db.func.sum(UserDailyTotal.actions).label('actions'),
+    )).one()._mapping
+    return saved, streaks, totals
+
+leaderboard = Leaderboard.from_env(load_leaderboard)
+
+# Schema is created and upgraded explicitly: `flask --app app migrate`
+@main.cli.command('migrate')
+@click.option('--status', is_flag=True, help='List applied and pending migrations without running them.')
+def migrate_command(status):
+    """Apply pending schema migrations."""
+    if status:
+        applied = migrations.applied_versions(db.engine)
+        for version, description, _ in migrations.MIGRATIONS:
+            print(f"{'applied' if version in applied else 'pending':>8}  {version:>3}  {description}")
+        return
+    count = migrations.run_migrations(db.engine, db.metadata)
+    print(f"Database is up to date ({count} migration(s) applied).")
+
+@main.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Backfill user_action_rollups and user_daily_totals from the user_actions log."""
+    rebuild_action_rollups()
+    rebuild_daily_totals()
+    print(f"Rebuilt {UserActionRollup.query.count()} action rollups "
+          f"and {UserDailyTotal.query.count()} daily totals.")
+
+@main.cli.command('export-actions')
+@click.option('--user-id', type=int, help='Export only this user (default: everyone).')
+@click.option('--format', 'fmt', type=click.Choice(sorted(action_io.FORMATS)), default='ndjson', show_default=True)
+@click.option('--output', type=click.File('w'), default='-', help='File to write (default: stdout).')
+def export_actions_command(user_id, fmt, output):
+    """Stream the user_actions log as NDJSON or CSV."""
+    with db.engine.connect() as conn:
+        for chunk in action_io.export_chunks(action_io.iter_actions(conn, UserAction.__table__, user_id), fmt):
+            output.write(chunk)
+
+@main.cli.command('import-actions')
+@click.argument('source', type=click.File('r'))
+@click.option('--format', 'fmt', type=click.Choice(sorted(action_io.FORMATS)),
+              help='Input format (default: from the file extension, else ndjson).')
+@click.option('--batch-size', type=int, default=action_io.BATCH_SIZE, show_default=True)
+def import_actions_command(source, fmt, batch_size):
+    """Bulk-load an action export, then recompute water levels and rollups.
+
+    Rows for users that don't exist here are skipped. Loading, replaying
+    levels and rebuilding the imported users' rollups and daily totals is
+    one transaction, so a malformed record leaves the database untouched.
+    """
+    fmt = fmt or ('csv' if source.name.endswith('.csv') else 'ndjson')
+    known_users = set(db.session.execute(db.select(User.id)).scalars())
+    imported_users = set()
+    skipped = 0
+
+    def accepted(actions):
+        nonlocal skipped
+        for action in actions:
+            if action['user_id'] in known_users:
+                imported_users.add(action['user_id'])
+                yield action
+            else:
+                skipped += 1
+
+    set_level = User.__table__.update().where(User.id == db.bindparam('uid')).values(water_level=db.bindparam('level'))
+    try:
+        with db.engine.begin() as conn:
+            count = action_io.bulk_insert(conn, UserAction.__table__,
+                                          accepted(action_io.read_actions(source, fmt)), batch_size)
+            batch = []
+            for user_id, level in action_io.replay_water_levels(conn, UserAction.__table__, imported_users,
+                                                                checkpoints=UserLevelCheckpoint.__table__):
+                batch.append({'uid': user_id, 'level': level})
+                if len(batch) >= batch_size:
+                    conn.execute(set_level, batch)
+                    batch = []
+            if batch:
+                conn.execute(set_level, batch)
+            # Only the imported users' aggregates change, in the same transaction
+            rebuild_action_rollups(imported_users, conn=conn)
+            rebuild_daily_totals(imported_users, conn=conn)
+    except ValueError as e:
+        raise click.ClickException(f"Import aborted, nothing was written: {e}")
+    user_snapshots.invalidate(imported_users)
+    print(f"Imported {count} actions for {len(imported_users)} users "
+          f"({skipped} skipped for unknown users); water levels and rollups recomputed.")
+
+@main.cli.command('compact-actions')
+@click.option('--older-than-days', type=int, default=lambda: int(os.environ.get('ACTIONS_RETENTION_DAYS', 90)),
+              show_default='ACTIONS_RETENTION_DAYS or 90', help='Compact raw rows older than this.')
+@click.option('--chunk-size', type=int, default=action_io.BATCH_SIZE, show_default=True,
+              help='Rows per transaction.')
+@click.option('--archive-dir', type=click.Path(file_okay=False),
+              default=lambda: os.environ.get('ACTIONS_ARCHIVE_DIR'),
+              help='Write each chunk\'s raw rows here as .ndjson.gz before deleting them.')
+@click.option('--pause', type=float, default=0.0, help='Seconds to sleep between chunks.')
+@click.option('--max-chunks', type=int, help='Stop after this many chunks (resume by running again).')
+def compact_actions_command(older_than_days, chunk_size, archive_dir, pause, max_chunks):
+    """Fold old user_actions rows into per-day summaries."""
+    horizon = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    if db.engine.dialect.name == 'sqlite':
+        horizon = horizon.replace(tzinfo=None)  # SQLite stores naive UTC
+    total = compaction.compact(
+        db.engine, UserAction.__table__, UserActionSummary.__table__, UserLevelCheckpoint.__table__,
+        horizon, chunk_size=chunk_size, archive_dir=archive_dir, pause=pause, max_chunks=max_chunks
+    )
+    print(f"Compacted {total} actions older than {horizon:%Y-%m-%d %H:%M} UTC.")
+
+@main.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint and precompress static/ into static/dist/ (run on deploy)."""
+    assets.build(current_app.static_folder)
+    print("Restart the app servers to pick up the new asset manifest.")
+
+def legacy_refill_users():
+    """Users with refill rows (raw or compacted) logged before refills recorded their rounding.
+
+    Those rows don't add up to the gain that was applied. Before migration 7
+    has run, every refill row counts.
+    """
+    cutoff = migrations.applied_at(db.engine, migrations.ROUNDING_ADJUSTMENTS)
+    raw = db.select(UserAction.user_id).where(UserAction.action_type.in_(REFILL_TYPES))
+    compacted = db.select(UserActionSummary.user_id).where(UserActionSummary.action_type.in_(REFILL_TYPES))
+    if cutoff is not None:
+        raw = raw.where(UserAction.timestamp < cutoff)
+        compacted = compacted.where(UserActionSummary.first_timestamp < cutoff)
+    return set(db.session.execute(db.union(raw, compacted)).scalars())
+
+@main.cli.command('reconcile-levels')
+@click.option('--fix', is_flag=True, help='Set drifted users\' water_level to the replayed level.')
+@click.option('--show', type=int, default=20, show_default=True, help='Drifted users to list.')
+@click.option('--batch-size', type=int, default=action_io.BATCH_SIZE, show_default=True)
+@click.option('--fail-on-drift', is_flag=True, help='Exit with status 1 if any user drifted (for cron alerts).')
+def reconcile_levels_command(fix, show, batch_size, fail_on_drift):
+    """Compare every user's water_level with a replay of their action log.
+
+    Fixes are conditional on the level still being the one that was read,
+    so users who act while this runs are left alone (and reported).
+
+    Refills logged before refills recorded their rounding adjustment
+    (migration 7) replay a point or so low, so --fix leaves users with
+    such rows alone; they are still reported.
+    """
+    # Only rows whose level hasn't changed since the scan are repaired
+    set_level = User.__table__.update().where(
+        User.id == db.bindparam('uid'),
+        db.func.coalesce(User.water_level, action_io.START_LEVEL) == db.bindparam('stored')
+    ).values(water_level=db.bindparam('level'))
+    checked = db.session.execute(db.select(db.func.count(User.id))).scalar()
+    drifted = repaired = legacy = 0
+    largest = 0
+    batch = []
+    legacy_users = legacy_refill_users() if fix else set()
+
+    def repair():
+        nonlocal repaired
+        with db.engine.begin() as conn:
+            repaired += conn.execute(set_level, batch).rowcount
+        user_snapshots.invalidate([row['uid'] for row in batch])
+        batch.clear()
+
+    with db.engine.connect() as conn:
+        for user_id, stored, level in action_io.level_drift(conn, User.__table__, UserAction.__table__,
+                                                            UserLevelCheckpoint.__table__, batch_size=batch_size):
+            drifted += 1
+            largest = max(largest, abs(stored - level))
+            skip = user_id in legacy_users
+            legacy += skip
+            if drifted <= show:
+                note = " (refills logged before rounding adjustments; not fixed)" if skip else ""
+                print(f"user {user_id}: water_level {stored}, log replays to {level}{note}")
+            if fix and not skip:
+                batch.append({'uid': user_id, 'stored': stored, 'level': level})
+                if len(batch) >= batch_size:
+                    repair()
+    if batch:
+        repair()
+
+    print(f"Checked {checked} users: {drifted} drifted (largest gap {largest} points).")
+    if fix:
+        print(f"Repaired {repaired}; skipped {legacy} with refills logged before rounding adjustments; "
+              f"{drifted - legacy - repaired} changed during the scan and were left alone.")
+    if fail_on_drift and drifted:
+        raise SystemExit(1)
 
 # ⬇️ NEW: Chatbot route (same origin)
-@app.post("/chat")
+def chat_conversation_id():
+    """Server-side conversation key: the user, or an anonymous id kept in the session"""
+    if 'user_id' in session:
+        return f"user:{session['user_id']}"
+    if 'chat_id' not in session:
+        session['chat_id'] = uuid.uuid4().hex
+    return f"anon:{session['chat_id']}"
+
+def answer_locally(conversation_id, user_msg, started):
+    """Reply from the knowledge index without calling OpenAI, or (None, snippets for the prompt)"""
+    reply, snippets = knowledge.answer(user_msg)
+    if reply is None:
+        return None, snippets
+    conversations.append(conversation_id, user_msg, reply)
+    metrics.chat_seconds.observe(time.perf_counter() - started, ('local',))
+    # No model ran, so no water is depleted for this turn
+    return jsonify({"reply": reply, "usage": None, "source": "local"}), []
+
+@main.post("/chat")
 def chat():
+    started = time.perf_counter()
+    data = request.get_json(force=True) or {}
+    user_msg = data.get("message", "")
+    conversation_id = chat_conversation_id()
+    # Without shared storage the previous turn may have gone to another worker
+    conversations.restore(conversation_id, data.get("messages"))
+
+    # Questions about the site's own numbers are answered from the local index
+    local, snippets = answer_locally(conversation_id, user_msg, started)
+    if local is not None:
+        return local
+
+    oai_client = get_oai_client()
     if oai_client is None:
         return jsonify({"reply": "Server missing OPENAI_API_KEY."}), 500
 
+    # History lives server-side; the browser's copy only fills in for another worker's
+    convo = conversations.build_prompt(conversation_id, knowledge.system_prompt(SYSTEM_PROMPT, snippets), user_msg)
+
+    def complete():
+        # The router skips models whose circuit is open and falls back on errors
+        model, r = model_router.call(lambda model: (model, chat_gateway.call(
+            metrics.openai_timer(model, oai_client.chat.completions.create),
+            model=model, messages=convo, max_tokens=150, temperature=0.7
+        )))
+        usage = usage_dict(r.usage)
+        metrics.record_tokens(model, usage)
+        return {"reply": r.choices[0].message.content, "usage": usage}
+
+    # Identical (normalized) first turns share one cached reply; once the prompt
+    # carries earlier turns it is specific to this conversation and is not cached
+    key = None
+    if len(convo) == 2:
+        key = chat_cache.key(convo, model=MODEL_PRIMARY, max_tokens=150, temperature=0.7)
+    result = chat_cache.get_or_compute(key, complete)
+    reply = result["reply"]
+    conversations.append(conversation_id, user_msg, reply)
+
+    # Usage accounting happens here, so the page needs no second request
+    payload = {"reply": reply, "usage": result["usage"], "source": "openai"}
+    if 'user_id' in session:
+        payload["depletion"] = apply_chat_depletion(session['user_id'], user_msg, reply, result["usage"])
+    metrics.chat_seconds.observe(time.perf_counter() - started, ('openai',))
+    return jsonify(payload)
+
+# Streaming variant: forwards OpenAI deltas as Server-Sent Events so the
+# first words show up as soon as they are generated
+@main.post("/chat/stream")
+def chat_stream():
+    started = time.perf_counter()
     data = request.get_json(force=True) or {}
-    history = data.get("messages", [])
     user_msg = data.get("message", "")
+    conversation_id = chat_conversation_id()
+    # Without shared storage the previous turn may have gone to another worker
+    conversations.restore(conversation_id, data.get("messages"))
 
-    convo = [{"role": "system", "content": "You are a friendly, concise website assistant."}]
-    convo.extend(history)
-    convo.append({"role": "user", "content": user_msg})
+    # A local answer is complete at once, so it goes back as plain JSON
+    local, snippets = answer_locally(conversation_id, user_msg, started)
+    if local is not None:
+        return local
 
-    # Try primary, fall back once if needed
-    try:
-        r = oai_client.chat.completions.create(
-            model=MODEL_PRIMARY, messages=convo, max_tokens=150, temperature=0.7
-        )
-    except Exception:
-        r = oai_client.chat.completions.create(
-            model=MODEL_FALLBACK, messages=convo, max_tokens=150, temperature=0.7
-        )
+    oai_client = get_oai_client()
+    if oai_client is None:
+        return jsonify({"reply": "Server missing OPENAI_API_KEY."}), 500
+
+    # History lives server-side; the browser's copy only fills in for another worker's
+    convo = conversations.build_prompt(conversation_id, knowledge.system_prompt(SYSTEM_PROMPT, snippets), user_msg)
+
+    # Model errors surface when the stream is opened, before any bytes are sent
+    stream_args = dict(messages=convo, max_tokens=150, temperature=0.7,
+                       stream=True, stream_options={"include_usage": True})
+    model, stream = model_router.call(lambda model: (model, chat_gateway.open_stream(
+        metrics.openai_timer(model, oai_client.chat.completions.create), model=model, **stream_args
+    )))
+
+    user_id = session.get('user_id')
+    metrics.chat_seconds.observe(time.perf_counter() - started, ('openai',))
+
+    def on_done(reply, usage):
+        metrics.record_tokens(model, usage)
+        conversations.append(conversation_id, user_msg, reply)
+        if user_id is None:
+            return {}
+        return {"depletion": apply_chat_depletion(user_id, user_msg, reply, usage)}
 
-    return jsonify({"reply": r.choices[0].message.content})
+    return Response(stream_with_context(stream_chat_events(stream, model, on_done)),
+                    mimetype="text/event-stream", headers=SSE_HEADERS)
+
+@main.app_errorhandler(GatewayBusy)
+def chat_gateway_busy(e):
+    response = jsonify({"reply": str(e)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+# Chat gateway load, for monitoring
+@main.get("/api/chat-gateway")
+def chat_gateway_stats():
+    return jsonify(chat_gateway.stats())
+
+# Chat response cache hit/miss counters, for monitoring
+@main.get("/api/chat-cache")
+def chat_cache_stats():
+    return jsonify(chat_cache.stats())
+
+# Rendered page cache hit rate and 304s, for monitoring
+@main.get("/api/page-cache")
+def page_cache_stats():
+    return jsonify(page_cache.stats())
+
+# Per-model circuit state, error rate and latency, for monitoring
+@main.get("/api/model-router")
+def model_router_stats():
+    return jsonify(model_router.stats())
+
+# User snapshot cache hit rates, for monitoring
+@main.get("/api/user-cache")
+def user_cache_stats():
+    return jsonify(user_snapshots.stats())
+
+# Write-behind depletion queue, for monitoring
+@main.get("/api/depletion-buffer")
+def depletion_buffer_stats():
+    return jsonify(depletion_buffer.stats() if depletion_buffer else {'enabled': False})
+
+# Prompt tokens per request before/after history windowing, for monitoring
+@main.get("/api/chat-history")
+def chat_history_stats():
+    return jsonify(conversations.stats())
+
+# Share of chat messages answered from the local index, and latency per path
+@main.get("/api/chat-knowledge")
+def chat_knowledge_stats():
+    stats = knowledge.stats()
+    for path in ('local', 'openai'):
+        total, count = metrics.chat_seconds.snapshot((path,))
+        stats[f'avg_{path}_ms'] = round(total / count * 1000, 2) if count else None
+    return jsonify(stats)
 # ⬆️ END NEW
 
+# Chatbot water cost: 519 mL per 100 words (see Data), fixed 5% per interaction
+ML_PER_100_WORDS = 519
+WORDS_PER_TOKEN = 0.75  # OpenAI's rule of thumb for English text
+CHAT_PERCENTAGE_DECREASE = 5
+
+def estimate_chat_depletion(user_message, bot_response):
+    """Water cost of one chat turn from the words exchanged"""
+    user_words = len(user_message.split())
+    bot_words = len(bot_response.split())
+    total_words = user_words + bot_words
+    water_depleted_ml = (total_words / 100) * ML_PER_100_WORDS
+    return {
+        'user_words': user_words,
+        'bot_words': bot_words,
+        'words_processed': total_words,
+        'water_depleted_ml': water_depleted_ml,
+        'water_depleted_liters': water_depleted_ml / 1000,
+        'percentage_decrease': CHAT_PERCENTAGE_DECREASE
+    }
+
+def usage_chat_depletion(usage):
+    """Water cost of one chat turn from the tokens OpenAI actually processed"""
+    words = usage['total_tokens'] * WORDS_PER_TOKEN
+    water_depleted_ml = (words / 100) * ML_PER_100_WORDS
+    return {
+        'prompt_tokens': usage['prompt_tokens'],
+        'completion_tokens': usage['completion_tokens'],
+        'total_tokens': usage['total_tokens'],
+        'words_processed': round(words),
+        'water_depleted_ml': water_depleted_ml,
+        'water_depleted_liters': water_depleted_ml / 1000,
+        'percentage_decrease': CHAT_PERCENTAGE_DECREASE
+    }
+
+def flush_depletion_events(app, batch):
+    """Write a batch of buffered depletion events in one transaction"""
+    with app.app_context():
+        levels = {}
+        actions = []
+        for depletion in batch:
+            level = change_water_level(depletion['user_id'], depletion['delta'])
+            if level is not None:  # user deleted since the event was queued
+                levels[depletion['user_id']] = level
+                actions.append(depletion['action'])
+        record_actions(actions)
+        db.session.commit()
+    for user_id, level in levels.items():
+        level_bus.publish(user_id, level)
+
+# flush_fn is bound to the app in create_app()
+depletion_buffer = WriteBehindBuffer.from_env(None, events=events)
+
+def displayed_water_level(user_id, stored_level):
+    """The stored level, or the projected one while write-behind events are pending"""
+    if depletion_buffer is not None:
+        projected = depletion_buffer.projected(user_id)
+        if projected is not None:
+            return projected
+    return stored_level
+
+def apply_chat_depletion(user_id, user_message, bot_response, usage=None):
+    """Deplete the user's water for one chat turn and record it, in one transaction.
+
+    Uses the token usage when the completion reported it, else word counts.
+    Returns the depletion figures with the old and new water level, or None
+    if the user no longer exists.
+    """
+    if usage:
+        depletion = usage_chat_depletion(usage)
+    else:
+        depletion = estimate_chat_depletion(user_message, bot_response)
+    percentage_decrease = depletion['percentage_decrease']
+    
+    action = {
+        'user_id': user_id,
+        'action_type': 'deplete',
+        'action_name': 'Chatbot Interaction',
+        'water_amount': -depletion['water_depleted_liters'],  # negative for depletion
+        'percentage_change': -percentage_decrease  # negative for decrease
+    }
+    
+    old_level = depletion_buffer.projected(user_id) if depletion_buffer else None
+    if old_level is None:
+        user = user_snapshots.get(user_id)
+        if user is None:
+            return None
+        old_level = user.water_level
+    
+    # Write-behind: queue the change and answer with the projected level
+    new_level = None
+    if depletion_buffer is not None:
+        new_level = depletion_buffer.submit(user_id, -percentage_decrease, action, old_level)
+    if new_level is None:
+        new_level = change_water_level(user_id, -percentage_decrease)
+        record_actions([action])
+        db.session.commit()  # level change and action record in one transaction
+    level_bus.publish(user_id, new_level)
+    events.debug('chat_depletion', user_id=user_id, words=depletion['words_processed'],
+                 tokens=depletion.get('total_tokens'), water_ml=round(depletion['water_depleted_ml'], 2),
+                 percentage=percentage_decrease, old_level=old_level, new_level=new_level,
+                 buffered=depletion_buffer is not None)
+    
+    depletion['water_depleted_ml'] = round(depletion['water_depleted_ml'], 2)
+    depletion['water_depleted_liters'] = round(depletion['water_depleted_liters'], 3)
+    depletion['old_water_level'] = old_level
+    depletion['new_water_level'] = new_level
+    return depletion
+
+# Rendered pages that only vary by signed-in state (see page_cache.py)
+page_cache = PageCache.from_env()
+
 # Home/Landing page route
-@app.route('/')
+@main.route('/')
+@page_cache.cached
 def index():
     return render_template('index.html')
 
 # Login page route
-@app.route('/login', methods=['GET', 'POST'])
+@main.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         # Handle login form submission
@@ -137,7 +908,7 @@ def login():
             session['username'] = user.username
             session['fullname'] = user.fullname
             flash(f'Welcome back, {user.fullname}!')
-            return redirect(url_for('home'))
+            return redirect(url_for('main.home'))
         else:
             # Login failed
             flash('Invalid username or password!')
@@ -145,280 +916,588 @@ def login():
     return render_template('login.html')
 
 # Home page (after login)
-@app.route('/home')
+@main.route('/home')
+@replica_reads
 def home():
     if 'user_id' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
-    user = User.query.get(session['user_id'])
+    user = user_snapshots.get(session['user_id'])
     if user:
-        return render_template('home.html', water_level=user.water_level)
+        return render_template('home.html', water_level=displayed_water_level(user.id, user.water_level))
     else:
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
+
+# Refill action catalog: loaded once from refill_actions.json and compiled
+# into a form-field lookup table so a submitted form is scored in one pass
+REFILL_ACTIONS_FILE = os.path.join(basedir, 'refill_actions.json')
+
+def load_refill_catalog(path=REFILL_ACTIONS_FILE):
+    """Read the refill action catalog and index it by form field name"""
+    with open(path) as f:
+        catalog = json.load(f)
+    rules = {}
+    for order, action in enumerate(catalog['actions']):
+        rules[action['field']] = {
+            'order': order,
+            'value': action.get('value'),  # None means any non-empty value
+            'action_type': action['type'],
+            'action_name': action['name'],
+            'water_amount': action['liters'],
+            'percentage_change': action['percentage'],
+        }
+    return {'percent_per_liter': catalog['percent_per_liter'], 'rules': rules}
+
+REFILL_CATALOG = load_refill_catalog()
+REFILL_TYPES = ('eco', 'donation', 'learning')
+# Logged with each refill whose rounded total differs from its actions' percentages
+ADJUSTMENT_TYPE = 'adjustment'
+ROUNDING_ACTION = 'Refill Rounding'
+
+def score_refill(form, action_types=None):
+    """Match a submitted form against the catalog in a single pass.
+
+    Returns the matched rules in catalog order and the liters they save.
+    action_types optionally limits matching to e.g. {'eco'}.
+    """
+    rules = REFILL_CATALOG['rules']
+    matched = []
+    for field, value in form.items():
+        rule = rules.get(field)
+        if rule is None or not value:
+            continue
+        if rule['value'] is not None and value != rule['value']:
+            continue
+        if action_types is not None and rule['action_type'] not in action_types:
+            continue
+        matched.append(rule)
+    matched.sort(key=lambda rule: rule['order'])
+    return matched, sum(rule['water_amount'] for rule in matched)
 
 # Refill page route
-@app.route('/refill', methods=['GET', 'POST'])
+@main.route('/refill', methods=['GET', 'POST'])
+@replica_reads
 def refill():
     if 'user_id' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
     if request.method == 'POST':
-        user = User.query.get(session['user_id'])
-        if not user:
-            return redirect(url_for('login'))
-        
-        old_level = user.water_level  # Initialize old_level at the start
-        total_water_saved = 0
-        refill_type = ""
-        
-        # Define water values for each eco action (in liters)
-        eco_action_values = {
-            'short-shower': 5,
-            'turn-off-water': 1.5,
-            'broom-cleaning': 50,
-            'full-loads': 3,
-            'scrape-dishes': 9
-        }
-        
-        # Check for eco actions
-        eco_actions_completed = []
-        for action, value in eco_action_values.items():
-            if request.form.get(action):
-                total_water_saved += value
-                eco_actions_completed.append(action.replace('-', ' ').title())
-        
-        # Check for donation
-        donated = request.form.get('donated')
-        if donated == 'yes':
-            total_water_saved += 25  # Donation adds 25L equivalent
-            refill_type = "donation and eco actions" if eco_actions_completed else "donation"
-        elif eco_actions_completed:
-            refill_type = "eco actions"
-        
-        # Check for learning actions
-        shared_knowledge = request.form.get('shared-knowledge')
-        read_article = request.form.get('read-article')
-        learning_bonus = 0
-        if shared_knowledge:
-            learning_bonus += 10
-        if read_article:
-            learning_bonus += 15
-        
-        if learning_bonus > 0:
-            total_water_saved += learning_bonus
-            if refill_type:
-                refill_type += " and learning"
-            else:
-                refill_type = "learning"
+        return _process_refill()
+    
+    return render_template('refill.html')
+
+def _process_refill(action_types=None):
+    """Score the posted form, apply the water gain and record each action"""
+    if 'user_id' not in session:
+        return redirect(url_for('main.login'))
+    
+    # Land this user's buffered chat depletions first so the refill applies on top
+    # of them; if they can't be written now, applying the refill would reorder them
+    if (depletion_buffer is not None and depletion_buffer.pending(session['user_id'])
+            and not depletion_buffer.flush_user(session['user_id'])):
+        flash('We could not save your recent chat usage just now. Please try your refill again in a moment.')
+        return redirect(url_for('main.home'))
+    
+    user = user_snapshots.get(session['user_id'])
+    if not user:
+        return redirect(url_for('main.login'))
+    
+    old_level = user.water_level  # Initialize old_level at the start
+    matched, total_water_saved = score_refill(request.form, action_types)
+    
+    # Convert liters to percentage (assuming 1L = 0.5% for game balance)
+    # Use max(1, ...) to ensure at least 1% gain for any water saved
+    percent_per_liter = REFILL_CATALOG['percent_per_liter']
+    water_percentage_gain = max(1, int(total_water_saved * percent_per_liter)) if total_water_saved > 0 else 0
+    
+    if water_percentage_gain > 0:
+        new_level = change_water_level(user.id, water_percentage_gain)
+        actions = [
+            {
+                'user_id': user.id,
+                'action_type': rule['action_type'],
+                'action_name': rule['action_name'],
+                'water_amount': rule['water_amount'],
+                'percentage_change': rule['percentage_change'],
+            }
+            for rule in matched
+        ]
+        # The gain is rounded once for the whole refill, the catalog's per-action
+        # percentages each on their own; the difference is logged as its own
+        # row so the log replays to the level actually applied while every
+        # action keeps its catalog percentage
+        remainder = water_percentage_gain - sum(action['percentage_change'] for action in actions)
+        if remainder:
+            actions.append({
+                'user_id': user.id,
+                'action_type': ADJUSTMENT_TYPE,
+                'action_name': ROUNDING_ACTION,
+                'water_amount': 0,
+                'percentage_change': remainder,
+            })
         
-        # Convert liters to percentage (assuming 1L = 0.5% for game balance)
-        # Use max(1, ...) to ensure at least 1% gain for any water saved
-        water_percentage_gain = max(1, int(total_water_saved * 0.5)) if total_water_saved > 0 else 0
+        # Commit the level change, all actions and their rollups together
+        record_actions(actions)
+        db.session.commit()
+        level_bus.publish(user.id, new_level)
         
-        if water_percentage_gain > 0:
-            user.add_water(water_percentage_gain)
-            new_level = user.water_level
-            
-            # Record individual eco actions
-            for action, value in eco_action_values.items():
-                if request.form.get(action):
-                    action_record = UserAction(
-                        user_id=user.id,
-                        action_type='eco',
-                        action_name=action.replace('-', ' ').title(),
-                        water_amount=value,
-                        percentage_change=int(value * 0.5)
-                    )
-                    db.session.add(action_record)
-            
-            # Record donation if made
-            if donated == 'yes':
-                donation_record = UserAction(
-                    user_id=user.id,
-                    action_type='donation',
-                    action_name='Donation',
-                    water_amount=25,
-                    percentage_change=12
-                )
-                db.session.add(donation_record)
-            
-            # Record learning actions
-            if shared_knowledge:
-                learning_record = UserAction(
-                    user_id=user.id,
-                    action_type='learning',
-                    action_name='Shared Knowledge',
-                    water_amount=10,
-                    percentage_change=5
-                )
-                db.session.add(learning_record)
-            
-            if read_article:
-                learning_record = UserAction(
-                    user_id=user.id,
-                    action_type='learning',
-                    action_name='Read Article',
-                    water_amount=15,
-                    percentage_change=7
-                )
-                db.session.add(learning_record)
-            
-            # Commit all actions to database
-            db.session.commit()
-            
-            # Create success message
-            actions_text = f"You completed {len(eco_actions_completed)} eco actions" if eco_actions_completed else ""
-            if donated == 'yes':
-                actions_text += " and made a donation" if actions_text else "You made a donation"
-            if learning_bonus > 0:
-                actions_text += " and engaged with learning content" if actions_text else "You engaged with learning content"
-            
-            flash(f'Amazing! {actions_text}, saving {total_water_saved}L of water! Your water level increased from {old_level}% to {new_level}%.')
-        else:
-            flash('Please select at least one action to refill your water supply!')
+        # Create success message
+        types = [rule['action_type'] for rule in matched]
+        eco_count = types.count('eco')
+        actions_text = f"You completed {eco_count} eco actions" if eco_count else ""
+        if 'donation' in types:
+            actions_text += " and made a donation" if actions_text else "You made a donation"
+        if 'learning' in types:
+            actions_text += " and engaged with learning content" if actions_text else "You engaged with learning content"
         
-        return redirect(url_for('home', refilled='true', old_level=old_level))
+        flash(f'Amazing! {actions_text}, saving {total_water_saved}L of water! Your water level increased from {old_level}% to {new_level}%.')
+    else:
+        flash('Please select at least one action to refill your water supply!')
     
-    return render_template('refill.html')
+    return redirect(url_for('main.home', refilled='true', old_level=old_level))
 
 # Specific refill routes for different actions
-@app.route('/refill/eco', methods=['POST'])
+@main.route('/refill/eco', methods=['POST'])
 def refill_eco():
-    return refill()
+    return _process_refill({'eco'})
 
-@app.route('/refill/learn', methods=['POST'])
+@main.route('/refill/learn', methods=['POST'])
 def refill_learn():
-    return refill()
+    return _process_refill({'learning'})
 
-@app.route('/refill/donate', methods=['POST'])
+@main.route('/refill/donate', methods=['POST'])
 def refill_donate():
-    return refill()
+    return _process_refill({'donation'})
 
 # Deplete page route
-@app.route('/deplete')
+@main.route('/deplete')
+@replica_reads
 def deplete():
     if 'user_id' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
-    user = User.query.get(session['user_id'])
+    user = user_snapshots.get(session['user_id'])
     if not user:
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
-    return render_template('deplete.html', water_level=user.water_level)
+    return render_template('deplete.html', water_level=displayed_water_level(user.id, user.water_level))
 
 # Learn More page route - displays the impact comparison chart
-@app.route('/learn_more')
+@main.route('/learn_more')
+@page_cache.cached
 def learn_more():
     if 'user_id' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('learn_more.html')
 
 # Progress page route - displays dynamic graphs
-@app.route('/progress')
+@main.route('/progress')
+@replica_reads
 def progress():
     if 'user_id' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
     # Get the real user's water level
-    user = User.query.get(session['user_id'])
+    user = user_snapshots.get(session['user_id'])
     if not user:
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
-    return render_template('progress.html', water_level=user.water_level)
+    dashboard = fast_json.htmlsafe_dumps(dashboard_payload(user)) if DASHBOARD_INLINE else None
+    return render_template('progress.html', water_level=displayed_water_level(user.id, user.water_level),
+                           dashboard=dashboard)
+
+LEADERBOARD_DEFAULT_LIMIT = 10
+LEADERBOARD_MAX_LIMIT = 100
+
+# Community leaderboard, served from the in-memory rankings
+@main.get('/api/leaderboard')
+@replica_reads
+def get_leaderboard():
+    """One page of top savers.
+
+    Query parameters:
+      by     -- 'liters' (total saved, default) or 'streak' (consecutive days saving)
+      offset -- ranks to skip (default 0)
+      limit  -- entries per page (default LEADERBOARD_DEFAULT_LIMIT)
+    Logged-in users also get their own rank as 'me'.
+    """
+    by = request.args.get('by', 'liters')
+    if by not in RANKINGS:
+        return jsonify({'error': f"by must be one of {', '.join(RANKINGS)}"}), 400
+    offset = _int_arg('offset', 0, 0, 10 ** 9)
+    limit = _int_arg('limit', LEADERBOARD_DEFAULT_LIMIT, 1, LEADERBOARD_MAX_LIMIT)
+
+    total, entries = leaderboard.page(by, offset, limit)
+    if entries:
+        names = dict(db.session.execute(
+            db.select(User.id, User.username).where(User.id.in_([e['user_id'] for e in entries]))
+        ).all())
+        for entry in entries:
+            entry['username'] = names.get(entry['user_id'])
+    payload = {'by': by, 'total': total, 'offset': offset, 'entries': entries}
+    if 'user_id' in session:
+        payload['me'] = {'rank': leaderboard.rank_of(session['user_id'], by)}
+    return jsonify(payload)
+
+# Site-wide liters saved and consumed by AI, for the landing page
+@main.get('/api/community-totals')
+@replica_reads
+def get_community_totals():
+    return jsonify(leaderboard.totals())
+
+# Download the action log as NDJSON or CSV, streamed in batches. Holders of
+# EXPORT_TOKEN may export any ?user_id=, or everyone when it is omitted.
+@main.get('/api/user-actions/export')
+@replica_reads
+def export_user_actions():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in action_io.FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(sorted(action_io.FORMATS))}"}), 400
+    token = os.environ.get('EXPORT_TOKEN')
+    if token and request.headers.get('Authorization') == f'Bearer {token}':
+        user_id = request.args.get('user_id', type=int)
+    elif 'user_id' in session:
+        user_id = session['user_id']
+    else:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    engine = db.engine
+    if db_engine.using_replica():
+        engine = db.engines[db_engine.REPLICA_BIND]
+
+    def generate():
+        with engine.connect() as conn:
+            yield from action_io.export_chunks(action_io.iter_actions(conn, UserAction.__table__, user_id), fmt)
+
+    filename = f"user-actions-{'all' if user_id is None else user_id}.{fmt}"
+    return Response(stream_with_context(generate()), mimetype=action_io.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
 
 # API route to get user progress data for graphs
-@app.route('/api/user-progress')
+@main.route('/api/user-progress')
+@replica_reads
 def get_user_progress():
     if 'user_id' not in session:
         return jsonify({'error': 'Not logged in'}), 401
     
-    user_id = session['user_id']
-    
-    # Get all user actions
-    actions = UserAction.query.filter_by(user_id=user_id).all()
-    
-    # Calculate action totals
-    action_totals = {}
-    for action in actions:
-        action_name = action.action_name
-        if action_name not in action_totals:
-            action_totals[action_name] = {
-                'total_water': 0,
-                'total_percentage': 0,
-                'count': 0
-            }
-        
-        action_totals[action_name]['total_water'] += action.water_amount
-        action_totals[action_name]['total_percentage'] += action.percentage_change
-        action_totals[action_name]['count'] += 1
-    
-    # If no actions yet, provide an empty structure
-    if not action_totals:
-        action_totals = {
-            'Short Shower': {'total_water': 0, 'total_percentage': 0, 'count': 0},
-            'Turn Off Water': {'total_water': 0, 'total_percentage': 0, 'count': 0},
-            'Broom Cleaning': {'total_water': 0, 'total_percentage': 0, 'count': 0},
-            'Full Loads': {'total_water': 0, 'total_percentage': 0, 'count': 0},
-            'Scrape Dishes': {'total_water': 0, 'total_percentage': 0, 'count': 0}
+    return jsonify({'action_totals': action_totals(session['user_id'])})
+
+# Actions shown (at zero) on the progress charts before a user has any
+STARTER_ACTIONS = ('Short Shower', 'Turn Off Water', 'Broom Cleaning', 'Full Loads', 'Scrape Dishes')
+
+def _empty_action_totals():
+    return {name: {'total_water': 0, 'total_percentage': 0, 'count': 0} for name in STARTER_ACTIONS}
+
+def action_totals(user_id):
+    """Per-action totals for user_id, read from the precomputed rollups (one row per distinct action)"""
+    # Rounding adjustments aren't something the user did, so they aren't charted
+    rollups = UserActionRollup.query.filter(UserActionRollup.user_id == user_id,
+                                            UserActionRollup.action_name != ROUNDING_ACTION).all()
+    totals = {
+        rollup.action_name: {
+            'total_water': rollup.total_water,
+            'total_percentage': rollup.total_percentage,
+            'count': rollup.count
         }
+        for rollup in rollups
+    }
     
-    return jsonify({'action_totals': action_totals})
+    # If no actions yet, provide an empty structure
+    return totals or _empty_action_totals()
+
+# History window limits (rows per page) and default chart resolution
+HISTORY_DEFAULT_LIMIT = 1000
+HISTORY_MAX_LIMIT = 10000
+HISTORY_MAX_POINTS = 2000
+
+def _actions_before(cursor):
+    """Filter for actions ordered strictly before cursor by (timestamp, id)"""
+    return db.or_(
+        UserAction.timestamp < cursor.timestamp,
+        db.and_(UserAction.timestamp == cursor.timestamp, UserAction.id < cursor.id)
+    )
+
+def _actions_from(first):
+    """Filter for actions ordered at or after first by (timestamp, id)"""
+    return db.or_(
+        UserAction.timestamp > first.timestamp,
+        db.and_(UserAction.timestamp == first.timestamp, UserAction.id >= first.id)
+    )
+
+def _int_arg(name, default, lo, hi):
+    try:
+        value = int(request.args.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    return max(lo, min(hi, value))
 
 # API route to get water level history
-@app.route('/api/water-level-history')
+@main.route('/api/water-level-history')
+@replica_reads
 def get_water_level_history():
+    """Water level history, newest page first.
+
+    Query params:
+      before     -- action id cursor; return only actions older than it
+      before_day -- YYYY-MM-DD cursor into compacted history (one entry per day)
+      limit      -- max actions (or compacted days) in the page (default HISTORY_DEFAULT_LIMIT)
+      points     -- downsample the page to at most this many points
+
+    Compacted days (see compaction.py) are older than every raw action. When
+    a page reaches the oldest raw action, its remaining room is filled with
+    the newest compacted days; next_before_day continues from there.
+    """
     if 'user_id' not in session:
         return jsonify({'error': 'Not logged in'}), 401
     
-    user_id = session['user_id']
-    user = User.query.get(user_id)
+    user = user_snapshots.get(session['user_id'])
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    # Get user actions ordered by timestamp
-    actions = UserAction.query.filter_by(user_id=user_id).order_by(UserAction.timestamp).all()
-    
-    # Build history working backwards from current actual level
-    # This ensures the graph ends at the correct current level
+    limit = _int_arg('limit', HISTORY_DEFAULT_LIMIT, 1, HISTORY_MAX_LIMIT)
+    points = _int_arg('points', 0, 0, HISTORY_MAX_POINTS)
+    before_day = request.args.get('before_day')
+    try:
+        if before_day is not None:
+            before_day = date.fromisoformat(before_day)
+        history = water_level_history(user, limit, points, request.args.get('before', type=int), before_day)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    return jsonify(history)
+
+def water_level_history(user, limit, points=0, before=None, before_day=None):
+    """One page of user's water level history, as /api/water-level-history returns it.
+
+    Raises ValueError if the before cursor isn't one of the user's actions.
+    """
+    user_id = user.id
     actual_level = user.water_level
-    
-    if not actions:
-        # No actions yet, just show current level
-        history = [{'timestamp': 'Current', 'water_level': actual_level, 'action': 'Current Level'}]
+    summaries = UserActionSummary.__table__
+
+    # All queries below are range scans on the (user_id, timestamp) index
+    window = UserAction.query.filter_by(user_id=user_id)
+    cursor = first = None
+    raw_count = change_since = 0
+    has_older_raw = False
+    if before_day is not None:
+        # Compacted-only page: the level at its end is the current level minus
+        # every raw change and every compacted change from before_day on
+        days = compaction.summary_days(db.session, summaries, user_id, before_day, limit + 1)
+        change_since = db.session.query(db.func.coalesce(db.func.sum(UserAction.percentage_change), 0)).filter(
+            UserAction.user_id == user_id
+        ).scalar() + compaction.summary_change(db.session, summaries, user_id, before_day)
     else:
-        # Calculate total change from actions
-        total_action_change = sum(action.percentage_change for action in actions)
-        
-        # Work backwards: if current level is X and total change is Y, starting level was X-Y
-        starting_level = actual_level - total_action_change
-        
-        # Build history starting from calculated starting level
-        history = [{'timestamp': 'Start', 'water_level': starting_level, 'action': 'Initial Level'}]
-        current_level = starting_level
-        
-        for action in actions:
-            current_level = min(100, max(0, current_level + action.percentage_change))
-            history.append({
-                'timestamp': action.timestamp.strftime('%m/%d %H:%M'),
-                'water_level': current_level,
-                'action': action.action_name
-            })
-        
-        # Ensure final level matches actual level (should be the case, but just in case)
-        if history[-1]['water_level'] != actual_level:
-            history[-1]['water_level'] = actual_level
-    
-    # Debug output to help track the issue
-    print(f"DEBUG History: User actual level: {actual_level}%, Action count: {len(actions)}, Final history level: {history[-1]['water_level']}%")
+        if before is not None:
+            cursor = UserAction.query.filter_by(id=before, user_id=user_id).first()
+            if cursor is None:
+                raise ValueError('Invalid cursor')
+            window = window.filter(_actions_before(cursor))
+
+        newest_first = window.order_by(UserAction.timestamp.desc(), UserAction.id.desc())
+        if newest_first.first() is not None:
+            # Oldest action in the page; if there isn't a limit-th row the page reaches the very first action
+            first = newest_first.offset(limit - 1).first()
+            has_older_raw = first is not None and window.filter(_actions_before(first)).first() is not None
+            if first is None:
+                first = window.order_by(UserAction.timestamp, UserAction.id).first()
+            raw_count = window.filter(_actions_from(first)).count()
+
+            # Work backwards: the level before this page is the current level minus
+            # every change recorded from the start of the page up to now
+            change_since = db.session.query(db.func.coalesce(db.func.sum(UserAction.percentage_change), 0)).filter(
+                UserAction.user_id == user_id, _actions_from(first)
+            ).scalar()
+
+        # Room left after the oldest raw action goes to the newest compacted days
+        days = []
+        if not has_older_raw:
+            days = compaction.summary_days(db.session, summaries, user_id, limit=limit - raw_count + 1)
+
+    room = limit - raw_count
+    has_older_days = len(days) > room
+    days = days[:room]
+    next_before_day = None
+    if has_older_days:
+        next_before_day = (days[-1][0] if days else _newest_day_cursor(summaries, user_id)).isoformat()
+
+    count = len(days) + raw_count
+    if count == 0:
+        # No actions (in this page), just show current level
+        history = [{'timestamp': 'Current', 'water_level': actual_level, 'action': 'Current Level'}]
+        return {'history': history, 'current_level': actual_level,
+                'next_before': None, 'next_before_day': None}
+
+    current_level = actual_level - change_since - sum(day[2] for day in days)
+    history = []
+    if not has_older_raw and not has_older_days:
+        history.append({'timestamp': 'Start', 'water_level': current_level, 'action': 'Initial Level'})
+
+    # Oldest compacted day first, then the raw actions in order
+    entries = [(last_timestamp, action_name, change, actions)
+               for _, last_timestamp, change, actions, action_name in reversed(days)]
+    if raw_count:
+        rows = window.filter(_actions_from(first)).order_by(UserAction.timestamp, UserAction.id).with_entities(
+            UserAction.timestamp, UserAction.action_name, UserAction.percentage_change
+        ).yield_per(1000)
+        entries = itertools.chain(entries, ((timestamp, name, change, 1) for timestamp, name, change in rows))
+
+    history.extend(_replay_history(entries, count, current_level, points))
+
+    # On the newest page, ensure final level matches actual level
+    replayed_level = history[-1]['water_level']
+    if cursor is None and before_day is None and replayed_level != actual_level:
+        history[-1]['water_level'] = actual_level
+    events.debug('water_history', user_id=user.id, actual_level=actual_level, actions=raw_count,
+                 compacted_days=len(days), replayed_level=replayed_level, points=len(history))
     
-    return jsonify({
+    return {
         'history': history,
-        'current_level': user.water_level
-    })
+        'current_level': user.water_level,
+        'next_before': first.id if has_older_raw else None,
+        'next_before_day': next_before_day
+    }
+
+def _replay_history(entries, count, level, points):
+    """Chart points for count entries (timestamp, action_name, change, actions) replayed from level.
+
+    Entries are consumed in order as a stream and folded into at most
+    `points` buckets (0 = one point per entry).
+    """
+    history = []
+    buckets = points if 0 < points < count else count
+    bucket, bucket_sum, bucket_size, bucket_actions, bucket_last = 0, 0, 0, 0, None
+    for position, (timestamp, action_name, percentage_change, actions) in enumerate(entries):
+        level = min(100, max(0, level + percentage_change))
+        target = position * buckets // count
+        if target != bucket and bucket_size:
+            history.append(_history_point(bucket_sum, bucket_size, bucket_actions, bucket_last))
+            bucket_sum, bucket_size, bucket_actions = 0, 0, 0
+        bucket = target
+        bucket_sum += level
+        bucket_size += 1
+        bucket_actions += actions
+        bucket_last = (timestamp, action_name)
+    if bucket_size:
+        history.append(_history_point(bucket_sum, bucket_size, bucket_actions, bucket_last))
+    return history
+
+def _newest_day_cursor(summaries, user_id):
+    """A before_day cursor that includes the user's newest compacted day"""
+    newest = compaction.summary_days(db.session, summaries, user_id, limit=1)
+    return newest[0][0] + timedelta(days=1)
+
+def _history_point(level_sum, size, actions, last):
+    """One chart point: the average level over a bucket of entries"""
+    timestamp, action_name = last
+    level = level_sum / size
+    return {
+        'timestamp': timestamp.strftime('%m/%d %H:%M'),
+        'water_level': round(level, 1) if size > 1 else int(level),
+        'action': action_name if actions == 1 and action_name else f'{actions} actions'
+    }
+
+DASHBOARD_DEFAULT_POINTS = 200
+# Render the first dashboard payload into progress.html instead of fetching it
+DASHBOARD_INLINE = os.environ.get('DASHBOARD_INLINE', '0') == '1'
+
+def dashboard_payload(user, points=DASHBOARD_DEFAULT_POINTS):
+    """Action totals and the newest page of water level history.
+
+    Exactly what /api/user-progress and /api/water-level-history?points=N
+    return: the totals come from the rollups and the history covers the same
+    newest HISTORY_DEFAULT_LIMIT raw actions (plus compacted days), so the
+    cost doesn't grow with the user's whole history.
+    """
+    payload = water_level_history(user, HISTORY_DEFAULT_LIMIT, points)
+    payload['action_totals'] = action_totals(user.id)
+    return payload
+
+# Everything the progress page shows, in one request
+@main.get('/api/dashboard')
+@replica_reads
+def get_dashboard():
+    """Action totals plus the newest history page, downsampled to `points`
+
+    The same payload progress.html receives inline (see DASHBOARD_INLINE).
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    user = user_snapshots.get(session['user_id'])
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    points = _int_arg('points', DASHBOARD_DEFAULT_POINTS, 1, HISTORY_MAX_POINTS)
+    return fast_json.response(dashboard_payload(user, points))
+
+# Live water level: conditional GETs for polling, SSE for push
+# Each open stream holds a worker thread for up to WATER_STREAM_MAX_AGE, so by
+# default streams may take a quarter of the gthread pool (gunicorn.conf.py).
+# Whatever the settings, streams never eat into the threads the chat gateway
+# may hold or the last quarter of the pool, which stays free for ordinary requests
+STREAM_THREADS = WORKER_THREADS - WORKER_THREADS // 4 - chat_gateway.max_in_flight - chat_gateway.max_queue
+level_bus = LevelBus(max_streams=max(1, min(int(os.environ.get('WATER_STREAM_MAX', WORKER_THREADS // 4)),
+                                            STREAM_THREADS)))
+WATER_STREAM_HEARTBEAT = 15  # seconds between keep-alives / cross-worker rechecks
+WATER_STREAM_MAX_AGE = 300  # seconds before the browser is asked to reconnect
+
+@main.get('/api/water-level')
+def get_water_level():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    user = user_snapshots.get(session['user_id'])
+    if user is None:
+        return jsonify({'error': 'User not found'}), 404
+    level = displayed_water_level(user.id, user.water_level)
+    
+    # Unchanged level -> 304 with no body
+    response = jsonify({'water_level': level})
+    response.set_etag(f"wl-{session['user_id']}-{level}")
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@main.get('/api/water-level/stream')
+def water_level_stream():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    user_id = session['user_id']
+    try:
+        updates = level_bus.subscribe(user_id)
+    except StreamLimitReached:
+        response = jsonify({'error': 'Too many open streams, poll /api/water-level instead'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(WATER_STREAM_MAX_AGE)
+        return response
+    
+    def current_level():
+        level = db.session.query(User.water_level).filter_by(id=user_id).scalar()
+        db.session.close()  # don't pin a pooled connection for the life of the stream
+        return level
+    
+    def generate():
+        try:
+            level = current_level()
+            yield "retry: 5000\n" + sse_event({'water_level': level}, event='level')
+            deadline = time.monotonic() + WATER_STREAM_MAX_AGE
+            while time.monotonic() < deadline:
+                try:
+                    new_level = updates.get(timeout=WATER_STREAM_HEARTBEAT)
+                except queue.Empty:
+                    # Changes made by other workers aren't published here
+                    new_level = current_level()
+                if new_level != level:
+                    level = new_level
+                    yield sse_event({'water_level': level}, event='level')
+                else:
+                    yield ": keep-alive\n\n"
+        finally:
+            level_bus.unsubscribe(user_id, updates)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
 
 # API route for water level updates (for future use)
-@app.route('/api/water-level', methods=['POST'])
+@main.route('/api/water-level', methods=['POST'])
 def update_water_level():
     data = request.get_json()
     action = data.get('action')  # 'increase' or 'decrease'
@@ -428,71 +1507,28 @@ def update_water_level():
     # For now, just return success
     return jsonify({'status': 'success', 'action': action, 'amount': amount})
 
-# API route to track chatbot interactions and water depletion
-@app.route('/api/track-chatbot', methods=['POST'])
+# API route to track chatbot interactions and water depletion.
+# Compatibility path: /chat now does this accounting itself.
+@main.route('/api/track-chatbot', methods=['POST'])
 def track_chatbot_interaction():
     if 'user_id' not in session:
         return jsonify({'error': 'Not logged in'}), 401
     
     try:
         data = request.get_json()
-        user_message = data.get('user_message', '')
-        bot_response = data.get('bot_response', '')
-        
-        # Calculate word count (user message + bot response)
-        user_words = len(user_message.split())
-        bot_words = len(bot_response.split())
-        total_words = user_words + bot_words
-        
-        # Calculate water depletion: 519 mL per 100 words
-        water_depleted_ml = (total_words / 100) * 519
-        water_depleted_liters = water_depleted_ml / 1000
-        
-        # Fixed percentage decrease: 5% per chatbot interaction
-        percentage_decrease = 5
-        
-        print(f"DEBUG: Total words: {total_words}, User words: {user_words}, Bot words: {bot_words}")
-        print(f"DEBUG: Water depleted: {water_depleted_ml}mL ({water_depleted_liters:.3f}L), Percentage: {percentage_decrease}%")
-        
-        # Get user and update water level
-        user = User.query.get(session['user_id'])
-        if user:
-            old_level = user.water_level
-            print(f"DEBUG: User water level before: {old_level}%")
-            user.use_water(percentage_decrease)
-            new_level = user.water_level
-            print(f"DEBUG: User water level after: {new_level}%")
-            
-            # Record the depletion action
-            depletion_record = UserAction(
-                user_id=user.id,
-                action_type='deplete',
-                action_name='Chatbot Interaction',
-                water_amount=-water_depleted_liters,  # negative for depletion
-                percentage_change=-percentage_decrease  # negative for decrease
-            )
-            db.session.add(depletion_record)
-            db.session.commit()
-            
-            return jsonify({
-                'status': 'success',
-                'user_words': user_words,
-                'bot_words': bot_words,
-                'words_processed': total_words,
-                'water_depleted_ml': round(water_depleted_ml, 2),
-                'water_depleted_liters': round(water_depleted_liters, 3),
-                'percentage_decrease': percentage_decrease,
-                'old_water_level': old_level,
-                'new_water_level': new_level
-            })
-        else:
+        depletion = apply_chat_depletion(
+            session['user_id'], data.get('user_message', ''), data.get('bot_response', '')
+        )
+        if depletion is None:
             return jsonify({'error': 'User not found'}), 404
+        return jsonify(dict(depletion, status='success'))
                         
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 # Route for signup form submission
-@app.route('/signup', methods=['POST'])
+@main.route('/signup', methods=['POST'])
 def signup():
     fullname = request.form.get('fullname')
     email = request.form.get('email')
@@ -502,7 +1538,7 @@ def signup():
     # Validate input
     if not all([fullname, email, username, password]):
         flash('All fields are required!')
-        return redirect(url_for('index') + '#signup-area')
+        return redirect(url_for('main.index') + '#signup-area')
     
     # Check if username or email already exists
     existing_user = User.query.filter(
@@ -514,7 +1550,7 @@ def signup():
             flash('Username already exists! Please choose a different one.')
         else:
             flash('Email already registered! Please use a different email.')
-        return redirect(url_for('index') + '#signup-area')
+        return redirect(url_for('main.index') + '#signup-area')
     
     # Create new user
     try:
@@ -527,44 +1563,91 @@ def signup():
         
         db.session.add(new_user)
         db.session.commit()
+        user_snapshots.invalidate([new_user.id])
         
         flash('Account created successfully! Please log in.')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
         
     except Exception as e:
         db.session.rollback()
         flash('An error occurred. Please try again.')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
 # Logout route
-@app.route('/logout')
+@main.route('/logout')
 def logout():
+    conversations.clear(chat_conversation_id())
     session.clear()
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
+
+# Prometheus scrape endpoint; set METRICS_TOKEN to require "Authorization: Bearer <token>"
+metrics.add_stats('chat_gateway', chat_gateway.stats)
+metrics.add_stats('chat_cache', chat_cache.stats)
+metrics.add_stats('chat_history', conversations.stats)
+metrics.add_stats('chat_knowledge', knowledge.stats)
+metrics.add_stats('user_cache', user_snapshots.stats)
+metrics.add_stats('page_cache', page_cache.stats)
+metrics.add_stats('water_streams', level_bus.stats)
+metrics.add_stats('leaderboard', leaderboard.stats)
+if depletion_buffer is not None:
+    metrics.add_stats('depletion_buffer', depletion_buffer.stats)
+
+@main.get('/metrics')
+def prometheus_metrics():
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def create_app(config=None):
+    """Build the Flask app.
+
+    Cheap by design: no database connection is opened and no OpenAI client
+    is built until a request needs one, and the schema is left to the
+    `migrate` command.
+    """
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SECRET_KEY", "dev")
+    # Compiled templates are cached on disk, so new workers skip Jinja's compile step
+    if os.environ.get("JINJA_BYTECODE_CACHE", "1") != "0":
+        cache_dir = os.environ.get("JINJA_CACHE_DIR")
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_options = dict(app.jinja_options, bytecode_cache=FileSystemBytecodeCache(cache_dir or None))
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_url()
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    replica_url = os.environ.get("DATABASE_REPLICA_URL")
+    if replica_url:
+        replica_url = db_engine.normalize_url(replica_url)
+        app.config["SQLALCHEMY_BINDS"] = {
+            db_engine.REPLICA_BIND: dict(db_engine.engine_options(replica_url), url=replica_url),
+        }
+    if config:
+        app.config.update(config)
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS",
+                          db_engine.engine_options(app.config["SQLALCHEMY_DATABASE_URI"]))
+    
+    db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            db_engine.configure_sqlite(engine)
+    if db_engine.REPLICA_BIND in app.config.get("SQLALCHEMY_BINDS", {}):
+        db_engine.install(app)
+    app.register_blueprint(main)
+    assets.install(app)
+    metrics.install(app)
+    
+    if depletion_buffer is not None:
+        depletion_buffer.flush_fn = partial(flush_depletion_events, app)
+    return app
+
+# gunicorn entry point (app:app)
+app = create_app()
 
 if __name__ == '__main__':
-    # Create database tables and handle migrations
+    # Local development: bring the schema up to date, then serve
     with app.app_context():
-        # First, create all tables
-        db.create_all()
-        
-        # Check if we need to add water_level column to existing users
-        try:
-            # Check if the column exists by trying to query it
-            with db.engine.connect() as conn:
-                conn.execute(db.text("SELECT water_level FROM users LIMIT 1"))  # <-- users
-            print("Water level column already exists!")
-        except Exception:
-            # Column doesn't exist, add it
-            try:
-                with db.engine.connect() as conn:
-                    conn.execute(db.text("ALTER TABLE users ADD COLUMN water_level INTEGER DEFAULT 50"))  # <-- users
-                    conn.commit()
-                print("Added water_level column to existing users!")
-            except Exception as e:
-                print(f"Error adding column (might already exist): {e}")
-        
+        migrations.run_migrations(db.engine, db.metadata)
         print("Database setup complete!")
     
     app.run(debug=True, host='0.0.0.0', port=5001)
-    #testing
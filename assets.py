@@ -0,0 +1,248 @@
+"""Fingerprinted, precompressed static assets.
+
+build() copies every file under static/ (except the output directory)
+to static/dist/ with a content hash in its name, e.g.
+css/style.css -> dist/css/style.3f2a1b9c0d.css, and records the mapping
+in dist/manifest.json:
+
+  - TrueType fonts also get a WOFF2 copy, subset to Latin text and
+    common punctuation and symbols, and the stylesheets' @font-face rules
+    list it first (needs the optional fontTools and brotli packages).
+  - url() references inside stylesheets are rewritten to the
+    fingerprinted names before the stylesheet itself is hashed.
+  - Compressible files get .gz and (with brotli installed) .br siblings.
+
+install(app) makes url_for('static', filename=...) return the
+fingerprinted path for anything in the manifest and serves dist/ files
+with ``Cache-Control: immutable`` for a year, picking the .br or .gz
+variant from Accept-Encoding. A changed name is a changed file, so
+browsers never revalidate. Without a manifest (build not run) the
+ordinary static files are served as before. Entries whose source file
+changed since the build are ignored, so a stale build never hides an
+edit.
+"""
+import gzip
+import hashlib
+import importlib.util
+import io
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+from flask import request, send_from_directory
+
+DIST = "dist"
+MANIFEST = "manifest.json"
+CACHE_SECONDS = 365 * 24 * 3600
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".ttf", ".otf", ".ico"}
+# Latin-1, general punctuation, currency, arrows and a few symbols
+FONT_SUBSET = "U+0020-007E,U+00A0-00FF,U+2010-205E,U+20A0-20BF,U+2190-21FF,U+2122,U+2212"
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+mimetypes.add_type("font/woff2", ".woff2")
+mimetypes.add_type("font/ttf", ".ttf")
+
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)(\s*format\(\s*['"]truetype['"]\s*\))?""")
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def _fingerprinted(path, data):
+    root, ext = posixpath.splitext(path)
+    return f"{root}.{_digest(data)}{ext}"
+
+
+def _sources(static_dir):
+    """Logical paths (posix, relative to static/) of every source asset"""
+    paths = []
+    for directory, subdirs, files in os.walk(static_dir):
+        rel_dir = os.path.relpath(directory, static_dir)
+        if rel_dir == DIST or rel_dir.startswith(DIST + os.sep):
+            subdirs[:] = []
+            continue
+        subdirs.sort()
+        for name in sorted(files):
+            if not name.startswith("."):
+                paths.append(posixpath.normpath(posixpath.join(rel_dir.replace(os.sep, "/"), name)))
+    return paths
+
+
+def _woff2(data, unicodes=FONT_SUBSET):
+    """WOFF2 bytes for a TrueType font, subset to unicodes; None without fontTools/brotli"""
+    if importlib.util.find_spec("brotli") is None:  # fontTools needs it for WOFF2
+        return None
+    try:
+        from fontTools import subset
+        from fontTools.ttLib import TTFont
+    except ImportError:
+        return None
+    font = TTFont(io.BytesIO(data), recalcTimestamp=False)  # a fresh head.modified would change the hash
+    options = subset.Options()
+    options.flavor = "woff2"
+    options.layout_features = ["*"]
+    options.name_IDs = ["*"]
+    options.notdef_outline = True
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=subset.parse_unicodes(unicodes))
+    subsetter.subset(font)
+    out = io.BytesIO()
+    font.flavor = "woff2"
+    font.save(out)
+    return out.getvalue()
+
+
+def _rewrite_css(text, css_path, files):
+    """Point url() references at fingerprinted files, adding WOFF2 ahead of TrueType fonts"""
+    css_dir = posixpath.dirname(css_path)
+    out_dir = posixpath.join(DIST, css_dir)  # where the rewritten stylesheet will live
+
+    def replace(match):
+        quote, target, truetype = match.groups()
+        if re.match(r"^(?:[a-z]+:|/|#)", target):
+            return match.group(0)
+        logical = posixpath.normpath(posixpath.join(css_dir, target))
+        entry = files.get(logical)
+        if entry is None:
+            return match.group(0)
+        url = f"url({quote}{posixpath.relpath(entry['path'], out_dir)}{quote})"
+        if not truetype:
+            return url
+        woff2 = files.get(posixpath.splitext(logical)[0] + ".woff2")
+        url += truetype
+        if woff2 is not None:
+            url = f"url({quote}{posixpath.relpath(woff2['path'], out_dir)}{quote}) format('woff2'), {url}"
+        return url
+
+    return _CSS_URL.sub(replace, text)
+
+
+def _write(static_dir, path, data, compress):
+    target = os.path.join(static_dir, *path.split("/"))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "wb") as f:
+        f.write(data)
+    variants = []
+    if not compress:
+        return variants
+    # mtime=0 keeps rebuilds byte-identical
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data) * 0.9:
+        with open(target + ".gz", "wb") as f:
+            f.write(gz)
+        variants.append("gzip")
+    try:
+        import brotli
+    except ImportError:
+        return variants
+    br = brotli.compress(data, quality=11)
+    if len(br) < len(data) * 0.9:
+        with open(target + ".br", "wb") as f:
+            f.write(br)
+        variants.append("br")
+    return variants
+
+
+def build(static_dir, log=print):
+    """Write static/dist/ and its manifest; returns the manifest's files dict"""
+    dist_dir = os.path.join(static_dir, DIST)
+    if os.path.isdir(dist_dir):
+        shutil.rmtree(dist_dir)
+    os.makedirs(dist_dir)
+    files = {}
+
+    def add(logical, data, source=None):
+        path = _fingerprinted(posixpath.join(DIST, logical), data)
+        encodings = _write(static_dir, path, data, posixpath.splitext(logical)[1] in COMPRESSIBLE)
+        entry = {"path": path, "bytes": len(data), "encodings": encodings}
+        if source is not None:
+            stat = os.stat(os.path.join(static_dir, *source.split("/")))
+            entry["source"] = {"path": source, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        files[logical] = entry
+
+    sources = _sources(static_dir)
+    # Stylesheets last: their contents depend on the other files' names
+    for logical in sorted(sources, key=lambda p: p.endswith(".css")):
+        with open(os.path.join(static_dir, *logical.split("/")), "rb") as f:
+            data = f.read()
+        if logical.endswith(".css"):
+            data = _rewrite_css(data.decode("utf-8"), logical, files).encode("utf-8")
+        elif logical.endswith(".ttf"):
+            woff2 = _woff2(data)
+            if woff2 is None:
+                log(f"{logical}: fontTools/brotli not installed, no WOFF2 copy")
+            else:
+                add(posixpath.splitext(logical)[0] + ".woff2", woff2, source=logical)
+        add(logical, data, source=logical)
+
+    with open(os.path.join(dist_dir, MANIFEST), "w") as f:
+        json.dump({"files": files}, f, indent=1, sort_keys=True)
+    for logical, entry in sorted(files.items()):
+        sizes = ", ".join(
+            f"{encoding} {os.path.getsize(os.path.join(static_dir, *entry['path'].split('/')) + suffix)}"
+            for encoding, suffix in ENCODINGS if encoding in entry["encodings"])
+        log(f"{logical} -> {entry['path']} ({entry['bytes']} bytes{', ' + sizes if sizes else ''})")
+    return files
+
+
+def load_manifest(static_dir):
+    """{logical path: entry} for assets whose source is unchanged since the build"""
+    try:
+        with open(os.path.join(static_dir, DIST, MANIFEST)) as f:
+            files = json.load(f)["files"]
+    except (OSError, ValueError, KeyError):
+        return {}
+    current = {}
+    for logical, entry in files.items():
+        source = entry.get("source")
+        if source is not None:
+            try:
+                stat = os.stat(os.path.join(static_dir, *source["path"].split("/")))
+            except OSError:
+                continue
+            if (stat.st_mtime_ns, stat.st_size) != (source["mtime_ns"], source["size"]):
+                continue
+        current[logical] = entry
+    return current
+
+
+def install(app):
+    """Fingerprinted url_for('static') URLs and an immutable, precompressed dist/ handler"""
+    files = load_manifest(app.static_folder)
+    app.extensions["assets"] = files
+    if not files:
+        return
+    fingerprinted = {entry["path"]: entry for entry in files.values()}
+    default_static = app.view_functions["static"]
+
+    @app.url_defaults
+    def _fingerprint_static(endpoint, values):
+        if endpoint == "static":
+            entry = files.get(values.get("filename"))
+            if entry is not None:
+                values["filename"] = entry["path"]
+
+    def static(filename):
+        entry = fingerprinted.get(filename)
+        if entry is None:
+            return default_static(filename=filename)
+        served, encoding = filename, None
+        for name, suffix in ENCODINGS:
+            if name in entry["encodings"] and request.accept_encodings[name]:
+                served, encoding = filename + suffix, name
+                break
+        response = send_from_directory(app.static_folder, served, max_age=CACHE_SECONDS,
+                                       mimetype=mimetypes.guess_type(filename)[0])
+        response.cache_control.immutable = True
+        response.cache_control.public = True
+        if entry["encodings"]:
+            response.vary.add("Accept-Encoding")
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        return response
+
+    app.view_functions["static"] = static
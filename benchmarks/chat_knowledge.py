@@ -0,0 +1,89 @@
+"""Local-answer rate and latency per path for /chat with the knowledge index.
+
+Starts the stub OpenAI server, then sends a mix of site FAQs and
+open-ended messages to /chat through the Flask test client, each from a
+fresh anonymous session so history does not grow. Prints the share
+answered from the local index and the latency of each path; pass
+--no-local to send everything to the (stub) model for comparison.
+
+    python benchmarks/chat_knowledge.py [--rounds 20] [--latency 0.3] [--no-local] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+QUESTIONS = [
+    "How much water does AI use?",
+    "How much water does ChatGPT use per word?",
+    "How much water does a short shower save?",
+    "Where can I donate?",
+    "What articles can I read to learn more?",
+    "Give me some tips to save water at home",
+    "Write a haiku about rivers",
+    "Why do data centers need water?",
+]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20, help="times to ask each question")
+    parser.add_argument("--latency", type=float, default=0.3, help="stub model latency in seconds")
+    parser.add_argument("--no-local", action="store_true", help="disable local answers (CHAT_LOCAL_ANSWERS=0)")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    from stub_openai import start_stub_server
+    server, url = start_stub_server(tokens=30, latency=args.latency)
+    db_dir = tempfile.mkdtemp(prefix="drain-knowledge-")
+    os.environ.update(OPENAI_BASE_URL=url, OPENAI_API_KEY="stub",
+                      DATABASE_URL=f"sqlite:///{os.path.join(db_dir, 'bench.db')}",
+                      CHAT_CACHE_TTL="0", CHAT_LOCAL_ANSWERS="0" if args.no_local else "1")
+    import app as drain
+    import migrations
+
+    with drain.app.app_context():
+        migrations.run_migrations(drain.db.engine, drain.db.metadata, log=lambda message: None)
+
+    latencies = {"local": [], "openai": []}
+    for _ in range(args.rounds):
+        for question in QUESTIONS:
+            client = drain.app.test_client()
+            started = time.perf_counter()
+            response = client.post("/chat", json={"message": question})
+            elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                sys.exit(f"/chat returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+            latencies[response.get_json()["source"]].append(elapsed * 1000)
+    server.shutdown()
+
+    total = sum(len(values) for values in latencies.values())
+    result = {"requests": total, "local_fraction": round(len(latencies["local"]) / total, 3),
+              "index": drain.knowledge.stats()}
+    for path, values in latencies.items():
+        result[path] = {"requests": len(values),
+                        "p50_ms": round(statistics.median(values), 2) if values else None,
+                        "p95_ms": round(percentile(values, 0.95), 2) if values else None}
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{total} requests, {result['local_fraction']:.0%} answered locally")
+    for path in ("local", "openai"):
+        stats = result[path]
+        print(f"  {path:>6}: {stats['requests']:5d} requests  p50 {stats['p50_ms']} ms  p95 {stats['p95_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
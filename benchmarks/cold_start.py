@@ -0,0 +1,91 @@
+"""Import-time and cold-start benchmark for app.py and chatbot.py.
+
+Each run is a fresh interpreter, timing:
+  import     -- `import app` (builds the app through create_app())
+  first_page -- the first GET / after import
+  first_db   -- the first request that touches the database
+  chatbot    -- `import chatbot`
+
+Nothing should reach the network or run DDL during these phases. Use
+--max-import-ms to fail when a change makes imports slow again, and
+--json to save results for comparison across commits.
+
+    python benchmarks/cold_start.py [--runs 5] [--json] [--max-import-ms 1500]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import contextlib, io, json, sys, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+client = app.app.test_client()
+client.get('/')
+t2 = time.perf_counter()
+with app.app.app_context():
+    import migrations
+    migrations.run_migrations(app.db.engine, app.db.metadata, log=lambda message: None)
+t3 = time.perf_counter()
+client.post('/login', data={{'username': 'nobody', 'password': 'x'}})
+t4 = time.perf_counter()
+import chatbot
+t5 = time.perf_counter()
+print(json.dumps({{
+    'import': (t1 - t0) * 1000,
+    'first_page': (t2 - t1) * 1000,
+    'first_db': (t4 - t3) * 1000,
+    'chatbot': (t5 - t4) * 1000,
+}}))
+"""
+
+
+def run_once(tmpdir):
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(tmpdir, 'cold.db')}",
+               OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "cold-start-benchmark"),
+               # an unroutable endpoint: any network call at import would hang or fail loudly
+               OPENAI_BASE_URL="http://127.0.0.1:9/v1")
+    out = subprocess.run([sys.executable, "-c", PROBE.format(root=ROOT)], env=env,
+                         capture_output=True, text=True, check=True, cwd=tmpdir)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    parser.add_argument("--max-import-ms", type=float, help="exit non-zero if median import time exceeds this")
+    args = parser.parse_args()
+
+    samples = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory(prefix="drain-cold-") as tmp:
+            samples.append(run_once(tmp))
+
+    phases = list(samples[0])
+    summary = {phase: {"median_ms": round(statistics.median(s[phase] for s in samples), 1),
+                       "max_ms": round(max(s[phase] for s in samples), 1)} for phase in phases}
+    if args.json:
+        print(json.dumps({"runs": args.runs, "phases": summary}, indent=2))
+    else:
+        print(f"{'phase':<12}{'median ms':>12}{'max ms':>10}   ({args.runs} runs)")
+        for phase in phases:
+            print(f"{phase:<12}{summary[phase]['median_ms']:>12}{summary[phase]['max_ms']:>10}")
+
+    if args.max_import_ms is not None and summary["import"]["median_ms"] > args.max_import_ms:
+        print(f"FAILED: median import {summary['import']['median_ms']}ms > {args.max_import_ms}ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
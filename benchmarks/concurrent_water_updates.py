@@ -0,0 +1,93 @@
+"""Hammer one user's water level from many threads and check nothing is lost.
+
+Each thread logs in as the same user and runs the same balanced sequence of
+refills (+2%) and chatbot turns (-5%) that never reaches the 0/100 clamps,
+so the final level must equal the starting level exactly. A lost update
+from a read-modify-write race shows up as a non-zero drift.
+
+    python benchmarks/concurrent_water_updates.py [--threads 8] [--rounds 5]
+
+Runs against a throwaway SQLite file unless DATABASE_URL is set.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# +2, +2, -5, +2, +2, -5, +2 ... ends where it started over a full round
+SEQUENCE = ['refill', 'refill', 'chat', 'refill', 'refill', 'chat', 'refill']
+START_LEVEL = 50
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    tmpdir = None
+    if not os.environ.get('DATABASE_URL'):
+        tmpdir = tempfile.mkdtemp(prefix='drain-bench-')
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    sys.path.insert(0, ROOT)
+    from app import app, db, User, UserAction, UserActionRollup  # noqa: E402
+    import migrations  # noqa: E402
+
+    with app.app_context():
+        migrations.run_migrations(db.engine, db.metadata, log=lambda message: None)
+        user = User.query.filter_by(username='hammer').first()
+        if user is None:
+            user = User(fullname='Hammer', email='hammer@example.com', username='hammer')
+            user.set_password('hammer')
+            db.session.add(user)
+        user.water_level = START_LEVEL
+        db.session.commit()
+        user_id = user.id
+        actions_before = UserAction.query.filter_by(user_id=user_id).count()
+
+    errors = []
+    barrier = threading.Barrier(args.threads)
+
+    def worker():
+        client = app.test_client()
+        client.post('/login', data={'username': 'hammer', 'password': 'hammer'})
+        barrier.wait()
+        for _ in range(args.rounds):
+            for step in SEQUENCE:
+                if step == 'refill':
+                    r = client.post('/refill', data={'short-shower': '1'})
+                    ok = r.status_code == 302
+                else:
+                    r = client.post('/api/track-chatbot', json={'user_message': 'hi', 'bot_response': 'hello'})
+                    ok = r.status_code == 200
+                if not ok:
+                    errors.append((step, r.status_code, r.get_data(as_text=True)[:200]))
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    expected_actions = args.threads * args.rounds * len(SEQUENCE)
+    with app.app_context():
+        level = db.session.get(User, user_id).water_level
+        actions = UserAction.query.filter_by(user_id=user_id).count() - actions_before
+        rolled_up = db.session.query(db.func.sum(UserActionRollup.count)).filter_by(user_id=user_id).scalar()
+
+    print(f"threads={args.threads} rounds={args.rounds} requests={expected_actions} errors={len(errors)}")
+    print(f"water_level: start={START_LEVEL} end={level} drift={level - START_LEVEL}")
+    print(f"actions recorded: {actions}/{expected_actions}, rollup count: {rolled_up}")
+    for error in errors[:5]:
+        print("  error:", error)
+
+    ok = not errors and level == START_LEVEL and actions == expected_actions
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
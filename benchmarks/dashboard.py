@@ -0,0 +1,103 @@
+"""Progress-page data: two API calls vs one /api/dashboard request.
+
+Seeds one user with --actions actions in a throwaway SQLite database,
+then times, through the Flask test client:
+  two_calls    -- /api/user-progress + /api/water-level-history?points=200
+  dashboard    -- /api/dashboard (orjson if installed)
+  dashboard_stdlib -- the same with the stdlib encoder
+  progress_inline  -- GET /progress with the payload rendered inline (DASHBOARD_INLINE=1)
+and reports the dashboard body size with and without gzip.
+
+    python benchmarks/dashboard.py [--actions 1000] [--requests 200] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ACTIONS = [("eco", "Short Shower", 40.0, 5), ("eco", "Broom Cleaning", 60.0, 4),
+           ("deplete", "AI Query", 0.5, -2), ("eco", "Full Loads", 30.0, 3)]
+
+
+def time_ms(fn, requests):
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--actions", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    db_dir = tempfile.mkdtemp(prefix="drain-dashboard-")
+    os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(db_dir, 'bench.db')}", USER_CACHE_TTL="5",
+                      DASHBOARD_INLINE="1")
+    import app as drain
+    import fast_json
+    import migrations
+
+    rng = random.Random(7)
+    with drain.app.app_context():
+        migrations.run_migrations(drain.db.engine, drain.db.metadata, log=lambda message: None)
+        user = drain.User(fullname="Bench", email="bench@example.com", username="bench")
+        user.set_password("bench")
+        drain.db.session.add(user)
+        drain.db.session.commit()
+        user_id = user.id
+        start = datetime(2025, 1, 1)
+        rows = []
+        for n in range(args.actions):
+            action_type, name, water, change = rng.choice(ACTIONS)
+            rows.append({"user_id": user_id, "action_type": action_type, "action_name": name,
+                         "water_amount": water, "percentage_change": change,
+                         "timestamp": start + timedelta(minutes=37 * n)})
+        drain.db.session.execute(drain.UserAction.__table__.insert(), rows)
+        drain.db.session.commit()
+        drain.rebuild_action_rollups()
+
+    client = drain.app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = user_id
+
+    def two_calls():
+        client.get("/api/user-progress")
+        client.get("/api/water-level-history?points=200")
+
+    def dashboard():
+        client.get("/api/dashboard?points=200")
+
+    result = {"actions": args.actions, "orjson": fast_json.orjson is not None}
+    two_calls(), dashboard()
+    result["two_calls_ms"] = time_ms(two_calls, args.requests)
+    result["dashboard_ms"] = time_ms(dashboard, args.requests)
+    encoder, fast_json.orjson = fast_json.orjson, None
+    result["dashboard_stdlib_ms"] = time_ms(dashboard, args.requests)
+    fast_json.orjson = encoder
+    result["progress_inline_ms"] = time_ms(lambda: client.get("/progress"), args.requests)
+    result["dashboard_bytes"] = len(client.get("/api/dashboard?points=200").data)
+    result["dashboard_gzip_bytes"] = len(client.get("/api/dashboard?points=200",
+                                                     headers={"Accept-Encoding": "gzip"}).data)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    for key, value in result.items():
+        print(f"{key:<22}{value}")
+
+
+if __name__ == "__main__":
+    main()
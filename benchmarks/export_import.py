@@ -0,0 +1,115 @@
+"""Memory and throughput of the streaming action export and bulk import.
+
+Loads --rows synthetic actions into a throwaway database with the bulk
+importer, exports them as NDJSON and CSV, and reports rows/second plus
+how much each phase grew the process's peak RSS. Export, replay and
+reconcile growth should stay near zero however large --rows gets.
+
+    python benchmarks/export_import.py [--rows 200000] [--users 100] [--database-url URL] [--json]
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import resource
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def synthetic_actions(rows, user_ids):
+    start = datetime.now(timezone.utc) - timedelta(days=365)
+    for n in range(rows):
+        yield {"user_id": user_ids[n % len(user_ids)], "action_type": "deplete",
+               "action_name": "Chatbot Interaction", "water_amount": -0.5, "percentage_change": -5,
+               "timestamp": start + timedelta(seconds=n)}
+
+
+class NullWriter(io.TextIOBase):
+    def write(self, text):
+        return len(text)
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def measure(fn):
+    rss_before = max_rss_mb()
+    started = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - started
+    return {"rows": count, "seconds": round(elapsed, 2), "rows_per_s": round(count / elapsed),
+            "rss_growth_mb": round(max_rss_mb() - rss_before, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--database-url", help="run against this database instead of a temp SQLite file")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory(prefix="drain-export-")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tmp.name, 'export.db')}"
+    sys.path.insert(0, ROOT)
+    import action_io
+    import app as drain
+    import migrations
+
+    table = drain.UserAction.__table__
+    results = {}
+    with drain.app.app_context():
+        migrations.run_migrations(drain.db.engine, drain.db.metadata, log=lambda message: None)
+        with drain.db.engine.begin() as conn:
+            conn.execute(drain.User.__table__.insert(), [
+                {"fullname": f"Export {i}", "email": f"export{i}@example.com", "username": f"export{i}",
+                 "password_hash": "-", "water_level": 50} for i in range(args.users)])
+            user_ids = [row.id for row in conn.execute(drain.db.select(drain.User.id))]
+
+        def load():
+            with drain.db.engine.begin() as conn:
+                return action_io.bulk_insert(conn, table, synthetic_actions(args.rows, user_ids))
+        results["import"] = measure(load)
+
+        for fmt in ("ndjson", "csv"):
+            def export():
+                out, count = NullWriter(), 0
+                with drain.db.engine.connect() as conn:
+                    def counted():
+                        nonlocal count
+                        for rows in action_io.iter_actions(conn, table):
+                            count += len(rows)
+                            yield rows
+                    for chunk in action_io.export_chunks(counted(), fmt):
+                        out.write(chunk)
+                return count
+            results[f"export_{fmt}"] = measure(export)
+
+        def replay():
+            with drain.db.engine.connect() as conn:
+                return sum(1 for _ in action_io.replay_water_levels(conn, table)) and args.rows
+        results["replay_levels"] = measure(replay)
+
+        def reconcile():
+            with drain.db.engine.connect() as conn:
+                for _ in action_io.level_drift(conn, drain.User.__table__, table):
+                    pass
+            return args.rows
+        results["reconcile_levels"] = measure(reconcile)
+    tmp.cleanup()
+
+    if args.json:
+        print(json.dumps({"rows": args.rows, "users": args.users, "phases": results}, indent=2))
+    else:
+        print(f"{'phase':<18}{'rows/s':>12}{'seconds':>10}{'RSS +MB':>10}   ({args.rows} rows)")
+        for phase, r in results.items():
+            print(f"{phase:<18}{r['rows_per_s']:>12}{r['seconds']:>10}{r['rss_growth_mb']:>10}")
+
+
+if __name__ == "__main__":
+    main()
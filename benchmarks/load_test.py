@@ -0,0 +1,446 @@
+"""End-to-end load test for app.py (and optionally chatbot.py) with no OpenAI traffic.
+
+For each database target the script:
+  1. seeds --users synthetic users with --actions UserAction rows each
+     (in a child process, through the app's own models and migrations),
+  2. starts the stub OpenAI server and app.py as real HTTP servers,
+  3. drives a weighted mix of routes from --concurrency virtual users
+     for --duration seconds, each with its own session cookie,
+  4. reports p50/p95/p99 latency, error count and throughput per route.
+
+    python benchmarks/load_test.py --users 200 --actions 500 --duration 30
+    python benchmarks/load_test.py --db sqlite --db postgres \\
+        --postgres-url postgresql://localhost/drain_load --out results/load.json
+    python benchmarks/load_test.py --compare results/load.json
+
+Results (with the git commit, config and per-route numbers) are written as
+JSON with --out; --compare prints p95/rps deltas against an earlier file.
+Anything else in the environment (DEPLETION_WRITE_BEHIND, CHAT_*, ...) is
+passed through to the servers so configurations can be compared.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# route name -> default weight; names are "METHOD path" as reported
+DEFAULT_MIX = {
+    "POST /login": 2,
+    "GET /refill": 5,
+    "POST /refill": 10,
+    "POST /chat": 15,
+    "POST /api/track-chatbot": 20,
+    "GET /api/user-progress": 20,
+    "GET /api/water-level-history": 28,
+}
+CHATBOT_ROUTE = "POST chatbot /chat"
+
+QUESTIONS = [
+    "How much water does one AI chat use?",
+    "Why do data centers need water?",
+    "How can I save water at home?",
+    "Is a short shower really better?",
+    "What does drAIn measure?",
+    "How many liters is a full load of laundry?",
+    "Does turning off the tap matter?",
+    "What is the water cost of 100 words?",
+]
+LOAD_USER_PREFIX = "loadtest-"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_revision():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return rev + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+# --- seeding (runs in a child process so the parent never imports app.py) ---
+
+def seed(args):
+    sys.path.insert(0, ROOT)
+    import app as drain
+    import migrations
+    from werkzeug.security import generate_password_hash
+
+    catalog = [(rule["action_type"], rule["action_name"], rule["water_amount"], rule["percentage_change"])
+               for rule in drain.REFILL_CATALOG["rules"].values()]
+    rng = random.Random(args.seed)
+    password_hash = generate_password_hash("load")  # hashing once keeps seeding fast
+    now = datetime.now(timezone.utc)
+
+    with drain.app.app_context():
+        migrations.run_migrations(drain.db.engine, drain.db.metadata, log=lambda message: None)
+        session = drain.db.session
+        # only ever touches the load test's own users
+        old_ids = [row.id for row in drain.User.query.filter(drain.User.username.startswith(LOAD_USER_PREFIX))]
+        for chunk in range(0, len(old_ids), 500):
+            ids = old_ids[chunk:chunk + 500]
+            session.execute(drain.UserActionRollup.__table__.delete().where(drain.UserActionRollup.user_id.in_(ids)))
+            session.execute(drain.UserAction.__table__.delete().where(drain.UserAction.user_id.in_(ids)))
+            session.execute(drain.User.__table__.delete().where(drain.User.id.in_(ids)))
+        session.commit()
+
+        session.execute(drain.User.__table__.insert(), [
+            {"fullname": f"Load {i}", "email": f"{LOAD_USER_PREFIX}{i}@example.com",
+             "username": f"{LOAD_USER_PREFIX}{i}", "password_hash": password_hash, "water_level": 50}
+            for i in range(args.users)
+        ])
+        user_ids = [row.id for row in drain.User.query.filter(drain.User.username.startswith(LOAD_USER_PREFIX))]
+
+        insert_actions = drain.UserAction.__table__.insert()
+        levels, batch = [], []
+        for user_id in user_ids:
+            level = 50
+            start = now - timedelta(days=args.days)
+            step = timedelta(days=args.days) / max(args.actions, 1)
+            for n in range(args.actions):
+                if rng.random() < 0.6:
+                    row = ("deplete", "Chatbot Interaction", 0.5, -5)
+                else:
+                    row = rng.choice(catalog)
+                level = max(0, min(100, level + row[3]))
+                batch.append({"user_id": user_id, "action_type": row[0], "action_name": row[1],
+                              "water_amount": row[2], "percentage_change": row[3],
+                              "timestamp": start + step * n})
+                if len(batch) >= 5000:
+                    session.execute(insert_actions, batch)
+                    batch = []
+            levels.append({"uid": user_id, "level": level})
+        if batch:
+            session.execute(insert_actions, batch)
+        from sqlalchemy import bindparam
+        session.execute(drain.User.__table__.update()
+                        .where(drain.User.id == bindparam("uid"))
+                        .values(water_level=bindparam("level")), levels)
+        session.commit()
+        drain.rebuild_action_rollups(user_ids)
+    print(json.dumps({"users": len(user_ids), "actions": len(user_ids) * args.actions}))
+
+
+# --- servers ---
+
+def start_process(code, env, port):
+    # stderr goes to a file: the werkzeug request log would fill a pipe and stall the server
+    log = tempfile.TemporaryFile()
+    proc = subprocess.Popen([sys.executable, "-c", code], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=log)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            log.seek(0)
+            raise RuntimeError(f"server exited early:\n{log.read().decode()[-2000:]}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def app_server_code(server, port):
+    if server == "gunicorn":
+        return (f"import sys; sys.argv = ['gunicorn', '-c', 'gunicorn.conf.py', '-b', '127.0.0.1:{port}', "
+                f"'--log-level', 'warning', 'app:app']; from gunicorn.app.wsgiapp import run; run()")
+    return f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"
+
+
+# --- load generation ---
+
+class VirtualUser:
+    """One keep-alive HTTP connection plus the session cookie for one seeded user"""
+
+    def __init__(self, port, username):
+        self.port = port
+        self.username = username
+        self.cookies = {}
+        self.conn = None
+
+    def request(self, method, path, body=None, content_type=None):
+        headers = {}
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        if content_type:
+            headers["Content-Type"] = content_type
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+        for header in response.headers.get_all("Set-Cookie") or []:
+            name, _, rest = header.partition("=")
+            self.cookies[name.strip()] = rest.split(";", 1)[0]
+        if response.getheader("Connection", "").lower() == "close" or response.version == 10:
+            self.conn.close()
+            self.conn = None
+        return response.status
+
+    def login(self):
+        return self.request("POST", "/login", urlencode({"username": self.username, "password": "load"}),
+                            "application/x-www-form-urlencoded")
+
+
+def make_actions(refill_fields, rng, unique_chat):
+    counter = iter(range(10 ** 9))
+
+    def chat_message():
+        message = rng.choice(QUESTIONS)
+        if rng.random() < unique_chat:  # defeat the reply cache for this share of requests
+            message += f" (#{next(counter)})"
+        return json.dumps({"message": message})
+
+    def refill_form():
+        chosen = rng.sample(refill_fields, k=rng.randint(1, 3))
+        return urlencode({field: value for field, value in chosen})
+
+    return {
+        "POST /login": lambda user: user.login(),
+        "GET /refill": lambda user: user.request("GET", "/refill"),
+        "POST /refill": lambda user: user.request("POST", "/refill", refill_form(),
+                                                  "application/x-www-form-urlencoded"),
+        "POST /chat": lambda user: user.request("POST", "/chat", chat_message(), "application/json"),
+        "POST /api/track-chatbot": lambda user: user.request(
+            "POST", "/api/track-chatbot",
+            json.dumps({"user_message": rng.choice(QUESTIONS), "bot_response": "About 519 mL per 100 words."}),
+            "application/json"),
+        "GET /api/user-progress": lambda user: user.request("GET", "/api/user-progress"),
+        "GET /api/water-level-history": lambda user: user.request("GET", "/api/water-level-history"),
+        CHATBOT_ROUTE: lambda user: user.chatbot.request("POST", "/chat", chat_message(), "application/json"),
+    }
+
+
+def drive(args, app_port, chatbot_port, mix):
+    with open(os.path.join(ROOT, "refill_actions.json")) as f:
+        refill_fields = [(a["field"], a.get("value", "on")) for a in json.load(f)["actions"]]
+    routes, weights = zip(*mix.items())
+    samples = {route: [] for route in routes}
+    errors = {route: 0 for route in routes}
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.concurrency + 1)
+    stop_at = [0.0]
+
+    def worker(n):
+        rng = random.Random(args.seed + n)
+        actions = make_actions(refill_fields, rng, args.unique_chat)
+        user = VirtualUser(app_port, f"{LOAD_USER_PREFIX}{n % args.users}")
+        if chatbot_port:
+            user.chatbot = VirtualUser(chatbot_port, None)
+        user.login()
+        local = {route: [] for route in routes}
+        local_errors = {route: 0 for route in routes}
+        barrier.wait()
+        while time.perf_counter() < stop_at[0]:
+            route = rng.choices(routes, weights)[0]
+            started = time.perf_counter()
+            try:
+                status = actions[route](user)
+            except (http.client.HTTPException, OSError):
+                status = 599
+            local[route].append((time.perf_counter() - started) * 1000)
+            if status >= 400:
+                local_errors[route] += 1
+        with lock:
+            for route in routes:
+                samples[route].extend(local[route])
+                errors[route] += local_errors[route]
+
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    started = time.perf_counter()
+    stop_at[0] = started + args.duration
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    report = {}
+    for route in routes:
+        values = sorted(samples[route])
+        report[route] = {
+            "requests": len(values),
+            "errors": errors[route],
+            "rps": round(len(values) / elapsed, 1),
+            "p50_ms": round(percentile(values, 50), 2) if values else None,
+            "p95_ms": round(percentile(values, 95), 2) if values else None,
+            "p99_ms": round(percentile(values, 99), 2) if values else None,
+            "max_ms": round(values[-1], 2) if values else None,
+        }
+    total = sum(len(v) for v in samples.values())
+    return {"seconds": round(elapsed, 2), "requests": total, "rps": round(total / elapsed, 1),
+            "errors": sum(errors.values()), "routes": report}
+
+
+def run_target(args, name, url):
+    env = dict(os.environ, DATABASE_URL=url, OPENAI_API_KEY="load-test")
+    seeded = subprocess.run([sys.executable, os.path.abspath(__file__), "--_seed",
+                             "--users", str(args.users), "--actions", str(args.actions),
+                             "--days", str(args.days), "--seed", str(args.seed)],
+                            env=env, capture_output=True, text=True)
+    if seeded.returncode:
+        raise RuntimeError(f"seeding {name} failed:\n{seeded.stderr[-2000:]}")
+    print(f"[{name}] seeded {json.loads(seeded.stdout.strip().splitlines()[-1])}", file=sys.stderr)
+
+    procs = []
+    try:
+        stub_port = free_port()
+        procs.append(start_process(
+            f"import sys; sys.argv = ['stub', '--port', '{stub_port}', '--latency', '{args.stub_latency}', "
+            f"'--tokens', '{args.stub_tokens}']; sys.path.insert(0, 'benchmarks'); "
+            f"import stub_openai; stub_openai.main()", env, stub_port))
+        env["OPENAI_BASE_URL"] = f"http://127.0.0.1:{stub_port}/v1"
+
+        app_port = free_port()
+        procs.append(start_process(app_server_code(args.server, app_port), env, app_port))
+        chatbot_port = None
+        if args.chatbot:
+            chatbot_port = free_port()
+            procs.append(start_process(
+                f"import chatbot; chatbot.app.run(host='127.0.0.1', port={chatbot_port}, threaded=True)",
+                env, chatbot_port))
+
+        mix = dict(args.mix)
+        if args.chatbot:
+            mix.setdefault(CHATBOT_ROUTE, 10)
+        print(f"[{name}] {args.concurrency} virtual users for {args.duration}s", file=sys.stderr)
+        return drive(args, app_port, chatbot_port, mix)
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def print_report(name, result):
+    print(f"\n== {name}: {result['requests']} requests in {result['seconds']}s "
+          f"({result['rps']} req/s, {result['errors']} errors)")
+    print(f"{'route':<32}{'reqs':>7}{'err':>6}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for route, r in result["routes"].items():
+        fmt = lambda v: "-" if v is None else f"{v:.1f}"
+        print(f"{route:<32}{r['requests']:>7}{r['errors']:>6}{r['rps']:>8}"
+              f"{fmt(r['p50_ms']):>9}{fmt(r['p95_ms']):>9}{fmt(r['p99_ms']):>9}")
+
+
+def print_comparison(old, new):
+    for name, result in new["targets"].items():
+        before = old.get("targets", {}).get(name)
+        if not before:
+            continue
+        print(f"\n== {name}: {old.get('commit')} -> {new.get('commit')}")
+        print(f"{'route':<32}{'p95 before':>12}{'p95 after':>12}{'rps before':>12}{'rps after':>12}")
+        for route, r in result["routes"].items():
+            b = before["routes"].get(route)
+            if b:
+                print(f"{route:<32}{str(b['p95_ms']):>12}{str(r['p95_ms']):>12}{b['rps']:>12}{r['rps']:>12}")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        route, _, weight = part.rpartition("=")
+        if route not in DEFAULT_MIX and route != CHATBOT_ROUTE:
+            raise argparse.ArgumentTypeError(f"unknown route {route!r}")
+        mix[route] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", action="append", choices=["sqlite", "postgres"],
+                        help="database target(s) to run against (default: sqlite)")
+    parser.add_argument("--postgres-url", default=os.environ.get("LOAD_TEST_POSTGRES_URL"),
+                        help="SQLAlchemy URL for --db postgres (or LOAD_TEST_POSTGRES_URL)")
+    parser.add_argument("--users", type=int, default=50, help="synthetic users to seed")
+    parser.add_argument("--actions", type=int, default=200, help="UserAction rows per user")
+    parser.add_argument("--days", type=int, default=90, help="spread seeded actions over this many days")
+    parser.add_argument("--concurrency", type=int, default=8, help="virtual users driving load")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load per target")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="comma-separated 'METHOD /path=weight' pairs")
+    parser.add_argument("--unique-chat", type=float, default=0.5,
+                        help="share of chat messages made unique so the reply cache misses")
+    parser.add_argument("--chatbot", action="store_true", help="also start chatbot.py and send chat to it")
+    parser.add_argument("--server", choices=["werkzeug", "gunicorn"], default="werkzeug")
+    parser.add_argument("--stub-latency", type=float, default=0.2, help="stub OpenAI seconds per call")
+    parser.add_argument("--stub-tokens", type=int, default=40, help="stub OpenAI completion tokens")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write JSON results to this file")
+    parser.add_argument("--compare", help="print deltas against an earlier --out file")
+    parser.add_argument("--_seed", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._seed:
+        seed(args)
+        return 0
+
+    targets = {}
+    for name in args.db or ["sqlite"]:
+        if name == "postgres":
+            if not args.postgres_url:
+                parser.error("--db postgres needs --postgres-url or LOAD_TEST_POSTGRES_URL")
+            targets[name] = run_target(args, name, args.postgres_url)
+        else:
+            with tempfile.TemporaryDirectory(prefix="drain-load-") as tmp:
+                targets[name] = run_target(args, name, f"sqlite:///{os.path.join(tmp, 'load.db')}")
+        print_report(name, targets[name])
+
+    result = {
+        "commit": git_revision(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "_seed", "postgres_url")},
+        "targets": targets,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), result)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nresults written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Requests/second for the landing and Learn More pages with the page cache off vs on.
+
+Each mode runs in a fresh subprocess (settings are read at import)
+against its own throwaway SQLite database. The first request of each
+page is timed separately (template compile, or a Jinja bytecode cache
+load), then --requests GETs are timed per page through the Flask test
+client, plus revalidations with If-None-Match when the cache is on.
+
+    python benchmarks/page_render.py [--requests 2000] [--json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    "uncached": {"PAGE_CACHE": "0", "JINJA_BYTECODE_CACHE": "0"},
+    "cached": {"PAGE_CACHE": "1", "JINJA_BYTECODE_CACHE": "1"},
+}
+
+
+def run_mode(args):
+    """Child process: benchmark the mode selected by the environment"""
+    started = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    import app as drain
+    import migrations
+
+    with drain.app.app_context():
+        migrations.run_migrations(drain.db.engine, drain.db.metadata, log=lambda message: None)
+        user = drain.User(fullname="Bench", email="bench@example.com", username="bench")
+        user.set_password("bench")
+        drain.db.session.add(user)
+        drain.db.session.commit()
+        user_id = user.id
+    anonymous = drain.app.test_client()
+    signed_in = drain.app.test_client()
+    with signed_in.session_transaction() as session:
+        session["user_id"] = user_id
+
+    result = {"import_ms": round((time.perf_counter() - started) * 1000, 1)}
+    for page, client in (("/", anonymous), ("/learn_more", signed_in)):
+        started = time.perf_counter()
+        first = client.get(page)
+        result[f"{page} first_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            if client.get(page).status_code != 200:
+                sys.exit(f"{page} failed")
+        result[f"{page} rps"] = round(args.requests / (time.perf_counter() - started))
+        etag = first.headers.get("ETag")
+        if etag:
+            started = time.perf_counter()
+            for _ in range(args.requests):
+                client.get(page, headers={"If-None-Match": etag})
+            result[f"{page} 304 rps"] = round(args.requests / (time.perf_counter() - started))
+    result["page_cache"] = drain.page_cache.stats()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--_child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args._child:
+        return run_mode(args)
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="drain-pages-") as tmp:
+        for mode, settings in MODES.items():
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, mode + '.db')}",
+                       JINJA_CACHE_DIR=os.path.join(tmp, "jinja"), **settings)
+            if mode == "cached":
+                # Warm the bytecode cache once, as an earlier worker would have
+                warm_db = f"sqlite:///{os.path.join(tmp, 'warm.db')}"
+                subprocess.run([sys.executable, __file__, "--_child", "--requests", "1"],
+                               env=dict(env, DATABASE_URL=warm_db), check=True, stdout=subprocess.DEVNULL)
+            out = subprocess.run([sys.executable, __file__, "--_child", "--requests", str(args.requests)],
+                                 env=env, check=True, capture_output=True, text=True).stdout
+            results[mode] = json.loads(out.strip().splitlines()[-1])
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    keys = [key for key in results["cached"] if key not in ("page_cache", "import_ms")]
+    print(f"{'':<22}{'uncached':>12}{'cached':>12}   ({args.requests} requests per page)")
+    for key in keys:
+        print(f"{key:<22}{str(results['uncached'].get(key, '-')):>12}{str(results['cached'][key]):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Minimal OpenAI-compatible server for local testing and load generation.
+
+Serves POST /v1/chat/completions (plain and ``stream: true``) and
+GET /v1/models without touching the network. Point the apps at it with
+
+    python benchmarks/stub_openai.py --port 8099 --latency 0.3 --tokens 60
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 OPENAI_API_KEY=stub python app.py
+
+Latency is applied before the first byte; --token-delay spaces out the
+streamed chunks so time-to-first-token differs from total time.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("Saving water starts with small habits like shorter showers and "
+         "turning off the tap while you brush your teeth").split()
+
+
+class StubConfig:
+    latency = 0.0
+    tokens = 40
+    token_delay = 0.0
+    fail_models = ()
+
+    def __init__(self, **overrides):
+        for key, value in overrides.items():
+            setattr(self, key, value)
+
+
+def _reply_tokens(n):
+    return [WORDS[i % len(WORDS)] + " " for i in range(n)]
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):  # keep benchmark output clean
+            pass
+
+        def _json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._json(200, {"object": "list", "data": [
+                    {"id": "gpt-4o-mini", "object": "model", "owned_by": "stub"},
+                    {"id": "gpt-4o", "object": "model", "owned_by": "stub"},
+                ]})
+            else:
+                self._json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._json(404, {"error": {"message": "not found"}})
+                return
+
+            model = request.get("model", "gpt-4o-mini")
+            if model in config.fail_models:
+                self._json(404, {"error": {"message": f"The model `{model}` does not exist",
+                                           "code": "model_not_found"}})
+                return
+
+            time.sleep(config.latency)
+            n = min(config.tokens, request.get("max_tokens") or config.tokens)
+            tokens = _reply_tokens(n)
+            prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in request.get("messages", []))
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": n,
+                     "total_tokens": prompt_tokens + n}
+            base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": model}
+
+            if not request.get("stream"):
+                self._json(200, dict(base, object="chat.completion", usage=usage, choices=[{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                }]))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+
+            def send(payload):
+                self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode())
+                self.wfile.flush()
+
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(config.token_delay)
+                delta = {"content": token}
+                if i == 0:
+                    delta["role"] = "assistant"
+                send(dict(base, object="chat.completion.chunk",
+                          choices=[{"index": 0, "delta": delta, "finish_reason": None}]))
+            send(dict(base, object="chat.completion.chunk",
+                      choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+            if (request.get("stream_options") or {}).get("include_usage"):
+                send(dict(base, object="chat.completion.chunk", choices=[], usage=usage))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+    return Handler
+
+
+def start_stub_server(port=0, **overrides):
+    """Start the stub in a daemon thread; returns (server, base_url)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(StubConfig(**overrides)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible server")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before the first byte")
+    parser.add_argument("--tokens", type=int, default=40, help="completion tokens per reply")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--fail-model", action="append", default=[], help="answer model_not_found for this model")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(StubConfig(
+        latency=args.latency, tokens=args.tokens, token_delay=args.token_delay,
+        fail_models=tuple(args.fail_model),
+    )))
+    print(f"Stub OpenAI server on http://127.0.0.1:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Requests/second for chatbot depletion tracking with write-behind off vs on.
+
+Each mode runs in a fresh subprocess (the mode is read at import) against
+its own throwaway SQLite database. Worker threads, each logged in as one
+of --users users, POST /api/track-chatbot through the Flask test client.
+After the run the buffer is drained, and the script checks that every
+request produced exactly one user_actions row.
+
+    python benchmarks/write_behind.py [--threads 8] [--requests 2000] [--users 8] [--json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_mode(args):
+    """Child process: benchmark the mode selected by DEPLETION_WRITE_BEHIND"""
+    sys.path.insert(0, ROOT)
+    import app as drain
+    import migrations
+
+    with drain.app.app_context():
+        migrations.run_migrations(drain.db.engine, drain.db.metadata, log=lambda message: None)
+        for i in range(args.users):
+            user = drain.User(fullname=f"Bench {i}", email=f"bench{i}@example.com", username=f"bench{i}")
+            user.set_password("bench")
+            drain.db.session.add(user)
+        drain.db.session.commit()
+
+    per_thread = args.requests // args.threads
+    barrier = threading.Barrier(args.threads + 1)
+    errors = []
+
+    def worker(n):
+        client = drain.app.test_client()
+        client.post("/login", data={"username": f"bench{n % args.users}", "password": "bench"})
+        barrier.wait()
+        for _ in range(per_thread):
+            r = client.post("/api/track-chatbot", json={"user_message": "how much water", "bot_response": "about 519 mL"})
+            if r.status_code != 200:
+                errors.append(r.status_code)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    if drain.depletion_buffer is not None:
+        drain.depletion_buffer.stop()
+
+    with drain.app.app_context():
+        rows = drain.UserAction.query.count()
+    total = per_thread * args.threads
+    return {
+        "write_behind": drain.depletion_buffer is not None,
+        "requests": total,
+        "errors": len(errors),
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "rows_written": rows,
+        "consistent": rows == total - len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_mode(args)))
+        return 0
+
+    results = []
+    for enabled in ("0", "1"):
+        with tempfile.TemporaryDirectory(prefix="drain-bench-") as tmp:
+            env = dict(os.environ, DEPLETION_WRITE_BEHIND=enabled,
+                       DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            child = [sys.executable, __file__, "--child", "--threads", str(args.threads),
+                     "--requests", str(args.requests), "--users", str(args.users)]
+            out = subprocess.run(child, env=env, capture_output=True, text=True, check=True)
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'mode':<14}{'requests':>10}{'seconds':>10}{'req/s':>10}{'rows ok':>9}")
+        for r in results:
+            mode = "write-behind" if r["write_behind"] else "synchronous"
+            print(f"{mode:<14}{r['requests']:>10}{r['seconds']:>10}{r['rps']:>10}{str(r['consistent']):>9}")
+        if len(results) == 2 and results[0]["rps"]:
+            print(f"speedup: {results[1]['rps'] / results[0]['rps']:.2f}x")
+    return 0 if all(r["consistent"] and not r["errors"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
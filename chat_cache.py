@@ -0,0 +1,162 @@
+"""Response cache for /chat.
+
+Many chat questions are the same few water-conservation FAQs. Replies are
+cached under a hash of the normalized conversation plus the model and
+sampling parameters, with a TTL. Only first turns (system prompt plus
+the message) are worth caching; a prompt carrying a user's history is
+unique to them, so callers pass key=None for those. The default backend is an in-process
+LRU; set CHAT_CACHE_URL=redis://... to share entries across gunicorn
+workers (needs the optional ``redis`` package; configure Redis itself
+with an LRU maxmemory-policy to bound its size).
+
+Concurrent misses for the same key are coalesced: one request calls
+upstream and the others wait for its reply (per process).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+_TRAILING_PUNCTUATION = "?!. "
+
+
+def normalize_text(text):
+    """Case- and whitespace-insensitive form of a message"""
+    return " ".join(str(text).lower().split()).rstrip(_TRAILING_PUNCTUATION)
+
+
+class MemoryBackend:
+    """Size-bounded LRU with per-entry expiry"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Shared backend for multi-worker deployments"""
+
+    def __init__(self, url, prefix="drain:chat:"):
+        import redis  # optional dependency, only needed for a shared cache
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self._redis.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self._redis.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ChatCache:
+    def __init__(self, backend, ttl=3600):
+        self.backend = backend
+        self.ttl = ttl
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.uncacheable = 0
+
+    @classmethod
+    def from_env(cls):
+        url = os.environ.get("CHAT_CACHE_URL")
+        if url:
+            backend = RedisBackend(url)
+        else:
+            backend = MemoryBackend(int(os.environ.get("CHAT_CACHE_SIZE", 1024)))
+        return cls(backend, ttl=float(os.environ.get("CHAT_CACHE_TTL", 3600)))
+
+    @staticmethod
+    def key(messages, **params):
+        """Stable key for a conversation and the call parameters"""
+        normalized = [[m.get("role", ""), normalize_text(m.get("content", ""))] for m in messages]
+        payload = json.dumps({"messages": normalized, "params": params}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, or compute it once and cache it (key None: never cached)"""
+        if key is None:
+            with self._lock:
+                self.uncacheable += 1
+            return compute()
+        value = self.backend.get(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+            self.backend.set(key, flight.value, self.ttl)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            stats = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "uncacheable": self.uncacheable,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+            }
+        if hasattr(self.backend, "__len__"):
+            stats["entries"] = len(self.backend)
+        return stats
@@ -0,0 +1,155 @@
+"""Bounded-concurrency gateway for upstream OpenAI calls.
+
+Chat requests used to hold a worker for the whole OpenAI round trip with
+no limit on how many did so at once. The gateway caps the number of
+in-flight upstream calls, lets a bounded number of requests wait for a
+slot, and rejects the rest straight away with GatewayBusy so the server
+can answer 503 + Retry-After instead of tying up every worker thread.
+
+Each waiting or in-flight chat also holds a gunicorn request thread, so
+from_env() keeps both limits within half the worker's thread pool; a
+burst is turned away with 503s while page routes still have threads.
+
+Blocking completions run on a small thread pool (one thread per slot)
+so each call gets a hard deadline; a call abandoned at its deadline
+keeps its slot until its thread finishes. Streamed completions hold a
+slot until the stream is exhausted. All calls share one pooled HTTP client.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+
+class GatewayBusy(Exception):
+    """Raised when every slot is taken and the wait queue is full (or timed out)"""
+
+    def __init__(self, retry_after):
+        super().__init__("Chat service is busy, please retry shortly.")
+        self.retry_after = retry_after
+
+
+class ChatGateway:
+    def __init__(self, max_in_flight=8, max_queue=16, queue_timeout=10.0, call_timeout=30.0, retry_after=5):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.call_timeout = call_timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="openai")
+        self._in_flight = 0
+        self._waiting = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+
+    @classmethod
+    def from_env(cls, worker_threads=16):
+        """Limits sized to the worker's thread pool.
+
+        Every in-flight and every queued chat holds a request thread, so the
+        two together get at most half of worker_threads (by default split
+        evenly); the rest stays free for page routes and level streams.
+        """
+        budget = max(2, worker_threads // 2)
+        max_in_flight = max(1, min(int(os.environ.get("CHAT_MAX_IN_FLIGHT", budget // 2)), budget - 1))
+        max_queue = max(0, min(int(os.environ.get("CHAT_MAX_QUEUE", budget - max_in_flight)), budget - max_in_flight))
+        return cls(
+            max_in_flight=max_in_flight,
+            max_queue=max_queue,
+            queue_timeout=float(os.environ.get("CHAT_QUEUE_TIMEOUT", 10)),
+            call_timeout=float(os.environ.get("OPENAI_TIMEOUT", 30)),
+            retry_after=int(os.environ.get("CHAT_RETRY_AFTER", 5)),
+        )
+
+    def acquire(self):
+        """Take an upstream slot, waiting in the bounded queue if needed"""
+        with self._lock:
+            if self._slots.acquire(blocking=False):
+                self._in_flight += 1
+                return
+            if self._waiting >= self.max_queue:
+                self._rejected += 1
+                raise GatewayBusy(self.retry_after)
+            self._waiting += 1
+
+        acquired = self._slots.acquire(timeout=self.queue_timeout)
+        with self._lock:
+            self._waiting -= 1
+            if acquired:
+                self._in_flight += 1
+            else:
+                self._rejected += 1
+        if not acquired:
+            raise GatewayBusy(self.retry_after)
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+        self._slots.release()
+
+    def call(self, fn, *args, **kwargs):
+        """Run a blocking upstream call on the pool within a slot and the call deadline"""
+        self.acquire()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self.release()
+            raise
+        # The slot follows the pool thread, not the caller: a call abandoned at
+        # the deadline keeps its slot until it really ends, so the next caller
+        # is never queued behind it while the stats say the gateway is idle
+        future.add_done_callback(lambda _: self.release())
+        try:
+            return future.result(timeout=self.call_timeout)
+        except FutureTimeout:
+            with self._lock:
+                self._timed_out += 1
+            raise TimeoutError(f"Upstream call exceeded {self.call_timeout}s")
+
+    def open_stream(self, fn, *args, **kwargs):
+        """Open a streamed completion; the slot is held until the stream is consumed"""
+        self.acquire()
+        try:
+            stream = fn(*args, **kwargs)
+        except BaseException:
+            self.release()
+            raise
+
+        def chunks():
+            try:
+                yield from stream
+            finally:
+                self.release()
+
+        return chunks()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "queued": self._waiting,
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+            }
+
+
+def make_openai_client(api_key, gateway):
+    """OpenAI client on a shared keep-alive connection pool sized to the gateway"""
+    import httpx  # imported here: the openai package is slow to import and only chat needs it
+    from openai import OpenAI
+
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=gateway.max_in_flight,
+                            max_keepalive_connections=gateway.max_in_flight),
+        timeout=httpx.Timeout(gateway.call_timeout, connect=5.0),
+    )
+    # No SDK retries: a retry (after a backoff that honours Retry-After) cannot
+    # fit inside the gateway's call deadline, and ModelRouter already moves a
+    # failed request on to the next model
+    return OpenAI(api_key=api_key, http_client=http_client, max_retries=0)
@@ -0,0 +1,58 @@
+"""Server-Sent Events helpers shared by app.py and chatbot.py.
+
+OpenAI streamed completions arrive as chunks of content deltas; these
+helpers forward each delta to the browser as an SSE ``data:`` event and
+finish with a ``done`` event carrying the full reply and token usage.
+"""
+import json
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',  # stop nginx/Render proxies from buffering the stream
+}
+
+
+def sse_event(data, event=None):
+    """Format one SSE message with a JSON payload"""
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+def usage_dict(usage):
+    """Plain-dict token counts from an OpenAI usage object (or None)"""
+    if usage is None:
+        return None
+    return {
+        'prompt_tokens': usage.prompt_tokens,
+        'completion_tokens': usage.completion_tokens,
+        'total_tokens': usage.total_tokens,
+    }
+
+
+def stream_chat_events(stream, model, on_done=None):
+    """Yield an SSE event per content delta, then a final ``done`` event.
+
+    on_done(reply, usage) may return a dict of extra fields for the final
+    event (e.g. water depletion). Upstream errors mid-stream become an
+    ``error`` event, since the response status has already been sent.
+    """
+    parts = []
+    usage = None
+    try:
+        for chunk in stream:
+            if getattr(chunk, 'usage', None) is not None:
+                usage = usage_dict(chunk.usage)
+            for choice in chunk.choices:
+                delta = choice.delta.content
+                if delta:
+                    parts.append(delta)
+                    yield sse_event({'delta': delta})
+    except Exception as e:
+        yield sse_event({'error': str(e)}, event='error')
+        return
+
+    reply = "".join(parts)
+    done = {'reply': reply, 'model': model, 'usage': usage}
+    if on_done is not None:
+        done.update(on_done(reply, usage))
+    yield sse_event(done, event='done')
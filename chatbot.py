@@ -1,7 +1,10 @@
 import os
-from flask import Flask, request, jsonify
+import threading
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from openai import OpenAI
+from chat_gateway import ChatGateway, GatewayBusy, make_openai_client
+from chat_stream import SSE_HEADERS, sse_event, stream_chat_events
+from model_router import ModelRouter
 
 # --- optional: load local .env in development (ignored in prod if not present) ---
 try:
@@ -18,7 +21,18 @@ if not api_key:
         "Set it in your environment or create a local .env with OPENAI_API_KEY=..."
     )
 
-client = OpenAI(api_key=api_key)
+chat_gateway = ChatGateway.from_env()
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """OpenAI client, built on first request so importing this module stays cheap"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = make_openai_client(api_key, chat_gateway)
+    return _client
 
 app = Flask(__name__)
 # During local dev (file:// or different origin), allow all. Tighten this before prod.
@@ -27,29 +41,8 @@ CORS(app)
 MODEL_PRIMARY = "gpt-4o-mini"
 MODEL_FALLBACK = "gpt-4o"
 
-def pick_model():
-    """Prefer PRIMARY; if unavailable, fall back. Non-fatal errors still return a choice."""
-    for m in (MODEL_PRIMARY, MODEL_FALLBACK):
-        try:
-            # Test with a simple chat completion
-            client.chat.completions.create(
-                model=m, 
-                messages=[{"role": "system", "content": "test"}], 
-                max_tokens=1
-            )
-            print(f"✅ Using model: {m}")
-            return m
-        except Exception as e:
-            msg = str(e).lower()
-            if "model_not_found" in msg or "does not exist" in msg:
-                print(f"⚠️  Model not available: {m}")
-                continue
-            # Other transient errors—still use this model and let /chat handle it.
-            print(f"ℹ️ Non-fatal during model probe for {m}: {e}")
-            return m
-    return MODEL_FALLBACK
-
-MODEL = pick_model()
+# Models are picked per request by the router; nothing is probed at import
+model_router = ModelRouter.from_env([MODEL_PRIMARY, MODEL_FALLBACK], passthrough=(GatewayBusy,))
 
 @app.post("/chat")
 def chat():
@@ -62,34 +55,67 @@ def chat():
     convo.append({"role": "user", "content": user_msg})
 
     try:
-        response = client.chat.completions.create(
-            model=MODEL,
+        response = model_router.call(lambda model: chat_gateway.call(
+            get_client().chat.completions.create,
+            model=model,
             messages=convo,
             max_tokens=150,
             temperature=0.7
-        )
+        ))
         return jsonify({"reply": response.choices[0].message.content})
+    except GatewayBusy:
+        raise
     except Exception as e:
-        # If model gets rejected mid-run, try fallback once
-        msg = str(e).lower()
-        if MODEL != MODEL_FALLBACK and ("model_not_found" in msg or "does not exist" in msg):
-            try:
-                response = client.chat.completions.create(
-                    model=MODEL_FALLBACK,
-                    messages=convo,
-                    max_tokens=150,
-                    temperature=0.7
-                )
-                return jsonify({"reply": response.choices[0].message.content})
-            except Exception as e2:
-                print("Error (fallback):", e2)
-                return jsonify({"reply": f"Error: {str(e2)}"}), 500
         print("Error:", e)
         return jsonify({"reply": f"Error: {str(e)}"}), 500
 
+@app.errorhandler(GatewayBusy)
+def chat_gateway_busy(e):
+    response = jsonify({"reply": str(e)})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+@app.get("/chat/gateway")
+def chat_gateway_stats():
+    """Upstream queue depth and in-flight count, for monitoring"""
+    return jsonify(chat_gateway.stats())
+
+@app.get("/chat/models")
+def model_router_stats():
+    """Per-model circuit state, error rate and latency"""
+    return jsonify(model_router.stats())
+
+@app.post("/chat/stream")
+def chat_stream():
+    """Like /chat, but streams the reply as Server-Sent Events"""
+    data = request.get_json(force=True) or {}
+    history = data.get("messages", [])
+    user_msg = data.get("message", "")
+
+    convo = [{"role": "system", "content": "You are a friendly, concise website assistant."}]
+    convo.extend(history)
+    convo.append({"role": "user", "content": user_msg})
+
+    stream_args = dict(messages=convo, max_tokens=150, temperature=0.7,
+                       stream=True, stream_options={"include_usage": True})
+    try:
+        model, stream = model_router.call(lambda model: (model, chat_gateway.open_stream(
+            get_client().chat.completions.create, model=model, **stream_args
+        )))
+    except GatewayBusy:
+        raise
+    except Exception as e:
+        print("Error:", e)
+        return Response(sse_event({"error": str(e)}, event="error"),
+                        mimetype="text/event-stream", headers=SSE_HEADERS)
+
+    return Response(stream_with_context(stream_chat_events(stream, model)),
+                    mimetype="text/event-stream", headers=SSE_HEADERS)
+
 if __name__ == "__main__":
     try:
-        models = client.models.list()
+        models = get_client().models.list()
         names = [m.id for m in models.data][:15]
         print("Visible models (first 15):", names)
     except Exception:
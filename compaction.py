@@ -0,0 +1,176 @@
+"""Fold old user_actions rows into per-day summaries, optionally archiving them.
+
+Rows older than the horizon are processed in chunks of at most
+``chunk_size`` rows in (user_id, timestamp, id) order, one short
+transaction per chunk:
+
+  1. the raw rows are written to a gzipped NDJSON archive (if enabled),
+  2. they are added to user_action_summaries, one row per user, UTC day
+     and action_name,
+  3. each user's clamped water level is replayed across them from their
+     user_level_checkpoints row (or the starting level), and the new
+     checkpoint is stored,
+  4. the raw rows are deleted.
+
+A chunk either commits completely or not at all, and finished rows are
+gone, so an interrupted run simply resumes where it stopped; re-archiving
+a chunk that failed to commit overwrites the same file. Rollups and
+daily totals are untouched: they already include these rows.
+"""
+import gzip
+import os
+import time
+from datetime import timezone
+
+from sqlalchemy import and_, case, func, select
+
+import action_io
+
+
+def _dialect_insert(conn):
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def _utc_day(timestamp):
+    return (timestamp.astimezone(timezone.utc) if timestamp.tzinfo else timestamp).date()
+
+
+def archive_rows(archive_dir, rows):
+    """Write one chunk of raw rows (tuples in action_io.FIELDS order) to a gzipped NDJSON file"""
+    os.makedirs(archive_dir, exist_ok=True)
+    ids = [row[0] for row in rows]
+    path = os.path.join(archive_dir, f"user_actions-{min(ids)}-{max(ids)}-{len(ids)}.ndjson.gz")
+    partial = path + ".partial"
+    with gzip.open(partial, "wt", encoding="utf-8") as f:
+        for chunk in action_io.export_chunks([rows], "ndjson"):
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(partial, path)
+    return path
+
+
+def compact_chunk(conn, actions, summaries, checkpoints, horizon, after_user_id=0,
+                  chunk_size=action_io.BATCH_SIZE, archive_dir=None):
+    """Compact the next chunk inside the caller's transaction.
+
+    Returns (rows compacted, user id to resume from); 0 rows means done.
+    """
+    rows = conn.execute(
+        select(*(actions.c[name] for name in action_io.FIELDS))
+        .where(actions.c.user_id >= after_user_id, actions.c.timestamp < horizon)
+        .order_by(actions.c.user_id, actions.c.timestamp, actions.c.id)
+        .limit(chunk_size)
+    ).all()
+    if not rows:
+        return 0, after_user_id
+    rows = [tuple(row) for row in rows]
+    if archive_dir:
+        archive_rows(archive_dir, rows)
+
+    insert = _dialect_insert(conn)
+    user_ids = sorted({row[1] for row in rows})
+    levels = dict(conn.execute(
+        select(checkpoints.c.user_id, checkpoints.c.level).where(checkpoints.c.user_id.in_(user_ids))
+    ).all())
+
+    folded = {}
+    last_seen = {}
+    for action_id, user_id, action_type, action_name, water, change, timestamp in rows:
+        key = (user_id, _utc_day(timestamp), action_name)
+        entry = folded.get(key)
+        if entry is None:
+            folded[key] = entry = {"action_type": action_type, "water_amount": 0.0, "percentage_change": 0,
+                                   "count": 0, "first_timestamp": timestamp, "last_timestamp": timestamp}
+        entry["water_amount"] += water
+        entry["percentage_change"] += change
+        entry["count"] += 1
+        entry["last_timestamp"] = max(entry["last_timestamp"], timestamp)
+        entry["first_timestamp"] = min(entry["first_timestamp"], timestamp)
+        level = levels.get(user_id, action_io.START_LEVEL)
+        levels[user_id] = max(0, min(100, level + change))
+        last_seen[user_id] = (timestamp, action_id)
+
+    s = summaries.c
+    for (user_id, day, action_name), entry in folded.items():
+        stmt = insert(summaries).values(user_id=user_id, day=day, action_name=action_name, **entry)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[s.user_id, s.day, s.action_name],
+            set_={
+                "water_amount": s.water_amount + stmt.excluded.water_amount,
+                "percentage_change": s.percentage_change + stmt.excluded.percentage_change,
+                "count": s.count + stmt.excluded.count,
+                "first_timestamp": case((stmt.excluded.first_timestamp < s.first_timestamp,
+                                         stmt.excluded.first_timestamp), else_=s.first_timestamp),
+                "last_timestamp": case((stmt.excluded.last_timestamp > s.last_timestamp,
+                                        stmt.excluded.last_timestamp), else_=s.last_timestamp),
+            },
+        )
+        conn.execute(stmt)
+
+    c = checkpoints.c
+    for user_id, (timestamp, action_id) in last_seen.items():
+        stmt = insert(checkpoints).values(user_id=user_id, level=levels[user_id],
+                                          as_of=timestamp, last_action_id=action_id)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[c.user_id],
+            set_={"level": stmt.excluded.level, "as_of": stmt.excluded.as_of,
+                  "last_action_id": stmt.excluded.last_action_id},
+        )
+        conn.execute(stmt)
+
+    ids = [row[0] for row in rows]
+    for start in range(0, len(ids), 500):  # keep IN lists well under driver parameter limits
+        conn.execute(actions.delete().where(actions.c.id.in_(ids[start:start + 500])))
+    return len(rows), rows[-1][1]
+
+
+def compact(engine, actions, summaries, checkpoints, horizon, chunk_size=action_io.BATCH_SIZE,
+            archive_dir=None, pause=0.0, max_chunks=None, log=print):
+    """Run chunks until nothing older than horizon is left (or max_chunks); returns rows compacted"""
+    total, chunks, after_user_id = 0, 0, 0
+    while max_chunks is None or chunks < max_chunks:
+        with engine.begin() as conn:
+            count, after_user_id = compact_chunk(conn, actions, summaries, checkpoints, horizon,
+                                                 after_user_id, chunk_size, archive_dir)
+        if not count:
+            break
+        total += count
+        chunks += 1
+        log(f"chunk {chunks}: compacted {count} rows (through user {after_user_id}, {total} total)")
+        if pause:
+            time.sleep(pause)  # let other writers in between chunks
+    return total
+
+
+def summary_days(conn, summaries, user_id, before_day=None, limit=None):
+    """Per-day summary totals for one user, newest first: (day, last_timestamp, change, actions, name)"""
+    s = summaries.c
+    stmt = (select(s.day, s.last_timestamp, s.percentage_change, s.count, s.action_name)
+            .where(s.user_id == user_id))
+    if before_day is not None:
+        stmt = stmt.where(s.day < before_day)
+    stmt = stmt.order_by(s.day.desc())
+    days = []
+    for day, last_timestamp, change, count, action_name in conn.execute(stmt):
+        if days and days[-1][0] == day:
+            _, latest, total_change, total_count, _ = days[-1]
+            days[-1] = (day, max(latest, last_timestamp), total_change + change, total_count + count, None)
+        elif limit is not None and len(days) >= limit:
+            break
+        else:
+            days.append((day, last_timestamp, change, count, action_name if count == 1 else None))
+    return days
+
+
+def summary_change(conn, summaries, user_id, from_day):
+    """Sum of summarized level changes for one user on or after from_day"""
+    s = summaries.c
+    return conn.execute(
+        select(func.coalesce(func.sum(s.percentage_change), 0))
+        .where(and_(s.user_id == user_id, s.day >= from_day))
+    ).scalar()
@@ -0,0 +1,145 @@
+"""Server-side chat history with a token budget.
+
+The browser used to send its whole history with every message and all
+of it went to OpenAI, so prompts grew without bound. Conversations now
+live on the server, keyed by user (or an anonymous chat id in the
+session). Each prompt is built from the system prompt, which is always
+kept, and the most recent turns that fit CHAT_HISTORY_TOKEN_BUDGET.
+Older turns are dropped.
+
+Storage reuses the chat cache backends, so CHAT_CACHE_URL also shares
+conversations across workers. Without it each worker keeps its own copy,
+so the browser still sends its recent turns and restore() adopts them
+whenever this worker's copy is missing or behind (the previous turn went
+to another worker).
+"""
+import os
+import threading
+
+from chat_cache import MemoryBackend, RedisBackend
+
+_ENCODING = None
+_ENCODING_LOADED = False
+
+
+def _encoding():
+    """tiktoken's encoding if installed (loaded on first use), else None"""
+    global _ENCODING, _ENCODING_LOADED
+    if not _ENCODING_LOADED:
+        _ENCODING_LOADED = True
+        try:  # exact counts when tiktoken is installed, otherwise a close heuristic
+            import tiktoken
+            _ENCODING = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _ENCODING = None
+    return _ENCODING
+
+# Chat format overhead per message (role markers and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text):
+    """Token count for text; ~4 characters per token without tiktoken"""
+    text = str(text)
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return max(1, (len(text) + 3) // 4) if text else 0
+
+
+def message_tokens(message):
+    return estimate_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ConversationStore:
+    def __init__(self, backend, token_budget=1000, max_messages=50, ttl=86400):
+        self.backend = backend
+        self.token_budget = token_budget
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.shared = not isinstance(backend, MemoryBackend)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.messages_dropped = 0
+
+    @classmethod
+    def from_env(cls):
+        url = os.environ.get("CHAT_CACHE_URL")
+        backend = RedisBackend(url, prefix="drain:conv:") if url else MemoryBackend(
+            int(os.environ.get("CHAT_CONVERSATIONS", 10000)))
+        return cls(
+            backend,
+            token_budget=int(os.environ.get("CHAT_HISTORY_TOKEN_BUDGET", 1000)),
+            max_messages=int(os.environ.get("CHAT_HISTORY_MAX_MESSAGES", 50)),
+            ttl=float(os.environ.get("CHAT_HISTORY_TTL", 86400)),
+        )
+
+    def history(self, conversation_id):
+        return self.backend.get(conversation_id) or []
+
+    def append(self, conversation_id, user_msg, reply):
+        """Record a finished turn, keeping at most max_messages"""
+        history = self.history(conversation_id)
+        history.append({"role": "user", "content": user_msg})
+        history.append({"role": "assistant", "content": reply})
+        self.backend.set(conversation_id, history[-self.max_messages:], self.ttl)
+
+    def restore(self, conversation_id, messages):
+        """Adopt the browser's recent turns when in-process history doesn't end with them"""
+        if self.shared or not isinstance(messages, list):
+            return
+        turns = []
+        for question, reply in zip(messages[::2], messages[1::2]):
+            if not (isinstance(question, dict) and isinstance(reply, dict)):
+                break
+            if question.get("role") != "user" or reply.get("role") != "assistant":
+                break
+            if not (isinstance(question.get("content"), str) and isinstance(reply.get("content"), str)):
+                break
+            turns += [{"role": "user", "content": question["content"]},
+                      {"role": "assistant", "content": reply["content"]}]
+        if turns and self.history(conversation_id)[-2:] != turns[-2:]:
+            self.backend.set(conversation_id, turns[-self.max_messages:], self.ttl)
+
+    def clear(self, conversation_id):
+        self.backend.set(conversation_id, [], 1)
+
+    def build_prompt(self, conversation_id, system_prompt, user_msg):
+        """System prompt + newest history that fits the budget + the new message"""
+        system = {"role": "system", "content": system_prompt}
+        new = {"role": "user", "content": user_msg}
+        history = self.history(conversation_id)
+
+        budget = self.token_budget - message_tokens(system) - message_tokens(new)
+        kept = []
+        # Walk back whole user/assistant turns so a reply never loses its question
+        for start in range(len(history) - 2, -1, -2):
+            turn = history[start:start + 2]
+            cost = sum(message_tokens(m) for m in turn)
+            if cost > budget:
+                break
+            budget -= cost
+            kept[:0] = turn
+
+        convo = [system] + kept + [new]
+        before = message_tokens(system) + sum(message_tokens(m) for m in history) + message_tokens(new)
+        after = sum(message_tokens(m) for m in convo)
+        with self._lock:
+            self.requests += 1
+            self.tokens_before += before
+            self.tokens_after += after
+            self.messages_dropped += len(history) - len(kept)
+        return convo
+
+    def stats(self):
+        with self._lock:
+            n = self.requests or 1
+            return {
+                "requests": self.requests,
+                "token_budget": self.token_budget,
+                "avg_prompt_tokens_before": round(self.tokens_before / n, 1),
+                "avg_prompt_tokens_after": round(self.tokens_after / n, 1),
+                "messages_dropped": self.messages_dropped,
+            }
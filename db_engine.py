@@ -0,0 +1,116 @@
+"""Database engine tuning and optional read-replica routing.
+
+SQLite connections are switched to WAL with synchronous=NORMAL and a
+busy timeout, so readers no longer block the writer and concurrent
+gunicorn workers wait for the write lock instead of failing with
+"database is locked". Postgres gets an explicitly sized pool with
+pre-ping and recycling, so connections dropped by the server or a proxy
+are replaced before a request trips over them.
+
+With DATABASE_REPLICA_URL set, views decorated with @replica_reads run
+their SELECTs on the replica. Writes, flushes and every other view stay
+on the primary. After a request commits, the browser session is pinned
+to the primary for DATABASE_REPLICA_STICKY seconds so users read their
+own writes despite replication lag. Rows read from the replica may lag,
+so process-wide caches must not keep them (see using_replica()).
+"""
+import os
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+REPLICA_BIND = "replica"
+PRIMARY_UNTIL = "db_primary_until"  # browser session key
+
+
+def normalize_url(db_url):
+    """Make sure Postgres URLs use the psycopg v3 driver"""
+    if db_url.startswith("postgres://"):
+        return db_url.replace("postgres://", "postgresql+psycopg://", 1)
+    if db_url.startswith("postgresql://"):
+        return db_url.replace("postgresql://", "postgresql+psycopg://", 1)
+    return db_url
+
+
+def engine_options(db_url):
+    """SQLALCHEMY_ENGINE_OPTIONS for this URL, from the DB_POOL_* settings"""
+    if make_url(db_url).get_backend_name() != "postgresql":
+        return {}
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "1") != "0",
+    }
+
+
+def configure_sqlite(engine):
+    """Apply the SQLITE_* pragmas to every new connection of a SQLite engine"""
+    if engine.dialect.name != "sqlite":
+        return
+    in_memory = engine.url.database in (None, "", ":memory:")
+    journal_mode = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+    synchronous = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+    busy_timeout = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            if not in_memory:  # WAL needs a file; it persists in the database once set
+                cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+            cursor.execute(f"PRAGMA synchronous={synchronous}")
+            cursor.execute(f"PRAGMA busy_timeout={busy_timeout}")
+        finally:
+            cursor.close()
+
+
+class RoutingSession(Session):
+    """Sends SELECTs to the replica while a @replica_reads view is running"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and clause is not None
+                and getattr(clause, "is_select", False)
+                and has_request_context() and g.get("db_use_replica")):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def replica_reads(view):
+    """Let a view's GET/HEAD queries use the replica, unless this browser wrote recently"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method in ("GET", "HEAD") and session.get(PRIMARY_UNTIL, 0) < time.time():
+            g.db_use_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def using_replica():
+    """True while this request's SELECTs are routed to the replica"""
+    return (has_request_context() and bool(g.get("db_use_replica"))
+            and REPLICA_BIND in current_app.config.get("SQLALCHEMY_BINDS", {}))
+
+
+def note_write():
+    """Called after a commit: pin this browser to the primary for a while"""
+    if has_request_context():
+        g.db_wrote = True
+
+
+def install(app):
+    """Set the sticky-primary session flag after requests that committed"""
+    sticky = float(os.environ.get("DATABASE_REPLICA_STICKY", 5))
+
+    @app.after_request
+    def _pin_to_primary(response):
+        if g.get("db_wrote"):
+            session[PRIMARY_UNTIL] = time.time() + sticky
+        return response
@@ -0,0 +1,236 @@
+"""Write-behind buffering for chatbot depletion events.
+
+With DEPLETION_WRITE_BEHIND=1 a chat turn no longer writes to the
+database on the request path. The event goes into a bounded in-process
+queue, and a background thread flushes queued events in batches, one
+transaction per batch. A flush happens when batch_size events are
+waiting or every flush_interval seconds, whichever comes first.
+
+Until a user's events are flushed, the buffer keeps a projected level
+for them (the last known level with their pending changes applied). The
+user who made the request therefore sees their own change at once.
+Remaining events are flushed at interpreter exit. A request that must
+see a user's stored level (a refill) writes just that user's events with
+flush_user().
+
+A batch that fails to write (e.g. "database is locked") goes back to the
+front of the queue and is retried with exponential backoff, keeping its
+users' projected levels. After max_retries failed attempts its events
+are written one at a time, so only an event that still fails is dropped,
+and each drop is logged.
+"""
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+
+class WriteBehindBuffer:
+    def __init__(self, flush_fn, max_size=10000, batch_size=500, interval=0.5,
+                 max_retries=5, max_backoff=30.0, events=None):
+        self.flush_fn = flush_fn  # flush_fn(events) writes one batch, in order
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.events = events  # EventLogger for failed flushes
+        self._attempts = 0  # consecutive failures of the batch at the head of the queue
+        self._retry_at = 0.0
+        self._events = deque()
+        self._projected = {}  # user_id -> [projected level, pending event count]
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # keeps batches in submission order
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self.submitted = 0
+        self.flushed = 0
+        self.batches = 0
+        self.retries = 0
+        self.failed = 0
+        atexit.register(self.stop)
+
+    @classmethod
+    def from_env(cls, flush_fn, events=None):
+        """The configured buffer, or None when write-behind is off"""
+        if os.environ.get("DEPLETION_WRITE_BEHIND", "").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            flush_fn,
+            max_size=int(os.environ.get("DEPLETION_QUEUE_MAX", 10000)),
+            batch_size=int(os.environ.get("DEPLETION_BATCH_SIZE", 500)),
+            interval=float(os.environ.get("DEPLETION_FLUSH_INTERVAL", 0.5)),
+            max_retries=int(os.environ.get("DEPLETION_FLUSH_RETRIES", 5)),
+            events=events,
+        )
+
+    def _ensure_thread(self):
+        # Started lazily (and restarted after fork) so gunicorn workers each get their own
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="depletion-flush", daemon=True)
+            self._thread.start()
+
+    def projected(self, user_id):
+        """Level including this user's unflushed events, or None if nothing is pending"""
+        with self._cond:
+            entry = self._projected.get(user_id)
+            return entry[0] if entry else None
+
+    def submit(self, user_id, delta, row, current_level):
+        """Queue a level change and its user_actions row.
+
+        Returns the projected new level, or None when the queue is full
+        (the caller should then write synchronously).
+        """
+        with self._cond:
+            if len(self._events) >= self.max_size:
+                return None
+            self._ensure_thread()
+            entry = self._projected.setdefault(user_id, [current_level, 0])
+            entry[0] = min(100, max(0, entry[0] + delta))
+            entry[1] += 1
+            self._events.append({"user_id": user_id, "delta": delta, "action": row})
+            self.submitted += 1
+            if len(self._events) >= self.batch_size:
+                self._cond.notify()
+            return entry[0]
+
+    def pending(self, user_id=None):
+        with self._cond:
+            if user_id is None:
+                return len(self._events)
+            entry = self._projected.get(user_id)
+            return entry[1] if entry else 0
+
+    def _run(self):
+        while True:
+            with self._cond:
+                backoff = self._retry_at - time.monotonic()
+                if backoff > 0:
+                    # A failed batch is waiting for its retry; a full queue must not wake us early
+                    self._cond.wait_for(lambda: self._stopping, timeout=backoff)
+                else:
+                    self._cond.wait_for(
+                        lambda: self._stopping or len(self._events) >= self.batch_size,
+                        timeout=self.interval,
+                    )
+                if self._stopping:
+                    return
+            self.flush(max_batches=1)
+
+    def flush(self, max_batches=None, retry=True):
+        """Write queued events now, in order (all of them by default).
+
+        Returns False if a batch failed and was put back for a later retry
+        (retry=False writes its events one by one at once instead).
+        """
+        done = 0
+        while max_batches is None or done < max_batches:
+            with self._flush_lock:
+                with self._cond:
+                    batch = [self._events.popleft() for _ in range(min(self.batch_size, len(self._events)))]
+                if not batch:
+                    return True
+                try:
+                    self.flush_fn(batch)
+                except Exception as e:
+                    if retry and self._attempts + 1 < self.max_retries:
+                        self._requeue(batch, e)
+                        return False
+                    self._flush_each(batch, e)
+                else:
+                    self.flushed += len(batch)
+                    self.batches += 1
+                self._attempts = 0
+                self._settle(batch)
+            done += 1
+        return True
+
+    def flush_user(self, user_id):
+        """Write one user's queued events now, in order, leaving other users' queued.
+
+        Returns False if the write failed; the events then go back to the
+        head of the queue, still in order, and keep their projection.
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch = [event for event in self._events if event["user_id"] == user_id]
+                if not batch:
+                    return True
+                self._events = deque(event for event in self._events if event["user_id"] != user_id)
+            try:
+                self.flush_fn(batch)
+            except Exception as e:
+                with self._cond:
+                    self._events.extendleft(reversed(batch))
+                self._log("warning", "depletion_flush_user_failed", user_id=user_id, events=len(batch),
+                          error=str(e))
+                return False
+            self.flushed += len(batch)
+            self.batches += 1
+            self._settle(batch)
+        return True
+
+    def _requeue(self, batch, error):
+        """Put a failed batch back at the head of the queue and back off"""
+        self._attempts += 1
+        self.retries += 1
+        backoff = min(self.max_backoff, self.interval * 2 ** self._attempts)
+        self._retry_at = time.monotonic() + backoff
+        with self._cond:
+            self._events.extendleft(reversed(batch))
+        self._log("warning", "depletion_flush_retry", events=len(batch), attempt=self._attempts,
+                  backoff_s=backoff, error=str(error))
+
+    def _flush_each(self, batch, error):
+        """Write a repeatedly failing batch event by event, dropping only events that still fail"""
+        self._log("warning", "depletion_flush_per_event", events=len(batch), error=str(error))
+        for event in batch:
+            try:
+                self.flush_fn([event])
+            except Exception as e:
+                self.failed += 1
+                self._log("error", "depletion_dropped", user_id=event["user_id"], delta=event["delta"],
+                          error=str(e))
+            else:
+                self.flushed += 1
+        self.batches += 1
+
+    def _settle(self, batch):
+        """Forget the projections of events that are written (or dropped)"""
+        with self._cond:
+            for event in batch:
+                entry = self._projected.get(event["user_id"])
+                if entry:
+                    entry[1] -= 1
+                    if entry[1] <= 0:
+                        del self._projected[event["user_id"]]
+
+    def _log(self, level, event, **fields):
+        if self.events is not None:
+            getattr(self.events, level)(event, **fields)
+
+    def stop(self):
+        """Stop the flusher and write whatever is still queued"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=5)
+        self.flush(retry=False)  # no later retry at exit
+        self._stopping = False
+        self._thread = None
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": len(self._events),
+                "submitted": self.submitted,
+                "flushed": self.flushed,
+                "batches": self.batches,
+                "retries": self.retries,
+                "failed": self.failed,
+            }
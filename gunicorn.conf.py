@@ -0,0 +1,11 @@
+# Gunicorn settings (picked up automatically from the working directory).
+# Threaded workers keep page routes responsive while chat requests wait on
+# OpenAI; chat_gateway.py caps how many of those threads a chat burst can take
+# (waiting or upstream), sized from GUNICORN_THREADS so pages always have some.
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5001')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
@@ -0,0 +1,267 @@
+"""Local BM25 index over the site's own facts, for answering chat FAQs.
+
+Most chatbot questions are about things the repo already states: the
+water cost of AI text (Data), the refill actions and the liters they save
+(RefillOptions and refill_actions.json) and the Learn More page. Those
+sources are split into short snippets and indexed with BM25.
+
+answer() returns a reply built from the best factual snippets when they
+cover the question well enough (the share of the question's IDF weight
+found in a snippet, so unknown words count against it), share at least
+min_terms of its words and score at least min_score; /chat then replies without calling OpenAI. Otherwise it
+returns the top-k snippets, which system_prompt() adds to the prompt so
+the model sees the site's numbers instead of guessing. Learn More copy is
+only ever used as context, never as a direct answer.
+
+The index is built on first use (a few milliseconds) and shared by all
+requests in the worker.
+"""
+import html
+import json
+import math
+import os
+import re
+import threading
+import time
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+_TAG = re.compile(r"<[^>]+>")
+_SUFFIXES = ("ions", "ion", "ing", "ed", "es", "s", "e")
+STOPWORDS = frozenset("""
+    a about all am an and any are as at be been but by can could did do does for from get give had has have
+    how i if in into is it its just know me much my of on or our please should so some tell than that the
+    them then there these they this to us was we were what when where which who why will with would you your
+""".split())
+
+
+def stem(word):
+    """Crude suffix stripping, enough to match donate/donation/donated"""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def is_number(term):
+    return term.replace(".", "", 1).isdigit()
+
+
+def tokenize(text):
+    return [stem(word) for word in _TOKEN.findall(str(text).lower()) if word not in STOPWORDS]
+
+
+class Snippet:
+    def __init__(self, source, text, keywords="", answerable=True):
+        self.source = source
+        self.text = text
+        self.answerable = answerable  # False: context for the model only
+        self.terms = tokenize(f"{text} {keywords}")
+
+
+def _read(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def data_snippets(path):
+    """Water cost of AI text from the Data notes ("100 words - 519 mL ...")"""
+    text = _read(path)
+    model = re.search(r"^\s*([^\n:]+):", text)
+    cost = re.search(r"(\d+)\s*words\s*-\s*(\d+(?:\.\d+)?)\s*mL", text)
+    if not cost:
+        return []
+    model = model.group(1).strip() if model else "An AI model"
+    words, ml = cost.groups()
+    per_word = re.search(r"deplete\s*(\d+(?:\.\d+)?)\s*mL", text)
+    comparison = re.search(r"\*([^*]+)\*", text)
+    reply = f"An AI chatbot like {model} uses about {ml} mL of water for every {words} words it processes"
+    if comparison:
+        reply += f" ({comparison.group(1).strip()})"
+    reply += "."
+    if per_word:
+        reply += f" drAIn depletes your water by about {per_word.group(1)} mL per word of each chat."
+    return [Snippet("Data", reply, keywords="ai chatgpt gpt cost consume footprint chat conversation prompt")]
+
+
+def refill_option_snippets(path):
+    """One snippet per RefillOptions section: the tips, or the links to donate to or read"""
+    snippets = []
+    for block in re.split(r"\n\s*\n", _read(path)):
+        lines = [line.strip() for line in block.strip().splitlines() if line.strip()]
+        if len(lines) < 2 or not lines[0].endswith(")") and not lines[0].endswith(":"):
+            continue
+        heading = re.sub(r"\(.*?\)", "", lines[0]).strip().rstrip(":").strip()
+        items = [line.lstrip("- ").strip() for line in lines[1:]
+                 if line.startswith("-") and "[user input]" not in line]
+        if not items:
+            continue
+        links = [item for item in items if item.startswith("http")]
+        if links:
+            verb = "donate to" if heading.lower().startswith("donat") else "read"
+            reply = f"{heading}: some places to {verb}: " + ", ".join(links)
+            keywords = "where which organizations charity give support article learn resources links"
+            snippets.append(Snippet("RefillOptions", reply, keywords=keywords))
+        else:
+            tips = "; ".join(items)
+            snippets.append(Snippet("RefillOptions", f"{heading} ways to save water: {tips}.",
+                                    keywords="tips ideas reduce conserve everyday personal"))
+    return snippets
+
+
+def refill_action_snippets(path):
+    """One snippet per refill action in refill_actions.json, with its liters and level gain"""
+    try:
+        with open(path) as f:
+            catalog = json.load(f)
+    except (OSError, ValueError):
+        return []
+    percent_per_liter = catalog.get("percent_per_liter", 0)
+    snippets = []
+    for action in catalog.get("actions", []):
+        gain = max(1, int(action["liters"] * percent_per_liter))
+        reply = (f"{action['name']} saves {action['liters']:g} liters of water; logging it on the Refill page "
+                 f"raises your drAIn water level by about {gain}%.")
+        keywords = f"{action['field'].replace('-', ' ')} {action['type']} refill save action"
+        snippets.append(Snippet("refill_actions.json", reply, keywords=keywords))
+    return snippets
+
+
+def page_snippets(path, source):
+    """Headings and paragraphs of a template, as plain text"""
+    text = re.sub(r"{[{%#].*?[}%#]}", " ", _read(path), flags=re.S)
+    snippets = []
+    for block in re.findall(r"<(p|h[1-3])[^>]*>(.*?)</\1>", text, flags=re.S | re.I):
+        sentence = " ".join(html.unescape(_TAG.sub(" ", block[1])).split())
+        if len(sentence.split()) >= 6:
+            snippets.append(Snippet(source, sentence, answerable=False))
+    return snippets
+
+
+def load_snippets(basedir):
+    return (data_snippets(os.path.join(basedir, "Data"))
+            + refill_action_snippets(os.path.join(basedir, "refill_actions.json"))
+            + refill_option_snippets(os.path.join(basedir, "RefillOptions"))
+            + page_snippets(os.path.join(basedir, "templates", "learn_more.html"), "learn_more"))
+
+
+class KnowledgeIndex:
+    def __init__(self, load_fn, threshold=0.8, top_k=3, answer_locally=True, min_score=1.5, min_terms=2,
+                 k1=1.5, b=0.75):
+        self.load_fn = load_fn
+        self.threshold = threshold
+        self.min_score = min_score
+        self.min_terms = min_terms
+        self.top_k = top_k
+        self.answer_locally = answer_locally
+        self.k1 = k1
+        self.b = b
+        self._snippets = None
+        self._build_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.build_ms = None
+        self.queries = 0
+        self.local_answers = 0
+        self.augmented = 0
+
+    @classmethod
+    def from_env(cls, basedir):
+        return cls(
+            lambda: load_snippets(basedir),
+            threshold=float(os.environ.get("CHAT_LOCAL_THRESHOLD", 0.8)),
+            top_k=int(os.environ.get("CHAT_CONTEXT_SNIPPETS", 3)),
+            answer_locally=os.environ.get("CHAT_LOCAL_ANSWERS", "1") != "0",
+        )
+
+    def _ensure_built(self):
+        if self._snippets is not None:
+            return
+        with self._build_lock:
+            if self._snippets is not None:
+                return
+            started = time.perf_counter()
+            snippets = self.load_fn()
+            postings = {}  # term -> [(snippet index, term frequency)]
+            for n, snippet in enumerate(snippets):
+                counts = {}
+                for term in snippet.terms:
+                    counts[term] = counts.get(term, 0) + 1
+                for term, tf in counts.items():
+                    postings.setdefault(term, []).append((n, tf))
+            total = len(snippets)
+            self._idf = {term: math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+                         for term, docs in postings.items()}
+            self._unknown_idf = math.log(1 + (total + 0.5) / 0.5)  # a term no snippet contains
+            self._postings = postings
+            self._lengths = [len(snippet.terms) for snippet in snippets]
+            self._avg_length = sum(self._lengths) / total if total else 0
+            self._snippets = snippets
+            self.build_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    def search(self, query, k=None):
+        """Best snippets for query as [(bm25 score, coverage, matched words, snippet)], best first
+
+        Coverage and matched words ignore bare numbers: "2" in a question
+        says nothing about which snippet answers it.
+        """
+        self._ensure_built()
+        terms = set(tokenize(query))
+        if not terms or not self._snippets:
+            return []
+        scores = {}
+        for term in terms:
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for n, tf in self._postings[term]:
+                norm = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * self._lengths[n] / self._avg_length))
+                scores[n] = scores.get(n, 0.0) + idf * norm
+        words = {term for term in terms if not is_number(term)}
+        query_weight = sum(self._idf.get(term, self._unknown_idf) for term in words)
+        ranked = sorted(scores.items(), key=lambda item: -item[1])[:k or self.top_k]
+        results = []
+        for n, score in ranked:
+            matched = words.intersection(self._snippets[n].terms)
+            covered = sum(self._idf[term] for term in matched)
+            results.append((score, covered / query_weight if query_weight else 0.0, len(matched), self._snippets[n]))
+        return results
+
+    def answer(self, question):
+        """(reply or None, context snippets) for one chat message; counted for stats()"""
+        results = self.search(question)
+        # Up to two confident factual snippets, e.g. an action's liters and where to do it.
+        # A one-word question like "chat" fully covers any snippet containing it, so a
+        # local answer also needs min_terms of the question's words to match
+        confident = [snippet for score, coverage, matched, snippet in results
+                     if snippet.answerable and coverage >= self.threshold and matched >= self.min_terms
+                     and score >= max(self.min_score, results[0][0] / 2)][:2]
+        # Snippets that only share a common word or two with the question are left out
+        context = [snippet for score, _, _, snippet in results if score >= self.min_score / 3]
+        with self._lock:
+            self.queries += 1
+            if self.answer_locally and confident:
+                self.local_answers += 1
+                return " ".join(snippet.text for snippet in confident), []
+            if context:
+                self.augmented += 1
+        return None, context
+
+    def system_prompt(self, base, snippets):
+        """The base system prompt plus the retrieved facts, if any"""
+        if not snippets:
+            return base
+        facts = "\n".join(f"- {snippet.text}" for snippet in snippets)
+        return f"{base}\n\nFacts from the drAIn site (use them when relevant):\n{facts}"
+
+    def stats(self):
+        with self._lock:
+            return {
+                "snippets": len(self._snippets) if self._snippets is not None else 0,
+                "build_ms": self.build_ms,
+                "queries": self.queries,
+                "local_answers": self.local_answers,
+                "augmented_prompts": self.augmented,
+                "local_fraction": round(self.local_answers / self.queries, 3) if self.queries else 0.0,
+            }
@@ -0,0 +1,189 @@
+"""Community leaderboard and site-wide water totals, kept in memory.
+
+Rankings (liters saved, and current streak of days with a saving action)
+are sorted lists of (-score, user_id), so a page is a slice and a user's
+rank is a bisect; site totals are plain running sums. apply() folds in
+the day-level deltas of each committed transaction, so reads never
+touch user_actions.
+
+Each worker keeps its own copy. reconcile() rebuilds everything from the
+user_daily_totals table (one row per user per active day, not per action)
+every ``reconcile_interval`` seconds and whenever the UTC date changes,
+which picks up other workers' writes and retires broken streaks. The
+loader computes current streaks in the database, so a rebuild reads one
+row per user with a live streak rather than every saving day.
+"""
+import bisect
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+RANKINGS = ("liters", "streak")
+
+
+def utc_today():
+    return datetime.now(timezone.utc).date()
+
+
+class Leaderboard:
+    def __init__(self, load_fn, reconcile_interval=60.0):
+        self.load_fn = load_fn
+        self.reconcile_interval = reconcile_interval
+        self._lock = threading.Lock()
+        self._reconcile_lock = threading.Lock()
+        self._reset()
+        self._loaded_at = None
+        self._loaded_day = None
+        self._reconciles = 0
+        self._updates = 0
+
+    @classmethod
+    def from_env(cls, load_fn):
+        return cls(load_fn, reconcile_interval=float(os.environ.get("LEADERBOARD_RECONCILE_SECONDS", 60)))
+
+    def _reset(self):
+        self._saved = {}    # user_id -> liters saved
+        self._streaks = {}  # user_id -> (days, last saving day)
+        self._rankings = {"liters": [], "streak": []}
+        self._totals = {"liters_saved": 0.0, "liters_consumed": 0.0, "actions": 0}
+
+    def _rerank(self, ranking, user_id, old, new):
+        entries = self._rankings[ranking]
+        if old:
+            index = bisect.bisect_left(entries, (-old, user_id))
+            if index < len(entries) and entries[index] == (-old, user_id):
+                del entries[index]
+        if new:
+            bisect.insort(entries, (-new, user_id))
+
+    # --- writes ---
+
+    def apply(self, deltas):
+        """Fold in committed (user_id, day, liters_saved, liters_consumed, actions) deltas"""
+        if not deltas:
+            return
+        with self._lock:
+            if self._loaded_at is None:
+                return  # nothing loaded yet; the first read loads it all from the database
+            for user_id, day, saved, consumed, actions in deltas:
+                self._totals["liters_saved"] += saved
+                self._totals["liters_consumed"] += consumed
+                self._totals["actions"] += actions
+                if saved <= 0:
+                    continue
+                old = self._saved.get(user_id, 0)
+                self._saved[user_id] = old + saved
+                self._rerank("liters", user_id, old, old + saved)
+
+                days, last = self._streaks.get(user_id, (0, None))
+                if last is None or day > last:
+                    new_days = days + 1 if last is not None and day - last == timedelta(days=1) else 1
+                    self._streaks[user_id] = (new_days, day)
+                    self._rerank("streak", user_id, days, new_days)
+            self._updates += 1
+
+    def reconcile(self):
+        """Rebuild from load_fn(since) -> (saved per user, (user, days, last day) per current streak, totals)"""
+        with self._reconcile_lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        today = utc_today()
+        # A streak is current if its last saving day is today or yesterday
+        saved_rows, streak_rows, totals = self.load_fn(today - timedelta(days=1))
+        saved = {user_id: liters for user_id, liters in saved_rows if liters > 0}
+        streaks = {user_id: (days, last) for user_id, days, last in streak_rows}
+
+        rankings = {
+            "liters": sorted((-liters, user_id) for user_id, liters in saved.items()),
+            "streak": sorted((-days, user_id) for user_id, (days, _) in streaks.items()),
+        }
+        with self._lock:
+            self._saved, self._streaks, self._rankings = saved, streaks, rankings
+            self._totals = {"liters_saved": float(totals["liters_saved"] or 0),
+                            "liters_consumed": float(totals["liters_consumed"] or 0),
+                            "actions": int(totals["actions"] or 0)}
+            self._loaded_at = time.monotonic()
+            self._loaded_day = today
+            self._reconciles += 1
+
+    def invalidate(self):
+        """Force a reload on the next read (after bulk imports or rebuilds)"""
+        with self._lock:
+            self._loaded_at = None
+
+    def _stale(self):
+        with self._lock:
+            if self._loaded_at is None:
+                return True
+            return (time.monotonic() - self._loaded_at > self.reconcile_interval
+                    or self._loaded_day != utc_today())
+
+    def _ensure_fresh(self):
+        if not self._stale():
+            return
+        with self._lock:
+            loaded = self._loaded_at is not None
+        # Before the first load everyone waits for it; afterwards one reader
+        # refreshes while the others keep answering from the current copy
+        if self._reconcile_lock.acquire(blocking=not loaded):
+            try:
+                if self._stale():
+                    self._rebuild()
+            finally:
+                self._reconcile_lock.release()
+
+    # --- reads ---
+
+    def _streak_days(self, user_id, yesterday):
+        days, last = self._streaks.get(user_id, (0, None))
+        return days if last is not None and last >= yesterday else 0
+
+    def page(self, by="liters", offset=0, limit=10):
+        """(ranked user count, [{rank, user_id, liters_saved, streak_days}]) for one page"""
+        self._ensure_fresh()
+        yesterday = utc_today() - timedelta(days=1)
+        with self._lock:
+            entries = self._rankings[by]
+            rows = [
+                {"rank": offset + n + 1, "user_id": user_id,
+                 "liters_saved": round(float(self._saved.get(user_id, 0)), 2),
+                 "streak_days": self._streak_days(user_id, yesterday)}
+                for n, (_, user_id) in enumerate(entries[offset:offset + limit])
+            ]
+            return len(entries), rows
+
+    def rank_of(self, user_id, by="liters"):
+        """1-based rank, or None if the user has no score in this ranking"""
+        self._ensure_fresh()
+        with self._lock:
+            score = self._saved.get(user_id) if by == "liters" else self._streaks.get(user_id, (0,))[0]
+            if not score:
+                return None
+            entries = self._rankings[by]
+            index = bisect.bisect_left(entries, (-score, user_id))
+            if index < len(entries) and entries[index] == (-score, user_id):
+                return index + 1
+            return None
+
+    def totals(self):
+        self._ensure_fresh()
+        with self._lock:
+            return {
+                "liters_saved": round(self._totals["liters_saved"], 2),
+                "liters_consumed_by_ai": round(self._totals["liters_consumed"], 3),
+                "actions": self._totals["actions"],
+                "savers": len(self._rankings["liters"]),
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ranked_users": len(self._rankings["liters"]),
+                "active_streaks": len(self._rankings["streak"]),
+                "reconciles": self._reconciles,
+                "incremental_updates": self._updates,
+                "seconds_since_reconcile": round(time.monotonic() - self._loaded_at, 1)
+                if self._loaded_at is not None else None,
+            }
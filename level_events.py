@@ -0,0 +1,66 @@
+"""In-process fan-out of water level changes to SSE subscribers.
+
+refill() and the chatbot depletion path publish the new level after
+they commit; each open /api/water-level/stream connection has a small
+queue it blocks on. Streams hold a worker thread, so the number open at
+once is capped per process; past the cap the client falls back to
+conditional GETs on /api/water-level.
+"""
+import queue
+import threading
+
+
+class StreamLimitReached(Exception):
+    pass
+
+
+class LevelBus:
+    def __init__(self, max_streams=32):
+        self.max_streams = max_streams
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._open = 0
+        self.published = 0
+        self.rejected = 0
+
+    def subscribe(self, user_id):
+        with self._lock:
+            if self._open >= self.max_streams:
+                self.rejected += 1
+                raise StreamLimitReached()
+            events = queue.Queue(maxsize=8)
+            self._subscribers.setdefault(user_id, set()).add(events)
+            self._open += 1
+            return events
+
+    def unsubscribe(self, user_id, events):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers and events in subscribers:
+                subscribers.discard(events)
+                self._open -= 1
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def publish(self, user_id, level):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+            self.published += 1
+        for events in subscribers:
+            try:
+                events.put_nowait(level)
+            except queue.Full:  # a stalled client only needs the latest level
+                try:
+                    events.get_nowait()
+                except queue.Empty:
+                    pass
+                events.put_nowait(level)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open_streams": self._open,
+                "max_streams": self.max_streams,
+                "published": self.published,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,283 @@
+"""In-process metrics in Prometheus text format, plus sampled event logging.
+
+Metrics.install(app) times every request by route (the URL rule, not the
+raw path, so labels stay bounded) and counts SQL statements and their
+time through SQLAlchemy cursor events; statements run outside a request
+(CLI commands, the write-behind flush thread) are labelled "background".
+OpenAI calls are timed by wrapping the upstream function with
+openai_timer(), which runs inside the gateway slot so queue wait is not
+counted; for streamed completions that is the time until the stream
+opens. Token usage is added per model with record_tokens(), and chat
+latency is split by whether the local index or OpenAI answered.
+
+add_stats() exports the numeric fields of an existing stats() dict (the
+chat gateway, caches, router...) as gauges, so /metrics and the JSON
+monitoring endpoints never disagree.
+
+Every gunicorn worker keeps its own registry; scrape each worker or run
+one worker when exact totals matter.
+"""
+import bisect
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from flask import g, has_request_context, request
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(self.labels, key)} {_format_value(v)}" for key, v in values]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, labels=()):
+        """(sum, count) for one label set"""
+        with self._lock:
+            series = self._series.get(labels)
+            return (series[1], series[2]) if series else (0.0, 0)
+
+    def render(self):
+        with self._lock:
+            series = sorted((key, (list(counts), total, n)) for key, (counts, total, n) in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, n) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = bound if bound == "+Inf" else _format_value(float(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {n}")
+        return lines
+
+
+_registries = []
+_sql_listeners_installed = False
+
+
+class Metrics:
+    def __init__(self, prefix="drain"):
+        self.prefix = prefix
+        self.requests = Counter(f"{prefix}_http_requests_total", "HTTP requests by route and status",
+                                ("method", "route", "status"))
+        self.request_seconds = Histogram(f"{prefix}_http_request_duration_seconds",
+                                         "Time to response headers by route", ("method", "route"))
+        self.sql_per_request = Histogram(f"{prefix}_sql_statements_per_request", "SQL statements run per request",
+                                         ("method", "route"), STATEMENT_BUCKETS)
+        self.sql_statements = Counter(f"{prefix}_sql_statements_total", "SQL statements by route", ("route",))
+        self.sql_seconds = Counter(f"{prefix}_sql_seconds_total", "Time spent in SQL statements by route",
+                                   ("route",))
+        self.openai_seconds = Histogram(f"{prefix}_openai_request_duration_seconds",
+                                        "Upstream OpenAI call latency by model and outcome", ("model", "outcome"))
+        self.chat_seconds = Histogram(f"{prefix}_chat_duration_seconds",
+                                      "Time to answer a chat message by path (local index or OpenAI)", ("path",))
+        self.openai_tokens = Counter(f"{prefix}_openai_tokens_total", "OpenAI tokens by model and kind",
+                                     ("model", "kind"))
+        self._stats = []  # (name, stats function)
+        _registries.append(self)
+
+    def add_stats(self, name, stats_fn):
+        """Export the numeric fields of stats_fn() as <prefix>_<name>_<field> gauges"""
+        self._stats.append((name, stats_fn))
+
+    # --- Flask and SQLAlchemy hooks ---
+
+    def install(self, app):
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        self._install_sql_listeners()
+
+    def _install_sql_listeners(self):
+        # Engine-class listeners see every engine, including ones created later
+        global _sql_listeners_installed
+        if _sql_listeners_installed:
+            return
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        @event.listens_for(Engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+        @event.listens_for(Engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info["metrics_started"].pop()
+            for metrics in _registries:
+                metrics._record_statement(elapsed)
+
+        @event.listens_for(Engine, "handle_error")
+        def _failed(context):
+            started = context.connection.info.get("metrics_started") if context.connection else None
+            if started:
+                started.pop()
+
+        _sql_listeners_installed = True
+
+    def _route(self):
+        rule = request.url_rule
+        return rule.rule if rule is not None else "unmatched"
+
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_statements = 0
+
+    def _finish_request(self, response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            route = self._route()
+            labels = (request.method, route)
+            self.request_seconds.observe(time.perf_counter() - started, labels)
+            self.sql_per_request.observe(g.pop("metrics_statements", 0), labels)
+            self.requests.inc((request.method, route, str(response.status_code)))
+        return response
+
+    def _record_statement(self, elapsed):
+        if has_request_context():
+            route = self._route()
+            if "metrics_statements" in g:
+                g.metrics_statements += 1
+        else:
+            route = "background"
+        self.sql_statements.inc((route,))
+        self.sql_seconds.inc((route,), elapsed)
+
+    # --- OpenAI ---
+
+    def openai_timer(self, model, fn):
+        """Wrap an upstream call so its latency and outcome are recorded"""
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = fn(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                self.openai_seconds.observe(time.perf_counter() - started, (model, outcome))
+        return timed
+
+    def record_tokens(self, model, usage):
+        """Add a usage dict (prompt/completion tokens) to the per-model totals"""
+        if not usage:
+            return
+        for kind in ("prompt", "completion"):
+            self.openai_tokens.inc((model, kind), usage.get(f"{kind}_tokens") or 0)
+
+    # --- exposition ---
+
+    def render(self):
+        lines = []
+        for metric in (self.requests, self.request_seconds, self.sql_per_request, self.sql_statements,
+                       self.sql_seconds, self.openai_seconds, self.chat_seconds, self.openai_tokens):
+            lines += metric.render()
+        for name, stats_fn in self._stats:
+            for field, value in stats_fn().items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    metric = f"{self.prefix}_{name}_{field}"
+                    lines += [f"# TYPE {metric} gauge", f"{metric} {_format_value(value)}"]
+        return "\n".join(lines) + "\n"
+
+
+class EventLogger:
+    """One JSON object per log line, for events on hot paths.
+
+    The level is checked before anything is formatted, so disabled events
+    cost one comparison; enabled events below WARNING are additionally
+    sampled at sample_rate to keep log volume (and stdout writes) bounded.
+    """
+
+    def __init__(self, name, sample_rate=1.0):
+        self.logger = logging.getLogger(name)
+        self.sample_rate = sample_rate
+
+    @classmethod
+    def from_env(cls, name):
+        logger = cls(name, sample_rate=float(os.environ.get("LOG_SAMPLE_RATE", 0.1)))
+        level = os.environ.get("LOG_LEVEL")
+        if level:
+            logger.logger.setLevel(level.upper())
+            if not logger.logger.handlers:  # otherwise only WARNING and up reach stderr
+                handler = logging.StreamHandler()
+                handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+                logger.logger.addHandler(handler)
+                logger.logger.propagate = False
+        return logger
+
+    def log(self, level, event, **fields):
+        if not self.logger.isEnabledFor(level):
+            return
+        if level < logging.WARNING and self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        self.logger.log(level, json.dumps({"event": event, **fields}, default=str))
+
+    def debug(self, event, **fields):
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event, **fields):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event, **fields):
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event, **fields):
+        self.log(logging.ERROR, event, **fields)
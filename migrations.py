@@ -0,0 +1,131 @@
+"""Versioned schema migrations.
+
+Run them with ``flask --app app migrate`` (``--status`` lists what is
+applied). Each migration runs once, in its own transaction, and is
+recorded in the schema_migrations table. Migrations are written to be
+idempotent so databases created by the old import-time create_all()
+can adopt this history safely.
+
+Add a migration by appending a function decorated with @migration and
+the next version number; never renumber or edit an applied one.
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, text
+
+MIGRATIONS = []
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _meta,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def _create_tables(conn, metadata, *names):
+    metadata.create_all(conn, tables=[metadata.tables[name] for name in names], checkfirst=True)
+
+
+@migration(1, "create users and user_actions")
+def _base_tables(conn, metadata):
+    _create_tables(conn, metadata, "users", "user_actions")
+
+
+@migration(2, "add users.water_level to pre-gamification databases")
+def _water_level_column(conn, metadata):
+    columns = {c["name"] for c in inspect(conn).get_columns("users")}
+    if "water_level" not in columns:
+        conn.execute(text("ALTER TABLE users ADD COLUMN water_level INTEGER DEFAULT 50"))
+
+
+@migration(3, "index user_actions on (user_id, timestamp)")
+def _history_index(conn, metadata):
+    existing = {ix["name"] for ix in inspect(conn).get_indexes("user_actions")}
+    for index in metadata.tables["user_actions"].indexes:
+        if index.name not in existing:
+            index.create(conn)
+
+
+@migration(4, "create user_action_rollups and backfill from user_actions")
+def _action_rollups(conn, metadata):
+    _create_tables(conn, metadata, "user_action_rollups")
+    conn.execute(text("DELETE FROM user_action_rollups"))
+    conn.execute(text(
+        "INSERT INTO user_action_rollups (user_id, action_name, total_water, total_percentage, count) "
+        "SELECT user_id, action_name, SUM(water_amount), SUM(percentage_change), COUNT(id) "
+        "FROM user_actions GROUP BY user_id, action_name"
+    ))
+
+
+
+@migration(5, "create user_daily_totals and backfill from user_actions")
+def _daily_totals(conn, metadata):
+    _create_tables(conn, metadata, "user_daily_totals")
+    conn.execute(text("DELETE FROM user_daily_totals"))
+    conn.execute(text(
+        "INSERT INTO user_daily_totals (user_id, day, liters_saved, liters_consumed, actions) "
+        "SELECT user_id, date(timestamp), "
+        "SUM(CASE WHEN water_amount > 0 THEN water_amount ELSE 0 END), "
+        "SUM(CASE WHEN water_amount < 0 THEN -water_amount ELSE 0 END), COUNT(id) "
+        "FROM user_actions GROUP BY user_id, date(timestamp)"
+    ))
+
+
+
+@migration(6, "create user_action_summaries and user_level_checkpoints for compaction")
+def _compaction_tables(conn, metadata):
+    _create_tables(conn, metadata, "user_action_summaries", "user_level_checkpoints")
+
+
+# Refills log a separate rounding adjustment row from this migration's
+# applied_at on; reconcile-levels won't "fix" users with older refill rows
+ROUNDING_ADJUSTMENTS = 7
+
+
+@migration(ROUNDING_ADJUSTMENTS, "mark when refills started logging rounding adjustments")
+def _rounding_adjustments(conn, metadata):
+    pass  # nothing to change: applied_at is the marker
+
+
+def applied_versions(engine):
+    schema_migrations.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        return {row.version for row in conn.execute(schema_migrations.select())}
+
+
+def applied_at(engine, version):
+    """When version was applied, or None if it hasn't been"""
+    schema_migrations.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        return conn.execute(
+            schema_migrations.select().with_only_columns(schema_migrations.c.applied_at)
+            .where(schema_migrations.c.version == version)
+        ).scalar()
+
+
+def pending_migrations(engine):
+    applied = applied_versions(engine)
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def run_migrations(engine, metadata, log=print):
+    """Apply every pending migration in order; returns how many ran"""
+    pending = pending_migrations(engine)
+    for version, description, fn in pending:
+        with engine.begin() as conn:
+            fn(conn, metadata)
+            conn.execute(schema_migrations.insert().values(
+                version=version, description=description, applied_at=datetime.now(timezone.utc)
+            ))
+        log(f"Applied migration {version}: {description}")
+    return len(pending)
@@ -0,0 +1,130 @@
+"""Health-aware model selection with a per-model circuit breaker.
+
+Replaces the import-time probe in chatbot.py and the blind
+primary-then-fallback retry in app.py. Each model tracks recent errors
+and latency. After ``failure_threshold`` consecutive failures its
+circuit opens and traffic goes straight to the next model. Once
+``reset_timeout`` seconds pass, the next request is let through as a
+half-open probe; success closes the circuit again, failure re-opens it.
+Nothing is probed until a real request needs the model.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class _ModelHealth:
+    def __init__(self, window):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.outcomes = deque(maxlen=window)  # True = success
+        self.latency_ms = None  # moving average of successful calls
+        self.last_error = None
+
+
+class ModelRouter:
+    def __init__(self, models, failure_threshold=3, reset_timeout=30.0, window=20, passthrough=()):
+        self.models = list(models)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.passthrough = tuple(passthrough)  # errors that say nothing about model health
+        self._health = {m: _ModelHealth(window) for m in self.models}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, models, passthrough=()):
+        return cls(
+            models,
+            failure_threshold=int(os.environ.get("MODEL_FAILURE_THRESHOLD", 3)),
+            reset_timeout=float(os.environ.get("MODEL_RESET_TIMEOUT", 30)),
+            passthrough=passthrough,
+        )
+
+    def _admit(self, model):
+        """Whether a request may use model now (claims the half-open probe if due)"""
+        health = self._health[model]
+        if health.state == CLOSED:
+            return True
+        if health.state == OPEN and time.monotonic() - health.opened_at >= self.reset_timeout:
+            health.state = HALF_OPEN
+        if health.state == HALF_OPEN and not health.probing:
+            health.probing = True
+            return True
+        return False
+
+    def _record(self, model, ok, latency_ms=None, error=None):
+        with self._lock:
+            health = self._health[model]
+            health.outcomes.append(ok)
+            health.probing = False
+            if ok:
+                health.state = CLOSED
+                health.consecutive_failures = 0
+                health.latency_ms = latency_ms if health.latency_ms is None else (
+                    0.8 * health.latency_ms + 0.2 * latency_ms)
+            else:
+                health.consecutive_failures += 1
+                health.last_error = str(error)[:200]
+                if health.state == HALF_OPEN or health.consecutive_failures >= self.failure_threshold:
+                    health.state = OPEN
+                    health.opened_at = time.monotonic()
+
+    def call(self, fn):
+        """Call fn(model) on the first healthy model, falling through on errors.
+
+        Each model is admitted (claiming its half-open probe) only when its
+        turn comes, so a probe is never claimed for a model that is not
+        called. If every circuit is open the last model is tried anyway, so
+        a request is never refused just because of past failures.
+        """
+        last_error = None
+        tried = False
+        for model in self.models:
+            with self._lock:
+                if not self._admit(model):
+                    continue
+            tried = True
+            ok, value = self._attempt(model, fn)
+            if ok:
+                return value
+            last_error = value
+        if not tried:
+            ok, value = self._attempt(self.models[-1], fn)
+            if ok:
+                return value
+            last_error = value
+        raise last_error
+
+    def _attempt(self, model, fn):
+        """(True, result) or (False, error) for one call, recording its outcome"""
+        started = time.monotonic()
+        try:
+            result = fn(model)
+        except self.passthrough:
+            with self._lock:
+                self._health[model].probing = False
+            raise
+        except Exception as e:
+            self._record(model, False, error=e)
+            return False, e
+        self._record(model, True, latency_ms=(time.monotonic() - started) * 1000)
+        return True, result
+
+    def stats(self):
+        with self._lock:
+            return {
+                model: {
+                    "state": health.state,
+                    "error_rate": round(health.outcomes.count(False) / len(health.outcomes), 3)
+                    if health.outcomes else 0.0,
+                    "consecutive_failures": health.consecutive_failures,
+                    "latency_ms": round(health.latency_ms, 1) if health.latency_ms is not None else None,
+                    "last_error": health.last_error,
+                }
+                for model, health in self._health.items()
+            }
@@ -0,0 +1,131 @@
+"""Rendered-page cache for views whose output only depends on login state.
+
+The landing and Learn More pages render the same HTML for every visitor
+of a kind, so @cached stores the rendered bytes and an ETag per endpoint
+and variant (signed in or anonymous) in a small per-process LRU. Hits
+skip the view and Jinja entirely, and a matching If-None-Match gets a
+304 with no body. Responses are marked ``private, no-cache``, so browsers
+revalidate every time and the cookie-bound variant never lands in a
+shared cache.
+
+A request with flash messages waiting in the session always renders
+fresh and is never stored, so a flash is shown exactly once. Entries
+remember the templates they rendered; when Jinja auto-reloads templates
+(debug mode) an entry is dropped as soon as one of those files changes.
+A deploy starts new processes with an empty cache, and ETags are content
+hashes, so browsers never keep a page from an older build.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request, session, template_rendered
+
+FLASHES = "_flashes"  # where flask.flash() keeps pending messages
+
+
+class PageCache:
+    def __init__(self, max_entries=64, enabled=True):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries = OrderedDict()  # (endpoint, variant) -> (body, etag, headers, templates)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.bypassed = 0
+        self.stale = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(max_entries=int(os.environ.get("PAGE_CACHE_SIZE", 64)),
+                   enabled=os.environ.get("PAGE_CACHE", "1") != "0")
+
+    def _get(self, key, check_templates):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if check_templates and not all(template.is_up_to_date for template in entry[3]):
+                del self._entries[key]
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _render(self, view, args, kwargs):
+        """Run the view, returning (response, templates it rendered)"""
+        templates = []
+
+        def record(sender, template, context, **extra):
+            templates.append(template)
+
+        with template_rendered.connected_to(record, current_app._get_current_object()):
+            response = current_app.make_response(view(*args, **kwargs))
+        return response, templates
+
+    def cached(self, view):
+        """Serve a GET view from the cache, keyed by endpoint and signed-in state"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.enabled or request.method != "GET":
+                return view(*args, **kwargs)
+            if session.get(FLASHES):
+                with self._lock:
+                    self.bypassed += 1
+                return view(*args, **kwargs)
+
+            key = (request.endpoint, "user" if "user_id" in session else "anonymous")
+            # Like Jinja itself, only look for edited templates when auto-reload is on
+            entry = self._get(key, current_app.jinja_env.auto_reload)
+            if entry is None:
+                response, templates = self._render(view, args, kwargs)
+                # Only plain, complete HTML pages are cached
+                if (response.status_code != 200 or response.direct_passthrough
+                        or response.mimetype != "text/html" or session.get(FLASHES)):
+                    return response
+                body = response.get_data()
+                etag = hashlib.sha256(body).hexdigest()[:20]
+                headers = [("Content-Type", response.content_type), ("ETag", f'"{etag}"'),
+                           ("Cache-Control", "private, no-cache")]
+                entry = (body, etag, headers, tuple(templates))
+                self._set(key, entry)
+
+            # Headers are prebuilt per entry; a hit costs little more than a dict lookup
+            body, etag, headers, _ = entry
+            if etag in request.if_none_match:
+                with self._lock:
+                    self.not_modified += 1
+                return current_app.response_class(status=304, headers=headers[1:])
+            return current_app.response_class(body, headers=headers)
+        return wrapper
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "not_modified": self.not_modified,
+                "bypassed_for_flashes": self.bypassed,
+                "stale_templates": self.stale,
+            }
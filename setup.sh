@@ -22,6 +22,14 @@ else
     echo "✅ .env file already exists."
 fi
 
+# Create or upgrade the database schema
+echo "🗄️  Applying database migrations..."
+python3 -m flask --app app migrate
+
+# Fingerprint and precompress static assets (fonts get WOFF2 copies)
+echo "🎨 Building static assets..."
+python3 -m flask --app app build-assets > /dev/null
+
 echo ""
 echo "🎉 Setup complete!"
 echo ""
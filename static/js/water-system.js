@@ -1,46 +1,53 @@
 // Water Management System
+// Keeps the page's waves (.home-waves[data-water-level]) in step with the
+// user's level as it changes elsewhere, e.g. a refill in another tab or a
+// chat on another device.
 class WaterSystem {
-    constructor() {
-        this.maxWater = 2000; // Maximum water capacity in liters
-        this.currentWater = 0; // Will be set from server
-        this.waterElement = null;
-        this.waterInfoElement = null;
-        this.init();
+    constructor(container) {
+        this.container = container;
+        this.currentWater = parseFloat(container.getAttribute('data-water-level')) || 0;
+        this.etag = null;
+        this.pollTimer = null;
+        this.subscribe();
     }
 
-    init() {
-        this.createWaterBackground();
-        this.fetchCurrentWaterLevel();
-        
-        // Update water level every 5 seconds
-        setInterval(() => {
-            this.fetchCurrentWaterLevel();
-        }, 5000);
+    subscribe() {
+        // Server pushes the level whenever it changes
+        if (!window.EventSource) {
+            this.startPolling();
+            return;
+        }
+        const source = new EventSource('/api/water-level/stream');
+        source.addEventListener('level', (event) => {
+            const data = JSON.parse(event.data);
+            this.updateWaterLevel(data.water_level, true);
+        });
+        source.onerror = () => {
+            // EventSource retries on its own; if the server refused the
+            // stream (e.g. too many open), fall back to conditional polling
+            if (source.readyState === EventSource.CLOSED) {
+                this.startPolling();
+            }
+        };
     }
 
-    createWaterBackground() {
-        // Create water background container
-        const waterBg = document.createElement('div');
-        waterBg.className = 'water-background';
-        
-        // Create water level element
-        const waterLevel = document.createElement('div');
-        waterLevel.className = 'water-level';
-        waterLevel.innerHTML = `
-            <div class="water-wave"></div>
-            <div class="water-wave"></div>
-        `;
-        
-        waterBg.appendChild(waterLevel);
-        document.body.appendChild(waterBg);
-        
-        this.waterElement = waterLevel;
+    startPolling() {
+        if (this.pollTimer) return;
+        // Unchanged levels come back as an empty 304
+        this.pollTimer = setInterval(() => {
+            this.fetchCurrentWaterLevel();
+        }, 30000);
     }
 
     async fetchCurrentWaterLevel() {
         try {
-            const response = await fetch('/api/water-level');
+            const headers = this.etag ? { 'If-None-Match': this.etag } : {};
+            const response = await fetch('/api/water-level', { headers, cache: 'no-store' });
+            if (response.status === 304) {
+                return;
+            }
             if (response.ok) {
+                this.etag = response.headers.get('ETag');
                 const data = await response.json();
                 this.updateWaterLevel(data.water_level, false);
             }
@@ -57,7 +64,7 @@ class WaterSystem {
                     'Content-Type': 'application/json'
                 }
             });
-            
+
             if (response.ok) {
                 const data = await response.json();
                 this.updateWaterLevel(data.water_level, true);
@@ -70,12 +77,33 @@ class WaterSystem {
     }
 
     updateWaterLevel(newLevel, animate = true) {
+        // The page may already show this level (it renders it, and the chat
+        // page moves the waves itself after each reply)
+        const shown = parseFloat(this.container.getAttribute('data-water-level'));
         this.currentWater = newLevel;
-        const percentage = (newLevel / this.maxWater) * 100;
-        
-        // Update background water level
-        if (this.waterElement) {
-            this.waterElement.style.height = `${percentage}%`;
+        if (shown === newLevel) return;
+        this.container.setAttribute('data-water-level', newLevel);
+        document.querySelectorAll('[data-water-level-text]').forEach((element) => {
+            element.textContent = newLevel;
+        });
+
+        // The API reports the level as a percentage already
+        const percentage = Math.max(0, Math.min(100, newLevel));
+
+        // Same positioning as the page scripts: higher % = higher waves
+        const fullWaterTop = 100; // Where waves are at 100%
+        const emptyWaterTop = window.innerHeight - 150; // Where waves are at 0%
+        const top = fullWaterTop + ((100 - percentage) / 100) * (emptyWaterTop - fullWaterTop);
+
+        const waves = this.container.querySelector('.waves');
+        const oceanLayers = this.container.querySelector('.ocean-layers');
+        if (waves && oceanLayers) {
+            const transition = animate ? 'top 1.5s ease-in-out' : 'none';
+            waves.style.transition = transition;
+            oceanLayers.style.transition = transition;
+            waves.style.top = top + 'px';
+            const waveHeight = waves.getBoundingClientRect().height || 80;
+            oceanLayers.style.top = (top + waveHeight) + 'px';
         }
     }
 }
@@ -85,7 +113,10 @@ let waterSystem;
 
 // Initialize when page loads
 document.addEventListener('DOMContentLoaded', function() {
-    waterSystem = new WaterSystem();
+    const container = document.querySelector('.home-waves[data-water-level]');
+    if (container) {
+        waterSystem = new WaterSystem(container);
+    }
 });
 
 // Make depleteWater available globally for chatbot
@@ -94,4 +125,4 @@ window.depleteWater = function() {
         return waterSystem.depleteWater();
     }
     return null;
-};
\ No newline at end of file
+};
@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py builds its app at import time, so point it at a throwaway database first
+_db_dir = tempfile.mkdtemp(prefix="drain-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ.pop("OPENAI_API_KEY", None)
+os.environ.pop("DATABASE_REPLICA_URL", None)
+
+
+@pytest.fixture(scope="session")
+def drain():
+    import app as drain
+    import migrations
+
+    with drain.app.app_context():
+        migrations.run_migrations(drain.db.engine, drain.db.metadata, log=lambda message: None)
+    return drain
+
+
+@pytest.fixture
+def client(drain):
+    return drain.app.test_client()
@@ -0,0 +1,19 @@
+import pytest
+
+from chat_gateway import ChatGateway
+
+
+@pytest.mark.parametrize("threads", [4, 8, 16, 32])
+def test_default_limits_leave_half_the_pool(monkeypatch, threads):
+    monkeypatch.delenv("CHAT_MAX_IN_FLIGHT", raising=False)
+    monkeypatch.delenv("CHAT_MAX_QUEUE", raising=False)
+    gateway = ChatGateway.from_env(threads)
+    assert gateway.max_in_flight >= 1
+    assert gateway.max_in_flight + gateway.max_queue <= max(2, threads // 2)
+
+
+def test_configured_limits_are_capped(monkeypatch):
+    monkeypatch.setenv("CHAT_MAX_IN_FLIGHT", "8")
+    monkeypatch.setenv("CHAT_MAX_QUEUE", "16")
+    gateway = ChatGateway.from_env(16)
+    assert (gateway.max_in_flight, gateway.max_queue) == (7, 1)
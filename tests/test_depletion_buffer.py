@@ -0,0 +1,33 @@
+from depletion_buffer import WriteBehindBuffer
+
+
+def event(user_id, delta):
+    return {"user_id": user_id, "delta": delta, "action": {"user_id": user_id}}
+
+
+def make_buffer(flush_fn):
+    # No submit(), so no flusher thread: flushes only happen when the test calls them
+    buffer = WriteBehindBuffer(flush_fn)
+    for user_id, delta in [(1, -2), (2, -2), (1, -3), (3, -2)]:
+        buffer._events.append(event(user_id, delta))
+        buffer._projected.setdefault(user_id, [50, 0])[1] += 1
+    return buffer
+
+
+def test_flush_user_writes_only_that_users_events_in_order():
+    written = []
+    buffer = make_buffer(written.append)
+    assert buffer.flush_user(1)
+    assert [(e["user_id"], e["delta"]) for e in written[0]] == [(1, -2), (1, -3)]
+    assert buffer.pending(1) == 0
+    assert [e["user_id"] for e in buffer._events] == [2, 3]
+
+
+def test_failed_flush_user_keeps_the_events_queued():
+    def fail(batch):
+        raise RuntimeError("database is locked")
+
+    buffer = make_buffer(fail)
+    assert not buffer.flush_user(1)
+    assert buffer.pending(1) == 2
+    assert [(e["user_id"], e["delta"]) for e in buffer._events] == [(1, -2), (1, -3), (2, -2), (3, -2)]
@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+from knowledge_index import KnowledgeIndex, load_snippets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def index():
+    return KnowledgeIndex(lambda: load_snippets(ROOT))
+
+
+@pytest.mark.parametrize("question", [
+    "What is 2+2?",
+    "What is 12 times 40?",
+    "chat",
+    "gpt",
+    "donate",
+    "Write a haiku about rivers",
+    "What's the capital of France?",
+])
+def test_off_topic_questions_go_to_the_model(index, question):
+    reply, _ = index.answer(question)
+    assert reply is None
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("How much water does AI use?", "519 mL"),
+    ("how much water does AI use per 100 words?", "519 mL"),
+    ("How much water does a short shower save?", "Short Shower saves"),
+])
+def test_site_facts_are_answered_locally(index, question, expected):
+    reply, _ = index.answer(question)
+    assert reply is not None and expected in reply
@@ -0,0 +1,32 @@
+import os
+
+from flask import template_rendered
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+
+
+def test_every_template_renders(drain, client):
+    rendered = set()
+
+    def record(sender, template, context, **extra):
+        rendered.add(template.name)
+
+    template_rendered.connect(record, drain.app)
+    try:
+        # Anonymous pages, including the login form's error paths
+        for path in ["/", "/login"]:
+            assert client.get(path).status_code == 200, path
+        assert client.post("/login", data={}).status_code == 200
+        assert client.post("/login", data={"username": "nobody", "password": "wrong"}).status_code == 200
+
+        response = client.post("/signup", data={"fullname": "Template Check", "email": "templates@example.com",
+                                                "username": "templates", "password": "secret"})
+        assert response.status_code == 302
+        assert client.post("/login", data={"username": "templates", "password": "secret"}).status_code == 302
+        for path in ["/home", "/refill", "/deplete", "/progress", "/learn_more"]:
+            assert client.get(path).status_code == 200, path
+    finally:
+        template_rendered.disconnect(record, drain.app)
+
+    templates = {name for name in os.listdir(TEMPLATE_DIR) if name.endswith(".html")}
+    assert templates <= rendered, f"never rendered: {sorted(templates - rendered)}"
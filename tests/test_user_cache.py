@@ -0,0 +1,29 @@
+from user_cache import UserSnapshot, UserSnapshotCache
+
+
+def make_cache(cacheable):
+    loads = []
+
+    def loader(user_id):
+        loads.append(user_id)
+        return UserSnapshot(user_id, "name", "Full Name", "user@example.com", 50 + len(loads))
+
+    return UserSnapshotCache(loader, ttl=60, cacheable=cacheable), loads
+
+
+def test_primary_reads_are_kept_for_the_process():
+    cache, loads = make_cache(lambda: True)
+    cache.get(1)
+    cache.get(1)
+    assert loads == [1]
+
+
+def test_replica_reads_are_not_kept_past_the_request():
+    replica = [True]
+    cache, loads = make_cache(lambda: not replica[0])
+    assert cache.get(1).water_level == 51
+    # A later primary read loads the row again instead of serving the replica's copy
+    replica[0] = False
+    assert cache.get(1).water_level == 52
+    assert cache.get(1).water_level == 52
+    assert loads == [1, 1]
@@ -0,0 +1,181 @@
+"""Snapshot cache for the handful of user fields page routes read.
+
+Two layers sit in front of the users table:
+
+* per request: the first lookup of a user is memoized on ``flask.g``;
+* per process (optional, USER_CACHE_TTL > 0): a TTL-bounded LRU shared
+  by the worker's threads, dropped for a user whenever their row is
+  written (after the commit, so readers never re-cache the old row).
+  Loads the cacheable() hook rejects (reads from a lagging replica) are
+  only memoized for the request.
+
+Invalidation in one process can't reach other gunicorn workers, so
+without strict mode an entry may be up to USER_CACHE_TTL seconds stale
+there. Strict mode (USER_CACHE_STRICT=1) stores a version counter next to
+each entry and checks it on every read. The counters live in Redis
+(USER_CACHE_URL, or CHAT_CACHE_URL), so every worker sees every write;
+per-process counters would be no stricter than the TTL, so strict mode
+refuses to start without one.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import g, has_app_context
+
+UserSnapshot = namedtuple("UserSnapshot", "id username fullname email water_level")
+
+
+class LocalVersions:
+    """Per-user write counters for a single process"""
+
+    def __init__(self):
+        self._versions = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            return (self._epoch, self._versions.get(user_id, 0))
+
+    def bump(self, user_id):
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def bump_all(self):
+        with self._lock:
+            self._epoch += 1
+            self._versions.clear()
+
+
+class RedisVersions:
+    """Per-user write counters shared by every worker"""
+
+    def __init__(self, url, prefix="drain:userver:"):
+        import redis  # optional dependency, only needed for strict multi-worker mode
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, user_id):
+        epoch, version = self._redis.mget(self.prefix + "epoch", f"{self.prefix}{user_id}")
+        return (int(epoch or 0), int(version or 0))
+
+    def bump(self, user_id):
+        self._redis.incr(f"{self.prefix}{user_id}")
+
+    def bump_all(self):
+        self._redis.incr(self.prefix + "epoch")
+
+
+class UserSnapshotCache:
+    def __init__(self, loader, ttl=0.0, max_entries=10000, strict=False, versions=None, cacheable=None):
+        self.loader = loader  # loader(user_id) -> UserSnapshot or None
+        self.cacheable = cacheable  # cacheable() -> False if this load must not be kept past the request
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.strict = strict
+        self.versions = versions or LocalVersions()
+        self._entries = OrderedDict()  # user_id -> (snapshot, expires_at, version)
+        self._lock = threading.Lock()
+        self.request_hits = 0
+        self.process_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls, loader, cacheable=None):
+        strict = os.environ.get("USER_CACHE_STRICT", "").lower() in ("1", "true", "yes")
+        url = os.environ.get("USER_CACHE_URL") or os.environ.get("CHAT_CACHE_URL")
+        if strict and not url:
+            raise RuntimeError("USER_CACHE_STRICT=1 needs a shared counter store: set USER_CACHE_URL "
+                               "(or CHAT_CACHE_URL) to a Redis URL, or turn strict mode off")
+        return cls(
+            loader,
+            ttl=float(os.environ.get("USER_CACHE_TTL", 0)),
+            max_entries=int(os.environ.get("USER_CACHE_SIZE", 10000)),
+            strict=strict,
+            versions=RedisVersions(url) if strict else None,
+            cacheable=cacheable,
+        )
+
+    def _memo(self):
+        if not has_app_context():
+            return None
+        if "user_snapshots" not in g:
+            g.user_snapshots = {}
+        return g.user_snapshots
+
+    def get(self, user_id):
+        memo = self._memo()
+        if memo is not None and user_id in memo:
+            with self._lock:
+                self.request_hits += 1
+            return memo[user_id]
+
+        snapshot = None
+        version = self.versions.get(user_id) if self.strict else None
+        if self.ttl > 0:
+            with self._lock:
+                entry = self._entries.get(user_id)
+                if entry is not None:
+                    cached, expires_at, cached_version = entry
+                    if expires_at > time.monotonic() and (not self.strict or cached_version == version):
+                        self._entries.move_to_end(user_id)
+                        self.process_hits += 1
+                        snapshot = cached
+                    else:
+                        del self._entries[user_id]
+
+        if snapshot is None:
+            with self._lock:
+                self.misses += 1
+            keep = self.ttl > 0 and (self.cacheable is None or self.cacheable())
+            snapshot = self.loader(user_id)
+            if snapshot is not None and keep:
+                with self._lock:
+                    self._entries[user_id] = (snapshot, time.monotonic() + self.ttl, version)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+
+        if memo is not None:
+            memo[user_id] = snapshot
+        return snapshot
+
+    def forget(self, user_id):
+        """Drop the current request's memo so a later read sees this request's writes"""
+        memo = self._memo()
+        if memo is not None:
+            memo.pop(user_id, None)
+
+    def invalidate(self, user_ids):
+        """Call after a commit that changed these users' rows"""
+        for user_id in user_ids:
+            self.versions.bump(user_id)
+            with self._lock:
+                self._entries.pop(user_id, None)
+                self.invalidations += 1
+            self.forget(user_id)
+
+    def invalidate_all(self):
+        self.versions.bump_all()
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+        memo = self._memo()
+        if memo is not None:
+            memo.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.request_hits + self.process_hits + self.misses
+            return {
+                "request_hits": self.request_hits,
+                "process_hits": self.process_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.request_hits + self.process_hits) / lookups, 3) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "ttl": self.ttl,
+                "strict": self.strict,
+            }